@@ -0,0 +1,609 @@
+"""
+LTX-2 Async Client
+Runpod Serverless / Pods API 共通の asyncio クライアント
+
+- 1つの aiohttp セッション（コネクションプール）を使い回す
+- submit() / submit_many() は Job ハンドルを返す
+- as_completed() / gather() で複数ジョブをまとめて待つ
+  （ポーリング1回ごとに全ジョブのステータスを並行取得）
+- ポーリング間隔は poll_min から poll_max まで指数的に伸ばす（ジッター付き）
+- download() は動画をチャンク単位でファイルに書き、Range で途中から再開、
+  サイズ / sha256 を検証してから rename する（メモリ使用量は動画サイズに依存しない）
+- Webhook 受信器 (webhook_receiver.py) を接続すると完了通知で即座に起きる。
+  その間のポーリングは取りこぼし用のフォールバック（fallback_poll 間隔）のみ
+
+既存の同期スクリプト向けに run_sync() / shared_client() を用意しており、
+バックグラウンドのイベントループ上で同じセッションを共有する。
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+
+# 正規化したジョブ状態
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+TERMINAL_STATES = (COMPLETED, FAILED)
+
+DOWNLOAD_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: str, chunk_size: int = DOWNLOAD_CHUNK) -> str:
+    """ファイルの sha256（チャンク読み）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobFailed(Exception):
+    """ジョブが失敗した"""
+
+    def __init__(self, job_id: str, error: str, data: Optional[Dict] = None):
+        super().__init__(f"Job failed: {error}")
+        self.job_id = job_id
+        self.error = error
+        self.data = data or {}
+
+
+class ServerlessBackend:
+    """Runpod Serverless エンドポイント (/run, /status/{id})"""
+
+    STATES = {
+        "IN_QUEUE": QUEUED,
+        "IN_PROGRESS": RUNNING,
+        "COMPLETED": COMPLETED,
+        "FAILED": FAILED,
+        "CANCELLED": FAILED,
+        "TIMED_OUT": FAILED,
+    }
+
+    def __init__(self, endpoint: str, api_key: str):
+        self.endpoint = endpoint.rstrip("/")
+        self.api_key = api_key
+
+    @property
+    def headers(self) -> Dict:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def submit_request(self, payload: Dict, webhook: Optional[str] = None):
+        body = {"input": payload}
+        if webhook:
+            body["webhook"] = webhook
+        return f"{self.endpoint}/run", body
+
+    def parse_submit(self, data: Dict) -> str:
+        return data["id"]
+
+    def status_url(self, job_id: str) -> str:
+        return f"{self.endpoint}/status/{job_id}"
+
+    def parse_status(self, data: Dict) -> str:
+        return self.STATES.get(data.get("status"), RUNNING)
+
+    def health_url(self) -> str:
+        return f"{self.endpoint}/health"
+
+    def cancel_url(self, job_id: str) -> str:
+        return f"{self.endpoint}/cancel/{job_id}"
+
+
+class PodBackend:
+    """Pods 上の server.py (/generate, /status/{id}, /download/{id})"""
+
+    STATES = {
+        "pending": QUEUED,
+        "processing": RUNNING,
+        "completed": COMPLETED,
+        "failed": FAILED,
+    }
+
+    def __init__(self, server_url: str):
+        self.server_url = server_url.rstrip("/")
+
+    @property
+    def headers(self) -> Dict:
+        return {}
+
+    def submit_request(self, payload: Dict, webhook: Optional[str] = None):
+        if webhook:
+            payload = {**payload, "callback_url": webhook}
+        return f"{self.server_url}/generate", payload
+
+    def parse_submit(self, data: Dict) -> str:
+        return data["job_id"]
+
+    def status_url(self, job_id: str) -> str:
+        return f"{self.server_url}/status/{job_id}"
+
+    def parse_status(self, data: Dict) -> str:
+        return self.STATES.get(data.get("status"), RUNNING)
+
+    def health_url(self) -> str:
+        return f"{self.server_url}/health"
+
+    def cancel_url(self, job_id: str) -> str:
+        return f"{self.server_url}/cancel/{job_id}"
+
+    def download_url(self, job_id: str) -> str:
+        return f"{self.server_url}/download/{job_id}"
+
+
+class Job:
+    """投入済みジョブのハンドル"""
+
+    def __init__(self, client: "AsyncLTXClient", job_id: str, payload: Optional[Dict] = None):
+        self.client = client
+        self.id = job_id
+        self.payload = payload or {}
+        self.state = QUEUED
+        self.data: Dict = {}
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.pushed = False  # Webhook で状態が届いて未通知
+        self.timed_out = False  # job_timeout を過ぎて待つのをやめた（ジョブ自体は動いているかもしれない）
+        self.error: Optional[Exception] = None  # ステータス取得が続けて失敗して待つのをやめた（最後のエラー）
+
+    def __repr__(self):
+        return f"Job({self.id!r}, state={self.state!r})"
+
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.submitted_at
+
+    def apply(self, data: Dict):
+        """ステータス応答（ポーリング / Webhook）を反映"""
+        self.data = data
+        self.state = self.client.backend.parse_status(data)
+        if self.done() and self.finished_at is None:
+            self.finished_at = time.time()
+
+    async def refresh(self) -> Dict:
+        """ステータスを1回取得して状態を更新"""
+        self.apply(await self.client.status(self.id))
+        return self.data
+
+    def result(self) -> Dict:
+        """完了済みジョブの結果（失敗なら JobFailed、待ち切れなかったら TimeoutError / ステータス取得のエラー）"""
+        if self.error is not None and not self.done():
+            raise self.error
+        if self.timed_out and not self.done():
+            raise TimeoutError(f"Job {self.id} not finished {self.elapsed:.0f}s after submit")
+        if self.state == FAILED:
+            raise JobFailed(self.id, str(self.data.get("error", "Unknown error")), self.data)
+        if self.state != COMPLETED:
+            raise RuntimeError(f"Job {self.id} is not finished ({self.state})")
+        return self.data
+
+    async def wait(self, timeout: Optional[float] = None) -> Dict:
+        """完了まで待って結果を返す"""
+        async for _ in self.client.as_completed([self], timeout=timeout):
+            pass
+        return self.result()
+
+
+class AsyncLTXClient:
+    """プール済みセッションを持つ非同期クライアント"""
+
+    def __init__(
+        self,
+        backend,
+        max_connections: int = 16,
+        poll_min: float = 1.0,
+        poll_max: float = 15.0,
+        poll_factor: float = 1.5,
+        request_timeout: float = 30,
+        max_status_errors: int = 5,
+        fallback_poll: float = 60.0,
+    ):
+        self.backend = backend
+        self.max_connections = max_connections
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.poll_factor = poll_factor
+        self.request_timeout = request_timeout
+        self.max_status_errors = max_status_errors
+        self.fallback_poll = fallback_poll
+        self.receiver = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._jobs = weakref.WeakValueDictionary()
+        self._early: Dict[str, Dict] = {}
+        self._waiters = set()
+
+    async def __aenter__(self):
+        await self.session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                headers=self.backend.headers,
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def request_json(self, method: str, url: str, **kwargs) -> Dict:
+        session = await self.session()
+        async with session.request(method, url, **kwargs) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    # --- 投入 ---
+
+    async def submit(self, payload: Dict, webhook: Optional[str] = None) -> Job:
+        """
+        ジョブを1件投入
+
+        webhook 省略時、受信器が接続されていればそのURLを完了通知先にする
+        """
+        if webhook is None and self.receiver is not None:
+            webhook = self.receiver.callback_url
+        url, body = self.backend.submit_request(payload, webhook)
+        data = await self.request_json("POST", url, json=body)
+        job = self._register(Job(self, self.backend.parse_submit(data), payload))
+        job.data = data
+        self._apply_early(job)
+        return job
+
+    async def submit_many(self, payloads: Iterable[Dict], return_exceptions: bool = False) -> List:
+        """
+        複数ジョブを並行投入（順序は入力と同じ）
+
+        return_exceptions=True なら失敗した投入はその位置に例外を返す
+        （1件の失敗で他の投入済みジョブを見失わない）
+        """
+        return list(await asyncio.gather(*(self.submit(p) for p in payloads), return_exceptions=return_exceptions))
+
+    def job(self, job_id: str) -> Job:
+        """既存のジョブIDのハンドル（登録済みならそれを返す）"""
+        job = self._jobs.get(job_id) or self._register(Job(self, job_id))
+        self._apply_early(job)
+        return job
+
+    def _register(self, job: Job) -> Job:
+        self._jobs[job.id] = job
+        return job
+
+    def _apply_early(self, job: Job):
+        # 投入レスポンスより先に Webhook が届いていた場合
+        data = self._early.pop(job.id, None)
+        if data is not None:
+            job.apply(data)
+            job.pushed = True
+
+    # --- Webhook ---
+
+    def attach_receiver(self, receiver):
+        """Webhook 受信器を接続（以降の submit は完了通知を要求する）"""
+        self.receiver = receiver
+        receiver.clients.append(self)
+
+    def deliver(self, job_id: str, data: Dict) -> bool:
+        """
+        Webhook で届いたステータスを反映して待機中の updates() を起こす
+
+        Returns:
+            このクライアントのジョブだったか
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            self._early[job_id] = data
+            if len(self._early) > 1000:
+                self._early.pop(next(iter(self._early)))
+            return False
+        job.apply(data)
+        job.pushed = True
+        for event in self._waiters:
+            event.set()
+        return True
+
+    async def _wait_push(self, event: asyncio.Event, timeout: float) -> bool:
+        """Webhook が届くか timeout 秒経つまで待つ（届いたら True）"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            event.clear()
+
+    # --- ステータス ---
+
+    async def status(self, job_id: str) -> Dict:
+        return await self.request_json("GET", self.backend.status_url(job_id))
+
+    async def cancel(self, job_id: str) -> Dict:
+        """ジョブを取り消す（プレビューを見て不要になったときなど）"""
+        return await self.request_json("POST", self.backend.cancel_url(job_id))
+
+    async def health(self) -> Dict:
+        return await self.request_json("GET", self.backend.health_url(), timeout=aiohttp.ClientTimeout(total=10))
+
+    async def get_bytes(self, url: str, timeout: float = 600) -> bytes:
+        session = await self.session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+    async def download(
+        self,
+        url: str,
+        output_path: str,
+        expected_size: Optional[int] = None,
+        expected_sha256: Optional[str] = None,
+        retries: int = 3,
+        chunk_size: int = DOWNLOAD_CHUNK,
+    ) -> Dict:
+        """
+        ファイルへストリーミングダウンロード
+
+        output_path + ".{key}.part" に書き、切断時は Range で続きから再開する。
+        key は expected_sha256（なければ URL）のハッシュで、別のジョブ / URL の書きかけを続きに使わない。
+        サイズ / sha256 を検証してから output_path へ atomic に rename。
+        既存の .part から再開したのに検証に失敗した場合は、.part を消して最初から1回だけ取り直す。
+
+        Returns:
+            Dict with path, size, sha256, resumed (再開した回数)
+        """
+        key = (expected_sha256 or hashlib.sha256(url.encode("utf-8")).hexdigest())[:16]
+        part = f"{output_path}.{key}.part"
+        resumed = 0
+        for restart in (False, True):
+            reused = os.path.exists(part)
+            for attempt in range(retries + 1):
+                try:
+                    if await self._download_part(url, part, expected_size, expected_sha256, chunk_size):
+                        resumed += 1
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == retries:
+                        raise
+                    print(f"Download interrupted ({e}), resuming from {os.path.getsize(part) if os.path.exists(part) else 0} bytes...")
+                    await asyncio.sleep(2 ** attempt)
+
+            size = os.path.getsize(part)
+            sha256 = await asyncio.to_thread(file_sha256, part)
+            error = None
+            if expected_size is not None and size != expected_size:
+                error = f"Size mismatch for {url}: {size} != {expected_size}"
+            elif expected_sha256 and sha256 != expected_sha256:
+                error = f"sha256 mismatch for {url}: {sha256} != {expected_sha256}"
+            if error is None:
+                break
+            os.remove(part)
+            if restart or not (reused or resumed):
+                raise ValueError(error)
+            print(f"{error} after resuming a partial download, restarting from 0 bytes...")
+
+        os.replace(part, output_path)
+        return {"path": output_path, "size": size, "sha256": sha256, "resumed": resumed}
+
+    async def _download_part(
+        self, url: str, part: str, expected_size: Optional[int], expected_sha256: Optional[str], chunk_size: int,
+    ) -> bool:
+        """.part に続きを書く（Range で再開した場合 True）"""
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if expected_size is not None and offset == expected_size:
+            return False
+        if expected_size is not None and offset > expected_size:
+            os.remove(part)  # 別の内容の書きかけ
+            offset = 0
+
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if expected_sha256:
+                # server.py の ETag は sha256。内容が変わっていれば 200 で全体が返る
+                headers["If-Range"] = f'"{expected_sha256}"'
+        session = await self.session()
+        # 全体の制限時間ではなく、読み取りが止まった時だけタイムアウト
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+        async with session.get(url, headers=headers, timeout=timeout) as resp:
+            if resp.status == 416 and offset:
+                return False  # 既に最後まで取得済み（検証は呼び出し側）
+            resp.raise_for_status()
+            resumed = resp.status == 206
+            with open(part, "ab" if resumed else "wb") as f:
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+        return resumed
+
+    # --- 待機 ---
+
+    def _next_interval(self, interval: float) -> float:
+        return min(self.poll_max, interval * self.poll_factor)
+
+    async def updates(
+        self, jobs: Iterable[Job], timeout: Optional[float] = None, job_timeout: Optional[float] = None,
+    ) -> AsyncIterator[Job]:
+        """
+        ポーリングのたびに各ジョブを返す（進捗表示用、完了したジョブは最後に1回）
+
+        ポーリング1回ごとに未完了ジョブ全部のステータスを並行取得し、
+        状態が変わらない間は間隔を poll_max まで伸ばす。
+        受信器が接続されている場合は Webhook で起き、
+        ポーリングは fallback_poll 間隔の取りこぼし確認だけになる。
+
+        timeout: 全体の期限（過ぎたら TimeoutError）
+        job_timeout: ジョブごとの期限（投入時刻から）。過ぎたジョブは timed_out=True で最後に1回返す
+
+        ステータス取得が max_status_errors 回続けて失敗したジョブは error に最後のエラーを入れて
+        1回返し、残りのジョブは待ち続ける（1件のせいで全体を止めない）
+        """
+        pending = [j for j in jobs]
+        deadline = time.time() + timeout if timeout else None
+
+        def next_deadline():
+            deadlines = [j.submitted_at + job_timeout for j in pending] if job_timeout else []
+            if deadline:
+                deadlines.append(deadline)
+            return min(deadlines) if deadlines else None
+
+        interval = self.poll_min
+        errors = {}
+        event = asyncio.Event()
+        self._waiters.add(event)
+
+        try:
+            for job in [j for j in pending if j.done()]:
+                pending.remove(job)
+                job.pushed = False
+                yield job
+
+            poll = True
+            while pending:
+                before = {j.id: j.state for j in pending}
+                polled = [j for j in pending if poll and not j.pushed]
+                results = await asyncio.gather(*(j.refresh() for j in polled), return_exceptions=True)
+                results = dict(zip([j.id for j in polled], results))
+
+                changed = False
+                for job in list(pending):
+                    result = results.get(job.id)
+                    if isinstance(result, Exception):
+                        # 一時的な通信エラーは次のポーリングで再試行（連続したら諦める）
+                        errors[job.id] = errors.get(job.id, 0) + 1
+                        if errors[job.id] >= self.max_status_errors:
+                            pending.remove(job)
+                            job.error = result
+                            yield job
+                        continue
+                    if job.id not in results and not job.pushed:
+                        continue
+                    errors.pop(job.id, None)
+                    if job.pushed or job.state != before[job.id]:
+                        changed = True
+                    job.pushed = False
+                    if job.done():
+                        pending.remove(job)
+                    yield job
+
+                if job_timeout:
+                    for job in [j for j in pending if time.time() >= j.submitted_at + job_timeout]:
+                        pending.remove(job)
+                        job.timed_out = True
+                        yield job
+
+                if not pending:
+                    break
+                if deadline and time.time() >= deadline:
+                    raise TimeoutError(f"{len(pending)} job(s) not finished after {timeout}s: {[j.id for j in pending]}")
+
+                if self.receiver is not None:
+                    interval = self.fallback_poll
+                else:
+                    interval = self.poll_min if changed else self._next_interval(interval)
+                if poll:
+                    sleep = interval * random.uniform(0.9, 1.1)
+                    wake = next_deadline()
+                    if wake:
+                        sleep = min(sleep, max(0.0, wake - time.time()))
+                    next_poll = time.time() + sleep
+                # 他のジョブ宛ての Webhook で起きた場合は残り時間だけ待ち直す
+                poll = not await self._wait_push(event, max(0.0, next_poll - time.time()))
+        finally:
+            self._waiters.discard(event)
+
+    async def as_completed(
+        self, jobs: Iterable[Job], timeout: Optional[float] = None, job_timeout: Optional[float] = None,
+    ) -> AsyncIterator[Job]:
+        """完了した順にジョブを返す（job_timeout を過ぎたジョブ・ステータスが取れなくなったジョブも返す）"""
+        async for job in self.updates(jobs, timeout=timeout, job_timeout=job_timeout):
+            if job.done() or job.timed_out or job.error is not None:
+                yield job
+
+    async def gather(self, jobs: List[Job], timeout: Optional[float] = None, return_exceptions: bool = False) -> List:
+        """全ジョブの完了を待ち、入力順に結果を返す"""
+        async for _ in self.as_completed(jobs, timeout=timeout):
+            pass
+        results = []
+        for job in jobs:
+            try:
+                results.append(job.result())
+            except Exception as e:
+                # JobFailed / ステータスが取れなくなったジョブ
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+
+# --- 同期ラッパー用のバックグラウンドループ ---
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_clients: Dict[tuple, AsyncLTXClient] = {}
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ltx-async-client", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro):
+    """コルーチンを共有バックグラウンドループで実行して結果を返す"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def iterate_sync(async_iter: AsyncIterator):
+    """非同期イテレータを同期ジェネレータとして回す"""
+    loop = _background_loop()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(async_iter.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+def shared_client(backend_key: tuple, factory: Callable[[], AsyncLTXClient]) -> AsyncLTXClient:
+    """
+    同期ラッパー用の共有クライアント
+
+    backend_key ごとに1つ作成し、セッション（接続プール）を使い回す。
+    """
+    with _loop_lock:
+        client = _clients.get(backend_key)
+        if client is None:
+            client = _clients[backend_key] = factory()
+        return client
+
+
+def serverless_client(endpoint: str, api_key: str, **kwargs) -> AsyncLTXClient:
+    """Runpod Serverless 用の共有クライアント"""
+    return shared_client(
+        ("serverless", endpoint, api_key, tuple(sorted(kwargs.items()))),
+        lambda: AsyncLTXClient(ServerlessBackend(endpoint, api_key), **kwargs),
+    )
+
+
+def pod_client(server_url: str, **kwargs) -> AsyncLTXClient:
+    """Pods API サーバー用の共有クライアント"""
+    return shared_client(
+        ("pod", server_url, tuple(sorted(kwargs.items()))),
+        lambda: AsyncLTXClient(PodBackend(server_url), **kwargs),
+    )
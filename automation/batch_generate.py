@@ -6,6 +6,8 @@ Uploads to FTP server for later posting
 import argparse
 import base64
 import os
+import sys
+import tempfile
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -14,19 +16,162 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from accounts import get_account, list_accounts, DEFAULT_ACCOUNT
-from config import DEFAULT_DURATION, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_STEPS
+from config import DEFAULT_DURATION, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_STEPS, HLS_ENABLED, PREVIEWS_ENABLED, QA_ENABLED, DEDUP_ENABLED
+from config import METRICS_PATH, PUSHGATEWAY_URL, DRAFT_FACTOR
 import grok_client
 import sheets_client
 import ltx_client
 import ftp_client
+import hls_packager
+import previews as previews_lib
+import drafts as drafts_lib
+import video_qa
+import video_index
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import metrics
 
-def batch_generate(account_id: str = None, count: int = 5):
+JOBS_TOTAL = metrics.REGISTRY.counter("ltx_batch_jobs_total", "Batch videos by outcome", ("outcome",))
+JOB_STARTS = metrics.REGISTRY.counter("ltx_job_starts_total", "Runpod jobs by cold (warm-up) or warm start", ("start",))
+STAGE_SECONDS = metrics.REGISTRY.histogram("ltx_stage_seconds", "Latency per stage", ("stage",))
+CACHE_REQUESTS = metrics.REGISTRY.counter("ltx_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+BYTES_UPLOADED = metrics.REGISTRY.counter("ltx_bytes_uploaded_total", "Bytes uploaded to FTP (mp4 only)")
+COST_DOLLARS = metrics.REGISTRY.counter("ltx_cost_dollars_total", "Estimated Runpod cost")
+
+
+def record_runpod_job(result: dict, start: str):
+    """Runpod のステータス結果から待ち時間 / 実行時間を記録"""
+    JOB_STARTS.inc(start=start)
+    STAGE_SECONDS.observe(result.get("delayTime", 0) / 1000, stage="queue_wait")
+    STAGE_SECONDS.observe(result.get("executionTime", 0) / 1000, stage="generation")
+
+
+def upload_outputs(video_bytes: bytes, filename: str, hls: bool = False, previews: bool = PREVIEWS_ENABLED) -> dict:
+    """
+    Upload the mp4 (and optionally its HLS package / review previews) to FTP
+
+    HLS and preview files share the FTP_PATH/<stem>/ directory. They are
+    optional: the mp4 is uploaded first, so failures there only print a
+    warning and the extra URLs are left out.
+
+    Returns:
+        Dict with url, plus hls_url / poster_url / preview_url / sprite_url
+    """
+    with STAGE_SECONDS.time(stage="upload"):
+        urls = {"url": ftp_client.upload_video(video_bytes, filename)}
+    BYTES_UPLOADED.inc(len(video_bytes))
+    if not (hls or previews):
+        return urls
+
+    stem = Path(filename).stem
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / filename
+        src.write_bytes(video_bytes)
+        pkg_dir = Path(tmp) / stem
+
+        package = None
+        if hls:
+            try:
+                package = hls_packager.build_ladder(str(src), str(pkg_dir))
+            except Exception as e:
+                print(f"      Warning: Could not package HLS: {e}")
+        review = None
+        if previews:
+            try:
+                review = previews_lib.make_previews(str(src), str(pkg_dir))
+            except Exception as e:
+                print(f"      Warning: Could not generate previews: {e}")
+        if not (package or review):
+            return urls
+        try:
+            base_url = ftp_client.upload_directory(str(pkg_dir), stem)
+        except Exception as e:
+            print(f"      Warning: Could not upload {stem}/: {e}")
+            return urls
+
+    if package:
+        urls["hls_url"] = f"{base_url}/{package['master']}"
+        urls["poster_url"] = f"{base_url}/{package['poster']}"
+        print(f"      HLS: {len(package['variants'])} renditions -> {urls['hls_url']}")
+    if review:
+        urls["poster_url"] = f"{base_url}/{review['poster']}"
+        urls["preview_url"] = f"{base_url}/{review['preview']}"
+        urls["sprite_url"] = f"{base_url}/{review['sprite']}"
+        print(f"      Previews: {review['bytes'] / 1024:.1f} KB -> {urls['preview_url']}")
+    return urls
+
+
+def quality_gate(video_bytes: bytes, prompt: str, row_id: str, job_id: str) -> tuple:
+    """
+    QA a generated video, regenerating with a new seed while it fails
+
+    Returns:
+        Tuple of (video_bytes or None if it still fails, extra cost of retries,
+        job_id of the video that is kept)
+    """
+    def regenerate(seed):
+        video, metadata = ltx_client.generate_video(
+            prompt=prompt,
+            duration=DEFAULT_DURATION,
+            width=DEFAULT_WIDTH,
+            height=DEFAULT_HEIGHT,
+            steps=DEFAULT_STEPS,
+            seed=seed,
+        )
+        sheets_client.mark_generating(row_id, metadata["job_id"])
+        return video, metadata["cost"], metadata["job_id"]
+
+    with STAGE_SECONDS.time(stage="qa"):
+        video_bytes, qa, extra_cost, retry_job_id = video_qa.qa_with_retry(video_bytes, regenerate, DEFAULT_DURATION)
+    job_id = retry_job_id or job_id
+    if not qa["passed"]:
+        print(f"      QA FAILED: {qa['reason']}")
+        sheets_client.mark_qa_failed(row_id, qa["reason"])
+        JOBS_TOTAL.inc(outcome="qa_failed")
+        return None, extra_cost, job_id
+
+    print(f"      QA passed (motion {qa['metrics']['motion_energy']})")
+    return video_bytes, extra_cost, job_id
+
+
+def dedup_check(index: "video_index.VideoIndex", video_bytes: bytes, row_id: str):
+    """
+    Fingerprint a video and reject it if it near-duplicates a past video
+
+    Returns:
+        Signature to add to the index after upload, or None if duplicate
+    """
+    with STAGE_SECONDS.time(stage="dedup"):
+        signature = video_index.fingerprint_bytes(video_bytes)
+        dup = index.find_duplicate(signature)
+    CACHE_REQUESTS.inc(cache="dedup", result="hit" if dup else "miss")
+    if dup:
+        reason = f"near-duplicate of {dup['id']} ({dup['account']}, distance {dup['distance']})"
+        print(f"      DUPLICATE: {reason}")
+        sheets_client.mark_qa_failed(row_id, reason)
+        JOBS_TOTAL.inc(outcome="duplicate")
+        return None
+    return signature
+
+
+def batch_generate(
+    account_id: str = None,
+    count: int = 5,
+    hls: bool = HLS_ENABLED,
+    previews: bool = PREVIEWS_ENABLED,
+    qa: bool = QA_ENABLED,
+    dedup: bool = DEDUP_ENABLED,
+    draft_factor: int = DRAFT_FACTOR,
+):
     """
     Batch generation flow:
     1. Generate N prompts with Grok (avoid past prompts)
+       With draft_factor K > 1: generate K x N prompts, render cheap drafts
+       (drafts.py) and keep the N best, each with its draft's seed
     2. Generate N videos with Runpod (parallel jobs)
-    3. Upload to FTP server
+       + QA pass (failed clips are regenerated or marked qa_failed)
+       + near-duplicate check against all past videos (any account)
+    3. Upload to FTP server (+ HLS ladder / review previews)
     4. Update Sheets
     """
 
@@ -44,7 +189,8 @@ def batch_generate(account_id: str = None, count: int = 5):
         os.environ["SHEET_NAME"] = account["sheet_name"]
 
     # --- Phase 1: Generate Prompts ---
-    print(f"[1/{3}] Generating {count} prompts with Grok...")
+    draft_factor = max(1, draft_factor)
+    print(f"[1/{3}] Generating {count * draft_factor} prompts with Grok...")
 
     # Get past prompts from Sheets
     past_prompts = []
@@ -56,15 +202,16 @@ def batch_generate(account_id: str = None, count: int = 5):
         print(f"  Warning: Could not fetch past prompts: {e}")
 
     try:
-        prompts = grok_client.generate_prompts(
-            count=count,
-            style=account.get("style", "cinematic"),
-            include_dialogue=True,
-            theme=account.get("theme"),
-            past_prompts=past_prompts,
-        )
+        with STAGE_SECONDS.time(stage="prompts"):
+            prompts = grok_client.generate_prompts(
+                count=count * draft_factor,
+                style=account.get("style", "cinematic"),
+                include_dialogue=True,
+                theme=account.get("theme"),
+                past_prompts=past_prompts,
+            )
 
-        if len(prompts) < count:
+        if len(prompts) < count * draft_factor:
             print(f"  Warning: Only got {len(prompts)} prompts")
 
         for i, p in enumerate(prompts, 1):
@@ -74,12 +221,43 @@ def batch_generate(account_id: str = None, count: int = 5):
         print(f"  ERROR: {e}")
         return {"status": "error", "phase": "prompts", "error": str(e)}
 
+    # --- Drafts: render all prompts cheaply and keep the best `count` ---
+    seeds = [None] * len(prompts)
+    scores = [None] * len(prompts)
+    draft_cost = 0
+    if draft_factor > 1:
+        print(f"\n  [Drafts] Rendering {len(prompts)} drafts, keeping the best {count}...")
+        try:
+            with STAGE_SECONDS.time(stage="drafts"):
+                drafts = drafts_lib.render_drafts(prompts, drafts_lib.load_scorer())
+        except Exception as e:
+            print(f"  ERROR: {e}")
+            return {"status": "error", "phase": "drafts", "error": str(e)}
+
+        draft_cost = sum(d["cost"] for d in drafts)
+        selected = drafts_lib.select(drafts, count)
+        for d in drafts:
+            mark = "*" if d in selected else " "
+            detail = d.get("error") or d["reason"] or f"motion {d['metrics']['motion_energy']}"
+            print(f"  {mark} {d['score']:.3f}  {d['prompt_data']['caption']}  ({detail})")
+        print(f"  [Drafts] {len(selected)} selected, cost ${draft_cost:.4f}")
+        JOBS_TOTAL.inc(len(drafts) - len(selected), outcome="draft_rejected")
+        if not selected:
+            return {"status": "error", "phase": "drafts", "error": "No draft passed QA"}
+
+        prompts = [d["prompt_data"] for d in selected]
+        seeds = [d["seed"] for d in selected]
+        scores = [d["score"] for d in selected]
+
     # --- Phase 2: Save to Sheets & Submit Jobs (warm-up strategy) ---
     print(f"\n[2/{3}] Submitting jobs to Runpod (warm-up strategy)...")
 
     jobs = []
     results = []
-    total_cost = 0
+    total_cost = draft_cost
+    index = video_index.VideoIndex() if dedup else None
+    if index is not None:
+        print(f"  Dedup index: {len(index)} past videos")
 
     # First, save all prompts to sheets and prepare job data
     job_data = []
@@ -88,7 +266,7 @@ def batch_generate(account_id: str = None, count: int = 5):
             sheets_client.add_prompts([prompt_data])
             rows = sheets_client.get_all_rows()
             row_id = rows[-1]["id"]
-            job_data.append({"row_id": row_id, "prompt_data": prompt_data})
+            job_data.append({"row_id": row_id, "prompt_data": prompt_data, "seed": seeds[i], "draft_score": scores[i]})
         except Exception as e:
             print(f"  [{i+1}] ERROR saving to sheets: {e}")
 
@@ -105,6 +283,7 @@ def batch_generate(account_id: str = None, count: int = 5):
             width=DEFAULT_WIDTH,
             height=DEFAULT_HEIGHT,
             steps=DEFAULT_STEPS,
+            seed=first["seed"],
         )
         sheets_client.mark_generating(first["row_id"], job_id)
         print(f"  [Warm-up] Job {job_id[:20]}... submitted")
@@ -112,6 +291,7 @@ def batch_generate(account_id: str = None, count: int = 5):
 
         # Wait for first job to complete
         result = ltx_client.wait_for_completion(job_id)
+        record_runpod_job(result, "cold")
         output = result.get("output", {})
         exec_time = result.get("executionTime", 0) / 1000
         cost = exec_time * 0.00106
@@ -120,12 +300,25 @@ def batch_generate(account_id: str = None, count: int = 5):
 
         # Process first video
         video_b64 = output.get("video_base64")
-        if video_b64:
-            video_bytes = base64.b64decode(video_b64)
+        video_bytes = base64.b64decode(video_b64) if video_b64 else None
+        if video_bytes and qa:
+            video_bytes, extra_cost, job_id = quality_gate(video_bytes, first["prompt_data"]["prompt"], first["row_id"], job_id)
+            total_cost += extra_cost
+            cost += extra_cost
+        signature = None
+        if video_bytes and index is not None:
+            signature = dedup_check(index, video_bytes, first["row_id"])
+            if signature is None:
+                video_bytes = None
+        if video_bytes:
             timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
             filename = f"{account_id}_{timestamp}_1.mp4"
-            video_url = ftp_client.upload_video(video_bytes, filename)
+            urls = upload_outputs(video_bytes, filename, hls, previews)
+            video_url = urls["url"]
             print(f"  [Warm-up] Uploaded: {filename}")
+            if signature is not None:
+                index.add(signature, filename, account_id, video_url)
+            JOBS_TOTAL.inc(outcome="uploaded")
             sheets_client.mark_generated(
                 first["row_id"],
                 video_url=video_url,
@@ -139,49 +332,71 @@ def batch_generate(account_id: str = None, count: int = 5):
                 "url": video_url,
                 "cost": cost,
                 "caption": first["prompt_data"]["caption"],
+                "draft_score": first["draft_score"],
+                **urls,
             })
     except Exception as e:
         print(f"  [Warm-up] ERROR: {e}")
         sheets_client.mark_error(first["row_id"], str(e))
+        JOBS_TOTAL.inc(outcome="error")
 
     # Step 2: Submit remaining jobs in parallel (worker is warm now)
     remaining = job_data[1:]
     if remaining:
         print(f"\n  [Parallel] Submitting {len(remaining)} jobs to warm worker...")
-        for i, data in enumerate(remaining):
-            try:
-                job_id = ltx_client.submit_job(
-                    prompt=data["prompt_data"]["prompt"],
-                    duration=DEFAULT_DURATION,
-                    width=DEFAULT_WIDTH,
-                    height=DEFAULT_HEIGHT,
-                    steps=DEFAULT_STEPS,
-                )
-                sheets_client.mark_generating(data["row_id"], job_id)
-                jobs.append({
-                    "job_id": job_id,
-                    "row_id": data["row_id"],
-                    "prompt_data": data["prompt_data"],
-                    "index": i + 2,  # 2, 3, 4, 5...
-                })
-                print(f"  [Parallel] Job {i+2}: {job_id[:20]}... submitted")
-            except Exception as e:
-                print(f"  [Parallel] Job {i+2} ERROR: {e}")
+        try:
+            job_ids = ltx_client.submit_many([
+                {
+                    "prompt": data["prompt_data"]["prompt"],
+                    "duration": DEFAULT_DURATION,
+                    "width": DEFAULT_WIDTH,
+                    "height": DEFAULT_HEIGHT,
+                    "steps": DEFAULT_STEPS,
+                    "seed": data["seed"],
+                }
+                for data in remaining
+            ])
+        except Exception as e:
+            print(f"  [Parallel] Submit ERROR: {e}")
+            for data in remaining:
+                sheets_client.mark_error(data["row_id"], f"Submit failed: {e}")
+            JOBS_TOTAL.inc(len(remaining), outcome="error")
+            job_ids = []
+
+        for i, (data, job_id) in enumerate(zip(remaining, job_ids)):
+            # Only the rows whose own submit failed are marked; the rest are still collected
+            if isinstance(job_id, Exception):
+                print(f"  [Parallel] Job {i+2}: submit ERROR: {job_id}")
+                sheets_client.mark_error(data["row_id"], f"Submit failed: {job_id}")
+                JOBS_TOTAL.inc(outcome="error")
+                continue
+            sheets_client.mark_generating(data["row_id"], job_id)
+            jobs.append({
+                "job_id": job_id,
+                "row_id": data["row_id"],
+                "prompt_data": data["prompt_data"],
+                "draft_score": data["draft_score"],
+                "index": i + 2,  # 2, 3, 4, 5...
+            })
+            print(f"  [Parallel] Job {i+2}: {job_id[:20]}... submitted")
 
     # --- Phase 3: Wait for remaining jobs & Upload ---
     if jobs:
-        print(f"\n[3/3] Waiting for {len(jobs)} remaining videos...")
+        print(f"\n[3/3] Waiting for {len(jobs)} remaining videos (in completion order)...")
+        jobs_by_id = {job["job_id"]: job for job in jobs}
 
-        for job in jobs:
-            job_id = job["job_id"]
+        for job_id, result, error in ltx_client.wait_many(list(jobs_by_id)):
+            job = jobs_by_id[job_id]
             row_id = job["row_id"]
             prompt_data = job["prompt_data"]
             idx = job["index"]
 
             try:
-                print(f"  [{idx}] Waiting for {job_id[:20]}...")
-                result = ltx_client.wait_for_completion(job_id)
+                print(f"  [{idx}] Finished {job_id[:20]}...")
+                if error:
+                    raise error
 
+                record_runpod_job(result, "warm")
                 output = result.get("output", {})
                 exec_time = result.get("executionTime", 0) / 1000
                 cost = exec_time * 0.00106
@@ -196,13 +411,31 @@ def batch_generate(account_id: str = None, count: int = 5):
 
                 video_bytes = base64.b64decode(video_b64)
 
+                # QA before spending FTP bandwidth
+                if qa:
+                    video_bytes, extra_cost, job_id = quality_gate(video_bytes, prompt_data["prompt"], row_id, job_id)
+                    total_cost += extra_cost
+                    cost += extra_cost
+                    if video_bytes is None:
+                        continue
+
+                signature = None
+                if index is not None:
+                    signature = dedup_check(index, video_bytes, row_id)
+                    if signature is None:
+                        continue
+
                 # Generate filename
                 timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
                 filename = f"{account_id}_{timestamp}_{idx}.mp4"
 
                 # Upload to FTP
-                video_url = ftp_client.upload_video(video_bytes, filename)
+                urls = upload_outputs(video_bytes, filename, hls, previews)
+                video_url = urls["url"]
                 print(f"      Uploaded: {filename}")
+                if signature is not None:
+                    index.add(signature, filename, account_id, video_url)
+                JOBS_TOTAL.inc(outcome="uploaded")
 
                 # Update sheets
                 sheets_client.mark_generated(
@@ -219,25 +452,34 @@ def batch_generate(account_id: str = None, count: int = 5):
                     "url": video_url,
                     "cost": cost,
                     "caption": prompt_data["caption"],
+                    "draft_score": job["draft_score"],
+                    **urls,
                 })
 
             except Exception as e:
                 print(f"      ERROR: {e}")
                 sheets_client.mark_error(row_id, str(e))
+                JOBS_TOTAL.inc(outcome="error")
 
     # --- Summary ---
     print(f"\n{'='*60}")
     print(f"BATCH COMPLETE")
     print(f"  Videos generated: {len(results)}/{len(job_data)}")
+    if draft_factor > 1:
+        print(f"  Drafts: {count * draft_factor} prompts, ${draft_cost:.4f}")
     print(f"  Total cost: ${total_cost:.4f}")
     print(f"{'='*60}\n")
 
+    COST_DOLLARS.inc(total_cost)
+    metrics.export("ltx_batch", path=METRICS_PATH, pushgateway=PUSHGATEWAY_URL, account=account_id)
+
     return {
         "status": "completed",
         "account": account_id,
         "videos_generated": len(results),
         "videos_requested": len(job_data),
         "total_cost": total_cost,
+        "draft_cost": draft_cost,
         "results": results,
     }
 
@@ -255,6 +497,40 @@ def main():
         default=5,
         help="Number of videos to generate (default: 5)",
     )
+    parser.add_argument(
+        "--hls",
+        action="store_true",
+        default=HLS_ENABLED,
+        help="Also upload an HLS ladder (360p/540p/original) and poster frame",
+    )
+    parser.add_argument(
+        "--no-previews",
+        dest="previews",
+        action="store_false",
+        default=PREVIEWS_ENABLED,
+        help="Skip poster / animated preview / sprite sheet generation",
+    )
+    parser.add_argument(
+        "--no-qa",
+        dest="qa",
+        action="store_false",
+        default=QA_ENABLED,
+        help="Skip the automatic video QA pass",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        dest="dedup",
+        action="store_false",
+        default=DEDUP_ENABLED,
+        help="Skip the near-duplicate check",
+    )
+    parser.add_argument(
+        "--drafts",
+        type=int,
+        default=DRAFT_FACTOR,
+        metavar="K",
+        help="Render cheap drafts for K x count prompts and fully render only the best count (default: 1 = off)",
+    )
     parser.add_argument(
         "--list-accounts",
         action="store_true",
@@ -270,7 +546,8 @@ def main():
             print(f"  - {acc_id}: {acc['name']}")
         return
 
-    result = batch_generate(args.account, args.count)
+    result = batch_generate(args.account, args.count, hls=args.hls, previews=args.previews, qa=args.qa, dedup=args.dedup,
+                            draft_factor=args.drafts)
 
     if result["status"] == "error":
         exit(1)
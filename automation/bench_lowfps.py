@@ -0,0 +1,79 @@
+"""
+Benchmark: GPU seconds per delivered second of video, full fps vs low-fps mode
+
+Runs the same prompt/seed through the serverless endpoint once per mode and
+compares Runpod executionTime (billed seconds) and the handler's own
+generation_seconds. Costs real GPU time - keep --runs small.
+"""
+
+import argparse
+import json
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import ltx_client
+from config import DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_STEPS
+
+PROMPT = (
+    "Medium shot of a golden retriever running through shallow waves on a beach at sunset, "
+    "water splashing, smooth tracking shot, warm golden light, ambient ocean sounds."
+)
+
+
+def run_mode(label: str, duration: float, seed: int, runs: int, internal_fps=None, interpolator=None) -> dict:
+    """Generate `runs` videos in one mode and aggregate timings"""
+    billed = []
+    for i in range(runs):
+        _, meta = ltx_client.generate_video(
+            prompt=PROMPT,
+            duration=duration,
+            width=DEFAULT_WIDTH,
+            height=DEFAULT_HEIGHT,
+            steps=DEFAULT_STEPS,
+            seed=seed + i,
+            internal_fps=internal_fps,
+            interpolator=interpolator,
+        )
+        billed.append(meta["execution_time"])
+        timings = {k: v for k, v in meta.items() if k.endswith("_seconds") or k == "gpu_seconds_saved"}
+        print(f"  [{label}] run {i + 1}: {meta['execution_time']:.1f}s billed {json.dumps(timings)}")
+
+    avg = sum(billed) / len(billed)
+    return {
+        "mode": label,
+        "avg_billed_seconds": round(avg, 1),
+        "gpu_seconds_per_delivered_second": round(avg / duration, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark low-fps generation + CPU interpolation")
+    parser.add_argument("--duration", type=float, default=10, help="Delivered duration (seconds)")
+    parser.add_argument("--internal-fps", type=int, default=12, help="Internal fps for low-fps mode")
+    parser.add_argument("--interpolator", default="minterpolate", help="minterpolate / blend / duplicate")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per mode")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # ウォームアップ（コールドスタートを計測から除外）
+    print("Warm-up...")
+    ltx_client.generate_video(PROMPT, duration=1, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, steps=8, internal_fps=None)
+
+    results = [
+        run_mode("24fps", args.duration, args.seed, args.runs, internal_fps=None),
+        run_mode(
+            f"{args.internal_fps}fps+{args.interpolator}", args.duration, args.seed, args.runs,
+            internal_fps=args.internal_fps, interpolator=args.interpolator,
+        ),
+    ]
+
+    print(f"\n{'mode':<28}{'billed s':>10}{'GPU s / delivered s':>22}")
+    for r in results:
+        print(f"{r['mode']:<28}{r['avg_billed_seconds']:>10}{r['gpu_seconds_per_delivered_second']:>22}")
+    speedup = results[0]["avg_billed_seconds"] / max(results[1]["avg_billed_seconds"], 0.1)
+    print(f"\nLow-fps mode: {speedup:.2f}x cheaper per delivered second")
+
+
+if __name__ == "__main__":
+    main()
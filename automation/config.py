@@ -30,11 +30,74 @@ FTP_PASSWORD = os.environ.get("FTP_PASSWORD", "")
 FTP_PATH = os.environ.get("FTP_PATH", "/buzz/anachronism")
 FTP_BASE_URL = os.environ.get("FTP_BASE_URL", "http://okibai.heavy.jp")
 
+# HLS packaging (optional, uploaded next to the mp4)
+HLS_ENABLED = os.environ.get("HLS_ENABLED", "").lower() in ("1", "true", "yes")
+# Short-side heights of the ladder; 0 = original resolution (near-lossless re-encode so its GOP matches)
+HLS_RENDITIONS = [int(h) for h in os.environ.get("HLS_RENDITIONS", "360,540,0").split(",") if h.strip()]
+HLS_SEGMENT_SECONDS = 2
+
+# Review previews (poster / animated preview / sprite sheet)
+PREVIEWS_ENABLED = os.environ.get("PREVIEWS_ENABLED", "1").lower() in ("1", "true", "yes")
+PREVIEW_FORMAT = os.environ.get("PREVIEW_FORMAT", "webp")  # webp or gif
+PREVIEW_HEIGHT = 160
+PREVIEW_FPS = 6
+SPRITE_TILES = 12
+SPRITE_COLUMNS = 4
+SPRITE_TILE_WIDTH = 120
+
 # Video generation defaults
 DEFAULT_DURATION = 15  # seconds (TikTok optimal: 15s)
 DEFAULT_WIDTH = 576
 DEFAULT_HEIGHT = 1024
 DEFAULT_STEPS = 20
+# Low-fps mode: generate at this fps and interpolate to 24fps on CPU (empty = off)
+DEFAULT_INTERNAL_FPS = int(os.environ["INTERNAL_FPS"]) if os.environ.get("INTERNAL_FPS") else None
+
+# Video QA (before FTP / Later upload)
+QA_ENABLED = os.environ.get("QA_ENABLED", "1").lower() in ("1", "true", "yes")
+QA_MAX_RETRIES = int(os.environ.get("QA_MAX_RETRIES", "1"))  # regenerate with a new seed
+QA_SAMPLE_FPS = 4
+QA_SAMPLE_WIDTH = 96
+QA_MIN_LUMA = 16             # mean luminance below this = dark frame (0-255)
+QA_MIN_MOTION = 0.5          # mean inter-frame abs diff below this = near-static
+QA_FROZEN_DIFF = 0.3         # inter-frame diff below this = frozen frame
+QA_FROZEN_MAX_SECONDS = 3.0  # longest allowed frozen segment
+QA_MAX_NOISE = 40.0          # spatial high-frequency energy above this = garbled
+QA_MIN_DURATION_RATIO = 0.8  # actual / requested duration
+
+# Draft-and-select (batch_generate.py --drafts K): render K x count cheap drafts,
+# score them and give only the best `count` the full render (same seed)
+DRAFT_FACTOR = int(os.environ.get("DRAFT_FACTOR", "1"))  # 1 = off
+DRAFT_DURATION = 4   # seconds
+DRAFT_WIDTH = 320    # rendered as-is (exact_shape), not snapped up to a 576x1024 bucket
+DRAFT_HEIGHT = 576
+DRAFT_STEPS = 8
+DRAFT_MOTION_CAP = 8.0  # motion energy above this stops adding to the score
+DRAFT_SCORER = os.environ.get("DRAFT_SCORER", "")  # optional "module:function" hook
+
+# Near-duplicate blocking (perceptual-hash index shared by all accounts)
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "1").lower() in ("1", "true", "yes")
+VIDEO_INDEX_PATH = os.environ.get(
+    "VIDEO_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "video_index.jsonl")
+)
+DEDUP_FRAMES = 16            # frame hashes per video
+DEDUP_MAX_DISTANCE = 8       # clip hash Hamming distance (bits of 64)
+DEDUP_FRAME_DISTANCE = 10.0  # mean closest frame-hash distance
+
+# Long-form video (chained I2V segments)
+LONG_VIDEO_SEGMENT_DURATION = 10  # seconds per segment (longer single jobs OOM)
+LONG_VIDEO_SEGMENT_RETRIES = 2
+LONG_VIDEO_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", "segments")
+
+# Local output retention (automation/output, long-video segment cache excluded)
+OUTPUT_RETENTION_GB = float(os.environ.get("OUTPUT_RETENTION_GB", "20"))
+OUTPUT_RETENTION_DAYS = float(os.environ.get("OUTPUT_RETENTION_DAYS", "30"))
+
+# Run metrics (JSONL snapshot per run; PUSHGATEWAY_URL also pushes to Prometheus)
+METRICS_PATH = os.environ.get(
+    "METRICS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.jsonl")
+)
+PUSHGATEWAY_URL = os.environ.get("PUSHGATEWAY_URL", "")
 
 # Daily limits
 DAILY_PROMPT_COUNT = 5
@@ -43,3 +106,9 @@ DAILY_VIDEO_COUNT = 5
 # Polling settings
 POLL_INTERVAL = 15  # seconds
 MAX_POLL_TIME = 600  # 10 minutes
+
+# Webhook completion (set WEBHOOK_PUBLIC_URL to a URL that reaches WEBHOOK_PORT)
+WEBHOOK_PUBLIC_URL = os.environ.get("WEBHOOK_PUBLIC_URL", "")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8787"))
+WEBHOOK_TOKEN = os.environ.get("WEBHOOK_TOKEN", "")
+WEBHOOK_FALLBACK_POLL = 60  # seconds, status polling while waiting for webhooks
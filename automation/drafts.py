@@ -0,0 +1,152 @@
+"""
+Drafts: render cheap drafts for many prompts and keep only the best for the full render
+
+Each candidate prompt gets a fixed seed and a short, low-res, low-step draft
+(DRAFT_DURATION s at DRAFT_WIDTH x DRAFT_HEIGHT, DRAFT_STEPS steps). Drafts are
+sent with exact_shape so the worker does not snap them up to the 576x1024
+shape bucket. That is ~3% of a full render's denoising work (320x576x89 vs
+576x1024x353 pixel-frames, 8 vs 20 steps). The fixed per-job overhead
+(prompt encoding, VAE decode, transfer) does not shrink, so the billed time
+per draft is larger than that. Each draft's real cost comes from its
+executionTime. Drafts are scored on CPU and only the top N go on to the full
+render with the same seed.
+
+A draft whose submit fails, times out or cannot be scored is kept with an
+"error" and score 0; it never aborts the other drafts.
+
+Scoring:
+- drafts failing the QA checks (black / static / frozen / garbled) score 0
+- otherwise motion energy (capped at DRAFT_MOTION_CAP), minus the share of
+  frozen and dark time
+- DRAFT_SCORER="module:function" replaces this with a user hook called as
+  hook(video_bytes, prompt_data, qa) -> float (QA failures still score 0)
+
+The seed carries over, but the full render has a different length and
+resolution, so it follows the draft's composition and motion only loosely.
+"""
+
+import base64
+import importlib
+import random
+from typing import Callable, Dict, List, Optional
+
+import ltx_client
+import video_qa
+from config import (
+    DRAFT_DURATION,
+    DRAFT_WIDTH,
+    DRAFT_HEIGHT,
+    DRAFT_STEPS,
+    DRAFT_MOTION_CAP,
+    DRAFT_SCORER,
+)
+
+Scorer = Callable[[bytes, Dict, Dict], float]
+
+
+def load_scorer(spec: str = DRAFT_SCORER) -> Optional[Scorer]:
+    """Import a "module:function" scoring hook (None if spec is empty)"""
+    if not spec:
+        return None
+    module_name, _, func_name = spec.partition(":")
+    if not func_name:
+        raise ValueError(f"DRAFT_SCORER must be 'module:function', got {spec!r}")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def score_metrics(qa: Dict) -> float:
+    """Default score from QA metrics (0 for failed drafts)"""
+    if not qa["passed"]:
+        return 0.0
+    m = qa["metrics"]
+    duration = m.get("duration") or DRAFT_DURATION
+    motion = min(m["motion_energy"], DRAFT_MOTION_CAP) / DRAFT_MOTION_CAP
+    return round(max(0.0, motion - m["frozen_seconds"] / duration - m["dark_ratio"]), 4)
+
+
+def score_draft(video_bytes: bytes, prompt_data: Dict, scorer: Optional[Scorer] = None) -> Dict:
+    """
+    QA and score one draft
+
+    Returns:
+        Dict with score, passed, reason, metrics
+    """
+    qa = video_qa.check_video_bytes(video_bytes, DRAFT_DURATION)
+    score = score_metrics(qa)
+    if scorer is not None and qa["passed"]:
+        score = float(scorer(video_bytes, prompt_data, qa))
+    return {"score": score, "passed": qa["passed"], "reason": qa["reason"], "metrics": qa["metrics"]}
+
+
+def render_drafts(prompts: List[Dict], scorer: Optional[Scorer] = None) -> List[Dict]:
+    """
+    Render and score a draft for every prompt (all submitted at once)
+
+    Args:
+        prompts: Prompt dicts from grok_client.generate_prompts()
+        scorer: Optional scoring hook (see load_scorer)
+
+    Returns:
+        One dict per prompt, best first:
+        {prompt_data, seed, job_id, score, passed, reason, metrics, cost}
+        (score 0 and an "error" for drafts that failed to submit, render or score)
+    """
+    drafts = [
+        {"prompt_data": p, "seed": random.randint(0, 2147483647), "job_id": None, "score": 0.0, "passed": False, "cost": 0.0}
+        for p in prompts
+    ]
+    job_ids = ltx_client.submit_many([
+        {
+            "prompt": d["prompt_data"]["prompt"],
+            "duration": DRAFT_DURATION,
+            "width": DRAFT_WIDTH,
+            "height": DRAFT_HEIGHT,
+            "steps": DRAFT_STEPS,
+            "seed": d["seed"],
+            "exact_shape": True,
+        }
+        for d in drafts
+    ])
+    by_id = {}
+    for draft, job_id in zip(drafts, job_ids):
+        if isinstance(job_id, Exception):
+            draft["error"] = f"Submit failed: {job_id}"
+            continue
+        draft["job_id"] = job_id
+        by_id[job_id] = draft
+
+    for job_id, result, error in ltx_client.wait_many(list(by_id)):
+        draft = by_id[job_id]
+        if error:
+            draft["error"] = str(error)
+            continue
+        draft["cost"] = result.get("executionTime", 0) / 1000 * 0.00106
+        video_b64 = result.get("output", {}).get("video_base64")
+        if not video_b64:
+            draft["error"] = "No video in response"
+            continue
+        try:
+            draft.update(score_draft(base64.b64decode(video_b64), draft["prompt_data"], scorer))
+        except Exception as e:
+            draft["error"] = f"Scoring failed: {e}"
+
+    return sorted(drafts, key=lambda d: d["score"], reverse=True)
+
+
+def select(drafts: List[Dict], count: int) -> List[Dict]:
+    """Top `count` drafts that passed QA (render_drafts output is already sorted)"""
+    return [d for d in drafts if d["passed"]][:count]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Score a draft video")
+    parser.add_argument("video", help="Input mp4")
+    parser.add_argument("--scorer", default=DRAFT_SCORER, help="Scoring hook as module:function")
+    args = parser.parse_args()
+
+    with open(args.video, "rb") as f:
+        result = score_draft(f.read(), {"prompt": "", "caption": ""}, load_scorer(args.scorer))
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,97 @@
+"""
+ffmpeg / ffprobe helpers shared by the post-processing modules
+"""
+
+import json
+import shutil
+import subprocess
+from typing import Dict, List
+
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
+FFPROBE = shutil.which("ffprobe") or "ffprobe"
+
+
+def run_ffmpeg(args: List[str], timeout: int = 600) -> subprocess.CompletedProcess:
+    """
+    Run ffmpeg with the given arguments (without the leading "ffmpeg")
+
+    Raises:
+        Exception: if ffmpeg exits with a non-zero code
+    """
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace")
+        raise Exception(f"ffmpeg failed (exit code {result.returncode}): {stderr[-2000:]}")
+    return result
+
+
+def probe_video(path: str) -> Dict:
+    """
+    Get basic stream info of a video file
+
+    Returns:
+        Dict with width, height, fps, duration, has_audio
+    """
+    cmd = [
+        FFPROBE, "-v", "error",
+        "-show_entries", "stream=codec_type,width,height,avg_frame_rate:format=duration",
+        "-of", "json",
+        path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe failed: {result.stderr[-2000:]}")
+
+    info = json.loads(result.stdout)
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise Exception(f"No video stream in {path}")
+
+    num, _, den = video.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+
+    return {
+        "width": int(video["width"]),
+        "height": int(video["height"]),
+        "fps": fps,
+        "duration": float(info.get("format", {}).get("duration", 0) or 0),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def read_gray_frames(path: str, fps: float, width: int, height: int = -2, timeout: int = 300):
+    """
+    Decode a video to low-res grayscale frames
+
+    Args:
+        path: Video path
+        fps: Sampling rate (frames per second to keep)
+        width: Output width in pixels
+        height: Output height (-2 keeps the aspect ratio, rounded to even)
+
+    Returns:
+        uint8 NumPy array of shape (frames, height, width)
+    """
+    import numpy as np
+
+    if height < 0:
+        info = probe_video(path)
+        height = max(2, int(round(info["height"] * width / info["width"] / 2)) * 2)
+
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error",
+        "-i", path,
+        "-vf", f"fps={fps},scale={width}:{height}:flags=area",
+        "-f", "rawvideo", "-pix_fmt", "gray",
+        "-",
+    ]
+    result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace")
+        raise Exception(f"ffmpeg decode failed: {stderr[-2000:]}")
+
+    frame_size = width * height
+    count = len(result.stdout) // frame_size
+    return np.frombuffer(result.stdout[:count * frame_size], dtype=np.uint8).reshape(count, height, width)
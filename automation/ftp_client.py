@@ -3,11 +3,16 @@ FTP Client for uploading videos to Lolipop server
 """
 
 import ftplib
+import hashlib
 import os
+import tempfile
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 from config import FTP_SERVER, FTP_USER, FTP_PASSWORD, FTP_PATH
 
+CHUNK_SIZE = 1024 * 1024
+
 
 def upload_video(video_bytes: bytes, filename: str, account_id: str = "") -> str:
     """
@@ -50,6 +55,56 @@ def upload_video(video_bytes: bytes, filename: str, account_id: str = "") -> str
     return f"{base_url}{FTP_PATH}/{filename}"
 
 
+def upload_directory(local_dir: str, dirname: str) -> str:
+    """
+    Upload every file in a local directory (e.g. an HLS package)
+
+    Files go to FTP_PATH/dirname/, next to the mp4 uploaded by upload_video,
+    over a single FTP connection.
+
+    Args:
+        local_dir: Local directory containing the files to upload
+        dirname: Remote sub-directory name (e.g. the video filename stem)
+
+    Returns:
+        Base URL of the uploaded directory (without trailing slash)
+    """
+    if not all([FTP_SERVER, FTP_USER, FTP_PASSWORD]):
+        raise ValueError("FTP credentials not configured")
+
+    ftp = ftplib.FTP(FTP_SERVER)
+    target_path = f"{FTP_PATH}/{dirname}"
+    try:
+        ftp.login(FTP_USER, FTP_PASSWORD)
+        try:
+            ftp.cwd(target_path)
+        except ftplib.error_perm:
+            _makedirs(ftp, target_path)
+            ftp.cwd(target_path)
+
+        # Playlists last so players never see a playlist before its segments
+        files = sorted(
+            (p for p in Path(local_dir).iterdir() if p.is_file()),
+            key=lambda p: (p.suffix == ".m3u8", p.name == "master.m3u8", p.name),
+        )
+        for path in files:
+            with open(path, "rb") as f:
+                ftp.storbinary(f"STOR {path.name}", f)
+    finally:
+        _close(ftp)
+
+    base_url = os.environ.get("FTP_BASE_URL", "http://okibai.heavy.jp")
+    return f"{base_url}{target_path}"
+
+
+def _close(ftp: ftplib.FTP):
+    """QUIT politely, or drop the socket if the session is already broken"""
+    try:
+        ftp.quit()
+    except ftplib.all_errors:
+        ftp.close()
+
+
 def _makedirs(ftp: ftplib.FTP, path: str):
     """Create directory tree on FTP"""
     parts = path.strip("/").split("/")
@@ -85,22 +140,71 @@ def list_videos() -> list:
 
 def download_video(filename: str) -> bytes:
     """
-    Download video from FTP server
+    Download video from FTP server into memory
+
+    Prefer download_video_to() for anything that may be large.
 
     Returns:
         Video bytes
     """
-    ftp = ftplib.FTP(FTP_SERVER)
-    ftp.login(FTP_USER, FTP_PASSWORD)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        download_video_to(filename, path)
+        return Path(path).read_bytes()
 
-    ftp.cwd(FTP_PATH)
 
-    from io import BytesIO
-    buffer = BytesIO()
-    ftp.retrbinary(f"RETR {filename}", buffer.write)
+def download_video_to(filename: str, output_path: str, retries: int = 3) -> Dict:
+    """
+    Stream a video from the FTP server to a local file
 
-    ftp.quit()
-    return buffer.getvalue()
+    Writes output_path + ".part" in chunks and resumes with REST after a
+    dropped connection. The size is checked against the server's SIZE before
+    the file is renamed into place.
+
+    Returns:
+        Dict with path, size, sha256
+    """
+    part = f"{output_path}.part"
+    expected_size = None
+
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        ftp = None
+        try:
+            ftp = ftplib.FTP(FTP_SERVER, timeout=60)
+            ftp.login(FTP_USER, FTP_PASSWORD)
+            ftp.cwd(FTP_PATH)
+            ftp.voidcmd("TYPE I")
+            expected_size = ftp.size(filename)
+            if offset and offset == expected_size:
+                break
+            with open(part, "ab" if offset else "wb") as f:
+                ftp.retrbinary(f"RETR {filename}", f.write, blocksize=CHUNK_SIZE, rest=offset or None)
+            break
+        except (ftplib.error_temp, ftplib.error_reply, OSError, EOFError) as e:
+            if attempt == retries:
+                raise
+            print(f"FTP download interrupted ({e}), resuming...")
+            time.sleep(2 ** attempt)
+        finally:
+            if ftp is not None:
+                try:
+                    ftp.quit()
+                except Exception:
+                    ftp.close()
+
+    size = os.path.getsize(part)
+    if expected_size is not None and size != expected_size:
+        os.remove(part)
+        raise ValueError(f"Size mismatch for {filename}: {size} != {expected_size}")
+
+    digest = hashlib.sha256()
+    with open(part, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    os.replace(part, output_path)
+    return {"path": output_path, "size": size, "sha256": digest.hexdigest()}
 
 
 def delete_video(filename: str) -> bool:
@@ -0,0 +1,166 @@
+"""
+HLS Packager: build a small rendition ladder + HLS playlists + poster frame
+
+Output layout (one directory per video):
+    master.m3u8          # variant playlist (entry point for players)
+    r360.m3u8 / r360_000.ts ...
+    r540.m3u8 / r540_000.ts ...
+    source.m3u8 / source_000.ts ...   # original resolution (high-quality re-encode)
+    poster.jpg
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import HLS_RENDITIONS, HLS_SEGMENT_SECONDS
+from ffmpeg_utils import run_ffmpeg, probe_video
+
+MASTER_PLAYLIST = "master.m3u8"
+POSTER_FILENAME = "poster.jpg"
+
+# Target video bitrates (kbps) per short-side height
+BITRATES = {
+    360: 600,
+    540: 1200,
+    720: 2200,
+}
+AUDIO_BITRATE = "96k"
+SOURCE_CRF = 18  # source rendition: near-lossless, re-encoded only to align GOPs
+
+
+def _even(value: float) -> int:
+    """Round to the nearest even integer (required by libx264)"""
+    return max(2, int(round(value / 2)) * 2)
+
+
+def _scaled_size(width: int, height: int, short_side: int) -> tuple:
+    """Scale (width, height) so that the shorter side equals short_side"""
+    ratio = short_side / min(width, height)
+    return _even(width * ratio), _even(height * ratio)
+
+
+def _rendition_bandwidth(out_dir: Path, name: str, duration: float) -> int:
+    """Peak-ish bandwidth (bits/sec) from the actual segment sizes"""
+    segments = list(out_dir.glob(f"{name}_*.ts"))
+    if not segments or duration <= 0:
+        return 0
+    total_bits = sum(s.stat().st_size for s in segments) * 8
+    # HLS requires BANDWIDTH to be the peak rate; use average + 20% headroom
+    return int(total_bits / duration * 1.2)
+
+
+def build_ladder(video_path: str, out_dir: str, renditions: Optional[List[int]] = None) -> Dict:
+    """
+    Package a video as HLS with multiple renditions and a poster frame
+
+    Args:
+        video_path: Source mp4 path
+        out_dir: Directory to write playlists/segments/poster into
+        renditions: Short-side heights (e.g. [360, 540]); 0 means the source
+            resolution. Heights >= the source are skipped.
+
+    Returns:
+        Dict with master playlist name, poster name, variant info and file list
+    """
+    renditions = HLS_RENDITIONS if renditions is None else renditions
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    info = probe_video(video_path)
+    src_w, src_h = info["width"], info["height"]
+    src_short = min(src_w, src_h)
+    gop = max(1, int(round(info["fps"] * HLS_SEGMENT_SECONDS))) if info["fps"] else 48
+    # 固定GOPでセグメント境界を揃える（全レンディション共通、ABR の切り替え位置になる）
+    gop_args = ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"]
+
+    variants = []
+    for short_side in renditions:
+        if short_side and short_side >= src_short:
+            continue
+
+        if short_side:
+            name = f"r{short_side}"
+            width, height = _scaled_size(src_w, src_h, short_side)
+            kbps = BITRATES.get(short_side, int(short_side * 2.5))
+            video_args = [
+                "-vf", f"scale={width}:{height}",
+                "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+                "-b:v", f"{kbps}k", "-maxrate", f"{int(kbps * 1.2)}k", "-bufsize", f"{kbps * 2}k",
+                *gop_args,
+            ]
+        else:
+            # stream copy だと元の GOP で切られ、他のレンディションとセグメント境界がずれる
+            name = "source"
+            width, height = src_w, src_h
+            video_args = [
+                "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-crf", str(SOURCE_CRF),
+                *gop_args,
+            ]
+
+        audio_args = ["-c:a", "aac", "-b:a", AUDIO_BITRATE] if info["has_audio"] else ["-an"]
+
+        run_ffmpeg([
+            "-i", video_path,
+            *video_args,
+            *audio_args,
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_filename", str(out / f"{name}_%03d.ts"),
+            str(out / f"{name}.m3u8"),
+        ])
+
+        variants.append({
+            "name": name,
+            "playlist": f"{name}.m3u8",
+            "width": width,
+            "height": height,
+            "bandwidth": _rendition_bandwidth(out, name, info["duration"]),
+        })
+
+    # 低解像度から並べる（プレイヤーは先頭から選ぶことが多い）
+    variants.sort(key=lambda v: v["width"] * v["height"])
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for v in variants:
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={v['bandwidth']},RESOLUTION={v['width']}x{v['height']}")
+        lines.append(v["playlist"])
+    (out / MASTER_PLAYLIST).write_text("\n".join(lines) + "\n")
+
+    extract_poster(video_path, str(out / POSTER_FILENAME), info["duration"])
+
+    return {
+        "master": MASTER_PLAYLIST,
+        "poster": POSTER_FILENAME,
+        "variants": variants,
+        "files": sorted(os.listdir(out)),
+    }
+
+
+def extract_poster(video_path: str, poster_path: str, duration: float = 0.0) -> str:
+    """Extract a single JPEG frame to use as the <video> poster"""
+    # 先頭フレームは暗いことが多いので少し進めた位置から取る
+    offset = min(0.5, duration / 2) if duration else 0
+    run_ffmpeg([
+        "-ss", f"{offset:.3f}",
+        "-i", video_path,
+        "-frames:v", "1",
+        "-q:v", "3",
+        poster_path,
+    ])
+    return poster_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Package a video as HLS ladder")
+    parser.add_argument("video", help="Input mp4")
+    parser.add_argument("--out", default="hls_out", help="Output directory")
+    args = parser.parse_args()
+
+    package = build_ladder(args.video, args.out)
+    for v in package["variants"]:
+        print(f"  {v['name']}: {v['width']}x{v['height']} ~{v['bandwidth'] // 1000} kbps")
+    print(f"Master: {Path(args.out) / package['master']}")
@@ -5,6 +5,9 @@ Note: Later API details may need adjustment based on actual API documentation.
 This is a template implementation.
 """
 
+import io
+import os
+import uuid
 import requests
 from datetime import datetime, timedelta
 from typing import Optional, Dict
@@ -23,10 +26,55 @@ def get_headers() -> Dict:
     }
 
 
-def upload_media(video_bytes: bytes, filename: str = "video.mp4") -> str:
+class MultipartFile:
+    """
+    multipart/form-data body with a single file field, read lazily
+
+    requests' files= builds the whole body in memory; this streams the file
+    from disk instead, with an exact Content-Length.
+    """
+
+    def __init__(self, path: str, field: str = "file", filename: Optional[str] = None, content_type: str = "video/mp4"):
+        self.boundary = uuid.uuid4().hex
+        filename = filename or os.path.basename(path)
+        head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self._parts = [io.BytesIO(head), open(path, "rb"), io.BytesIO(tail)]
+        self.len = len(head) + os.path.getsize(path) + len(tail)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def read(self, size: int = -1) -> bytes:
+        out = b""
+        while self._parts and (size < 0 or len(out) < size):
+            chunk = self._parts[0].read(-1 if size < 0 else size - len(out))
+            if not chunk:
+                self._parts.pop(0).close()
+                continue
+            out += chunk
+        return out
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+
+def upload_media(video_bytes: Optional[bytes] = None, filename: str = "video.mp4", video_path: Optional[str] = None) -> str:
     """
     Upload video to Later
 
+    Args:
+        video_bytes: Video content (small files / already in memory)
+        filename: Upload filename
+        video_path: Local file to stream instead of video_bytes
+
     Returns:
         Media ID
     """
@@ -34,12 +82,24 @@ def upload_media(video_bytes: bytes, filename: str = "video.mp4") -> str:
         raise ValueError("LATER_API_KEY not set")
 
     # Later typically requires multipart upload
-    response = requests.post(
-        f"{LATER_BASE_URL}/media",
-        headers={"Authorization": f"Bearer {LATER_API_KEY}"},
-        files={"file": (filename, video_bytes, "video/mp4")},
-        timeout=120,
-    )
+    if video_path:
+        body = MultipartFile(video_path, filename=filename)
+        try:
+            response = requests.post(
+                f"{LATER_BASE_URL}/media",
+                headers={"Authorization": f"Bearer {LATER_API_KEY}", "Content-Type": body.content_type},
+                data=body,
+                timeout=120,
+            )
+        finally:
+            body.close()
+    else:
+        response = requests.post(
+            f"{LATER_BASE_URL}/media",
+            headers={"Authorization": f"Bearer {LATER_API_KEY}"},
+            files={"file": (filename, video_bytes, "video/mp4")},
+            timeout=120,
+        )
 
     response.raise_for_status()
     result = response.json()
@@ -96,14 +156,17 @@ def schedule_post(
 
 
 def schedule_video(
-    video_bytes: bytes,
-    caption: str,
+    video_bytes: Optional[bytes] = None,
+    caption: str = "",
     hashtags: list = None,
     scheduled_time: Optional[datetime] = None,
+    video_path: Optional[str] = None,
 ) -> Dict:
     """
     Upload and schedule video in one step
 
+    Pass video_path to stream the upload from disk instead of video_bytes.
+
     Returns:
         Dict with media_id, post_id, scheduled_time
     """
@@ -115,7 +178,10 @@ def schedule_video(
 
     # Upload
     print("Uploading video to Later...")
-    media_id = upload_media(video_bytes)
+    if video_path:
+        media_id = upload_media(filename=os.path.basename(video_path), video_path=video_path)
+    else:
+        media_id = upload_media(video_bytes)
     print(f"Uploaded: {media_id}")
 
     # Schedule
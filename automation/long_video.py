@@ -0,0 +1,245 @@
+"""
+Long Video: chain I2V segments to go past the per-job duration limit
+
+Flow for a target duration D split into N segments:
+1. Segment 0 is T2V
+2. Segment k (k >= 1) is I2V conditioned on the last frame of segment k-1
+3. Segments are joined with an ffmpeg stream copy (no re-encode)
+
+CPU work (decode/save, remux to MPEG-TS for concat) for segment k runs in a
+background thread while segment k+1 renders on the GPU. Each finished segment
+is cached on disk, so a failed run resumes from the first missing segment and
+only that segment is retried.
+"""
+
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import ltx_client
+from config import (
+    DEFAULT_WIDTH,
+    DEFAULT_HEIGHT,
+    DEFAULT_STEPS,
+    LONG_VIDEO_SEGMENT_DURATION,
+    LONG_VIDEO_SEGMENT_RETRIES,
+    LONG_VIDEO_CACHE_DIR,
+)
+from ffmpeg_utils import run_ffmpeg
+
+
+def plan_segments(total_duration: float, segment_duration: float = LONG_VIDEO_SEGMENT_DURATION) -> List[float]:
+    """Split a duration into near-equal segments no longer than segment_duration"""
+    count = max(1, math.ceil(total_duration / segment_duration))
+    each = total_duration / count
+    return [round(each, 2)] * count
+
+
+def _cache_key(prompts: List[str], durations: List[float], width: int, height: int, steps: int, seed: int) -> str:
+    payload = json.dumps([prompts, durations, width, height, steps, seed], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _atomic_write(path: Path, data: bytes):
+    tmp = path.with_suffix(path.suffix + ".part")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def extract_last_frame(video_path: str, image_path: str) -> str:
+    """Extract the final frame of a video as JPEG (I2V conditioning image)"""
+    run_ffmpeg([
+        "-sseof", "-0.5",
+        "-i", video_path,
+        "-update", "1",
+        "-q:v", "2",
+        image_path,
+    ])
+    return image_path
+
+
+def _to_ts(video_path: str, ts_path: str) -> str:
+    """Remux mp4 to MPEG-TS so segments can be joined by stream copy"""
+    run_ffmpeg([
+        "-i", video_path,
+        "-c", "copy",
+        "-bsf:v", "h264_mp4toannexb",
+        "-f", "mpegts",
+        ts_path,
+    ])
+    return ts_path
+
+
+def concat_segments(ts_paths: List[str], output_path: str) -> str:
+    """Join MPEG-TS segments into one mp4 without re-encoding"""
+    tmp = f"{output_path}.part.mp4"
+    run_ffmpeg([
+        "-i", "concat:" + "|".join(ts_paths),
+        "-c", "copy",
+        "-bsf:a", "aac_adtstoasc",
+        "-movflags", "+faststart",
+        tmp,
+    ])
+    os.replace(tmp, output_path)
+    return output_path
+
+
+def _render_segment(
+    prompt: str,
+    duration: float,
+    width: int,
+    height: int,
+    steps: int,
+    seed: int,
+    image_path: Optional[str],
+    image_strength: float,
+    retries: int,
+) -> tuple:
+    """Generate one segment, retrying only this segment on failure"""
+    image_b64 = None
+    if image_path:
+        with open(image_path, "rb") as f:
+            image_b64 = base64.b64encode(f.read()).decode("utf-8")
+
+    last_error = None
+    for attempt in range(retries + 1):
+        try:
+            return ltx_client.generate_video(
+                prompt=prompt,
+                duration=duration,
+                width=width,
+                height=height,
+                steps=steps,
+                seed=seed,
+                image_base64=image_b64,
+                image_strength=image_strength,
+            )
+        except Exception as e:
+            last_error = e
+            print(f"    Segment attempt {attempt + 1}/{retries + 1} failed: {e}")
+    raise Exception(f"Segment failed after {retries + 1} attempts: {last_error}")
+
+
+def generate_long_video(
+    prompt: str,
+    total_duration: float,
+    output_path: str,
+    width: int = DEFAULT_WIDTH,
+    height: int = DEFAULT_HEIGHT,
+    steps: int = DEFAULT_STEPS,
+    seed: Optional[int] = None,
+    segment_duration: float = LONG_VIDEO_SEGMENT_DURATION,
+    segment_prompts: Optional[List[str]] = None,
+    image_strength: float = 1.0,
+    cache_dir: str = LONG_VIDEO_CACHE_DIR,
+    retries: int = LONG_VIDEO_SEGMENT_RETRIES,
+) -> Dict:
+    """
+    Generate a long video by chaining I2V segments
+
+    Args:
+        prompt: Prompt for every segment (unless segment_prompts is given)
+        total_duration: Target duration in seconds
+        output_path: Final mp4 path
+        seed: Base seed (segment k uses seed + k); random if None. Pass the
+            same seed to resume a previous run from its cache.
+        segment_prompts: Optional per-segment prompts (len == segment count)
+        image_strength: I2V conditioning strength for segments after the first
+        cache_dir: Where finished segments are kept for resume
+
+    Returns:
+        Dict with output_path, segments, cached count and total cost
+    """
+    durations = plan_segments(total_duration, segment_duration)
+    prompts = segment_prompts or [prompt] * len(durations)
+    if len(prompts) != len(durations):
+        raise ValueError(f"segment_prompts needs {len(durations)} entries, got {len(prompts)}")
+
+    seed = seed if seed is not None else random.randint(0, 2147483647 - len(durations))
+    key = _cache_key(prompts, durations, width, height, steps, seed)
+    work = Path(cache_dir) / key
+    work.mkdir(parents=True, exist_ok=True)
+
+    print(f"Long video: {total_duration}s = {len(durations)} x {durations[0]}s (seed {seed}, cache {work})")
+
+    total_cost = 0.0
+    cached = 0
+    ts_futures = []
+    image_path = None
+
+    # CPU 側の後処理は次セグメントのGPU生成と並行して実行
+    with ThreadPoolExecutor(max_workers=2) as cpu:
+        for i, (seg_prompt, seg_duration) in enumerate(zip(prompts, durations)):
+            mp4 = work / f"seg_{i:03d}.mp4"
+            meta_path = work / f"seg_{i:03d}.json"
+
+            if mp4.exists() and meta_path.exists():
+                cached += 1
+                print(f"  [{i + 1}/{len(durations)}] cached")
+            else:
+                mode = "I2V" if image_path else "T2V"
+                print(f"  [{i + 1}/{len(durations)}] {mode} {seg_duration}s...")
+                video_bytes, metadata = _render_segment(
+                    seg_prompt, seg_duration, width, height, steps, seed + i,
+                    image_path, image_strength, retries,
+                )
+                _atomic_write(mp4, video_bytes)
+                _atomic_write(meta_path, json.dumps(metadata).encode("utf-8"))
+                total_cost += metadata.get("cost", 0)
+
+            # 次セグメントの条件画像（クリティカルパスなので同期で取る）
+            if i < len(durations) - 1:
+                image_path = extract_last_frame(str(mp4), str(work / f"seg_{i:03d}_last.jpg"))
+
+            ts_futures.append(cpu.submit(_to_ts, str(mp4), str(work / f"seg_{i:03d}.ts")))
+
+        ts_paths = [f.result() for f in ts_futures]
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    concat_segments(ts_paths, output_path)
+    print(f"Saved: {output_path} (${total_cost:.4f}, {cached} cached segments)")
+
+    return {
+        "output_path": output_path,
+        "segments": len(durations),
+        "segment_duration": durations[0],
+        "cached_segments": cached,
+        "seed": seed,
+        "cache_dir": str(work),
+        "cost": round(total_cost, 4),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Long-form video via chained I2V segments")
+    parser.add_argument("--prompt", required=True, help="Generation prompt")
+    parser.add_argument("--duration", type=float, required=True, help="Total duration (seconds)")
+    parser.add_argument("--output", default="long_video.mp4", help="Output mp4")
+    parser.add_argument("--segment", type=float, default=LONG_VIDEO_SEGMENT_DURATION, help="Max segment duration")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed (reuse to resume)")
+    parser.add_argument("--width", type=int, default=DEFAULT_WIDTH)
+    parser.add_argument("--height", type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS)
+    args = parser.parse_args()
+
+    result = generate_long_video(
+        prompt=args.prompt,
+        total_duration=args.duration,
+        output_path=args.output,
+        width=args.width,
+        height=args.height,
+        steps=args.steps,
+        seed=args.seed,
+        segment_duration=args.segment,
+    )
+    print(json.dumps(result, indent=2))
@@ -1,11 +1,23 @@
 """
 LTX-2 Runpod Serverless Client
+
+Thin synchronous wrappers around the shared asyncio client (async_client.py
+at the repo root): one pooled HTTP session, adaptive polling, and concurrent
+waiting for many jobs via wait_many().
+
+With WEBHOOK_PUBLIC_URL set, jobs are submitted with Runpod's "webhook" field
+and a local receiver (webhook_receiver.py) wakes waiters on completion;
+status polling then only runs every WEBHOOK_FALLBACK_POLL seconds.
 """
 
-import time
+import sys
 import base64
-import requests
-from typing import Optional, Dict, Tuple
+from pathlib import Path
+from typing import Optional, Dict, Iterator, List, Tuple, Union
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from async_client import JobFailed, serverless_client, run_sync, iterate_sync
+from webhook_receiver import enable_webhooks
 
 from config import (
     RUNPOD_API_KEY,
@@ -14,11 +26,28 @@ from config import (
     DEFAULT_WIDTH,
     DEFAULT_HEIGHT,
     DEFAULT_STEPS,
+    DEFAULT_INTERNAL_FPS,
     POLL_INTERVAL,
     MAX_POLL_TIME,
+    WEBHOOK_PUBLIC_URL,
+    WEBHOOK_PORT,
+    WEBHOOK_TOKEN,
+    WEBHOOK_FALLBACK_POLL,
 )
 
 
+def _client():
+    """Shared async client (pooled session on a background event loop)"""
+    if not RUNPOD_API_KEY:
+        raise ValueError("RUNPOD_API_KEY not set")
+    client = serverless_client(
+        RUNPOD_ENDPOINT, RUNPOD_API_KEY, poll_max=POLL_INTERVAL, fallback_poll=WEBHOOK_FALLBACK_POLL,
+    )
+    if WEBHOOK_PUBLIC_URL and client.receiver is None:
+        enable_webhooks(client, WEBHOOK_PORT, WEBHOOK_PUBLIC_URL, WEBHOOK_TOKEN or None)
+    return client
+
+
 def submit_job(
     prompt: str,
     duration: float = DEFAULT_DURATION,
@@ -28,6 +57,9 @@ def submit_job(
     seed: Optional[int] = None,
     image_base64: Optional[str] = None,
     image_strength: float = 1.0,
+    internal_fps: Optional[int] = DEFAULT_INTERNAL_FPS,
+    interpolator: Optional[str] = None,
+    webhook: Optional[str] = None,
 ) -> str:
     """
     Submit a video generation job (T2V or I2V)
@@ -41,61 +73,102 @@ def submit_job(
         seed: Random seed for reproducibility
         image_base64: Base64 encoded image for I2V (optional, None for T2V)
         image_strength: Image conditioning strength 0.0-1.0 (default 1.0)
+        internal_fps: Generate at this fps and interpolate to 24fps on CPU
+            (low-fps mode, e.g. 12 or 16; default from INTERNAL_FPS, None = off)
+        interpolator: minterpolate / blend / duplicate / none (handler default: minterpolate)
+        webhook: Completion callback URL sent as Runpod's "webhook" field
+            (default: the local receiver's URL when WEBHOOK_PUBLIC_URL is set)
 
     Returns:
         Job ID
     """
-    if not RUNPOD_API_KEY:
-        raise ValueError("RUNPOD_API_KEY not set")
+    job_input = build_input(
+        prompt, duration, width, height, steps, seed, image_base64, image_strength,
+        internal_fps, interpolator,
+    )
+    return run_sync(_client().submit(job_input, webhook=webhook)).id
 
+
+def build_input(
+    prompt: str,
+    duration: float = DEFAULT_DURATION,
+    width: int = DEFAULT_WIDTH,
+    height: int = DEFAULT_HEIGHT,
+    steps: int = DEFAULT_STEPS,
+    seed: Optional[int] = None,
+    image_base64: Optional[str] = None,
+    image_strength: float = 1.0,
+    internal_fps: Optional[int] = DEFAULT_INTERNAL_FPS,
+    interpolator: Optional[str] = None,
+    exact_shape: bool = False,
+) -> Dict:
+    """Validate parameters and build the handler "input" dict
+
+    exact_shape: render at exactly width x height instead of snapping up to a
+        shape bucket (small drafts would otherwise render at full bucket size)
+    """
     # Validate resolution
     if width % 64 != 0 or height % 64 != 0:
         raise ValueError(f"Resolution {width}x{height} must be divisible by 64")
 
-    payload = {
-        "input": {
-            "prompt": prompt,
-            "duration": duration,
-            "width": width,
-            "height": height,
-            "steps": steps,
-        }
+    job_input = {
+        "prompt": prompt,
+        "duration": duration,
+        "width": width,
+        "height": height,
+        "steps": steps,
     }
 
     if seed is not None:
-        payload["input"]["seed"] = seed
+        job_input["seed"] = seed
 
     # I2V: 画像入力
     if image_base64:
-        payload["input"]["image_base64"] = image_base64
-        payload["input"]["image_strength"] = image_strength
-
-    response = requests.post(
-        f"{RUNPOD_ENDPOINT}/run",
-        headers={
-            "Authorization": f"Bearer {RUNPOD_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        json=payload,
-        timeout=30,
-    )
+        job_input["image_base64"] = image_base64
+        job_input["image_strength"] = image_strength
 
-    response.raise_for_status()
-    result = response.json()
+    # 低fpsモード
+    if internal_fps:
+        job_input["internal_fps"] = internal_fps
+        if interpolator:
+            job_input["interpolator"] = interpolator
 
-    return result["id"]
+    if exact_shape:
+        job_input["exact_shape"] = True
+
+    return job_input
+
+
+def submit_many(inputs: List[Dict]) -> List[Union[str, Exception]]:
+    """
+    Submit several jobs concurrently
+
+    A failed submit does not affect the others: its slot holds the exception,
+    so callers can mark just that row and still collect the submitted jobs.
+
+    Args:
+        inputs: List of keyword-argument dicts for build_input()
+
+    Returns:
+        Job ID or the submit exception for each input, in the same order
+    """
+    results: List = []
+    for kwargs in inputs:
+        try:
+            results.append(build_input(**kwargs))
+        except ValueError as e:
+            results.append(e)
+
+    valid = [i for i, r in enumerate(results) if not isinstance(r, Exception)]
+    jobs = run_sync(_client().submit_many([results[i] for i in valid], return_exceptions=True))
+    for i, job in zip(valid, jobs):
+        results[i] = job
+    return [r if isinstance(r, Exception) else r.id for r in results]
 
 
 def get_status(job_id: str) -> Dict:
     """Get job status"""
-    response = requests.get(
-        f"{RUNPOD_ENDPOINT}/status/{job_id}",
-        headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
-        timeout=30,
-    )
-
-    response.raise_for_status()
-    return response.json()
+    return run_sync(_client().status(job_id))
 
 
 def wait_for_completion(job_id: str) -> Dict:
@@ -105,25 +178,45 @@ def wait_for_completion(job_id: str) -> Dict:
     Returns:
         Full response dict with output
     """
-    start_time = time.time()
+    client = _client()
+    job = client.job(job_id)
+
+    try:
+        for update in iterate_sync(client.updates([job], timeout=MAX_POLL_TIME)):
+            if not update.done():
+                print(f"Job {job_id}: {update.data.get('status')}...")
+        return job.result()
+    except JobFailed as e:
+        raise Exception(f"Job failed: {e.error}")
+    except TimeoutError:
+        raise TimeoutError(f"Job {job_id} timed out after {MAX_POLL_TIME}s")
+
+
+def wait_many(job_ids: List[str], timeout: float = MAX_POLL_TIME) -> Iterator[Tuple[str, Optional[Dict], Optional[Exception]]]:
+    """
+    Wait for several jobs at once, yielding them as they finish
 
-    while time.time() - start_time < MAX_POLL_TIME:
-        status = get_status(job_id)
-        state = status.get("status")
+    Statuses of all pending jobs are fetched concurrently on every poll.
+    Each job gets its own `timeout`, counted from its submit time, so jobs
+    queued behind others are not cut short by a batch-wide deadline.
 
-        if state == "COMPLETED":
-            return status
-        elif state == "FAILED":
-            error = status.get("error", "Unknown error")
-            raise Exception(f"Job failed: {error}")
-        elif state in ("IN_QUEUE", "IN_PROGRESS"):
-            print(f"Job {job_id}: {state}...")
-            time.sleep(POLL_INTERVAL)
-        else:
-            print(f"Job {job_id}: Unknown status {state}")
-            time.sleep(POLL_INTERVAL)
+    Yields:
+        (job_id, result, None) on success or (job_id, None, error) on failure,
+        timeout, or repeated status errors; a single job never aborts the batch
+    """
+    client = _client()
+    jobs = [client.job(job_id) for job_id in job_ids]
 
-    raise TimeoutError(f"Job {job_id} timed out after {MAX_POLL_TIME}s")
+    for job in iterate_sync(client.as_completed(jobs, job_timeout=timeout)):
+        try:
+            yield job.id, job.result(), None
+        except JobFailed as e:
+            yield job.id, None, Exception(f"Job failed: {e.error}")
+        except TimeoutError:
+            yield job.id, None, TimeoutError(f"Job {job.id} timed out after {timeout}s")
+        except Exception as e:
+            # Status kept failing (5xx, job already expired on Runpod): give up on this job only
+            yield job.id, None, Exception(f"Status check failed: {e}")
 
 
 def generate_video(
@@ -135,6 +228,8 @@ def generate_video(
     seed: Optional[int] = None,
     image_base64: Optional[str] = None,
     image_strength: float = 1.0,
+    internal_fps: Optional[int] = DEFAULT_INTERNAL_FPS,
+    interpolator: Optional[str] = None,
 ) -> Tuple[bytes, Dict]:
     """
     Generate video and return bytes (T2V or I2V)
@@ -142,7 +237,10 @@ def generate_video(
     Returns:
         Tuple of (video_bytes, metadata)
     """
-    job_id = submit_job(prompt, duration, width, height, steps, seed, image_base64, image_strength)
+    job_id = submit_job(
+        prompt, duration, width, height, steps, seed, image_base64, image_strength,
+        internal_fps, interpolator,
+    )
     mode = "I2V" if image_base64 else "T2V"
     print(f"[{mode}] Submitted job: {job_id}")
 
@@ -166,6 +264,12 @@ def generate_video(
     # Calculate cost ($0.00106/sec)
     metadata["cost"] = round(metadata["execution_time"] * 0.00106, 4)
 
+    # Low-fps mode details (internal_fps, generation/interpolation seconds, GPU seconds saved)
+    for key in ("internal_fps", "fps", "output_frames", "generation_seconds",
+                "interpolation_seconds", "gpu_seconds_saved"):
+        if key in output:
+            metadata[key] = output[key]
+
     return video_bytes, metadata
 
 
@@ -240,12 +344,8 @@ def generate_video_from_image(
 def check_health() -> bool:
     """Check endpoint health"""
     try:
-        response = requests.get(
-            f"{RUNPOD_ENDPOINT}/health",
-            headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
-            timeout=10,
-        )
-        return response.status_code == 200
+        run_sync(_client().health())
+        return True
     except Exception:
         return False
 
@@ -5,6 +5,7 @@ Designed to run separately from video generation
 
 import argparse
 import os
+import tempfile
 from datetime import datetime, timezone
 
 # Load .env for local testing
@@ -83,29 +84,30 @@ def post_single(video_url: str = None, row_id: str = None, dry_run: bool = False
         print("\n[DRY RUN] Would post this video to Later")
         return {"status": "dry_run", "filename": filename, "caption": caption}
 
-    # Download video from FTP
-    print("\n[1/3] Downloading from FTP...")
-    try:
-        video_bytes = ftp_client.download_video(filename)
-        print(f"  Downloaded {len(video_bytes)/1024/1024:.2f} MB")
-    except Exception as e:
-        print(f"  ERROR: {e}")
-        return {"status": "error", "error": str(e)}
+    # Download video from FTP (streamed to a temp file, handed to Later as a file)
+    with tempfile.TemporaryDirectory() as tmp:
+        print("\n[1/3] Downloading from FTP...")
+        try:
+            download = ftp_client.download_video_to(filename, os.path.join(tmp, filename))
+            print(f"  Downloaded {download['size']/1024/1024:.2f} MB (sha256 {download['sha256'][:12]})")
+        except Exception as e:
+            print(f"  ERROR: {e}")
+            return {"status": "error", "error": str(e)}
 
-    # Post to Later
-    print("\n[2/3] Posting to Later...")
-    try:
-        result = later_client.schedule_video(
-            video_bytes=video_bytes,
-            caption=caption,
-            hashtags=hashtags,
-        )
-        print(f"  Posted! Media ID: {result.get('media_id')}")
-    except Exception as e:
-        print(f"  ERROR: {e}")
-        if row_id:
-            sheets_client.mark_error(row_id, f"Later: {str(e)}")
-        return {"status": "error", "error": str(e)}
+        # Post to Later
+        print("\n[2/3] Posting to Later...")
+        try:
+            result = later_client.schedule_video(
+                caption=caption,
+                hashtags=hashtags,
+                video_path=download["path"],
+            )
+            print(f"  Posted! Media ID: {result.get('media_id')}")
+        except Exception as e:
+            print(f"  ERROR: {e}")
+            if row_id:
+                sheets_client.mark_error(row_id, f"Later: {str(e)}")
+            return {"status": "error", "error": str(e)}
 
     # Update Sheets
     print("\n[3/3] Updating Sheets...")
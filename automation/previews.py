@@ -0,0 +1,122 @@
+"""
+Previews: poster JPEG, low-res animated preview and thumbnail sprite sheet
+
+Lets reviewers look at a batch of candidates for a few KB each instead of
+downloading every full mp4.
+"""
+
+import math
+from pathlib import Path
+from typing import Dict
+
+from config import PREVIEW_FORMAT, PREVIEW_HEIGHT, PREVIEW_FPS, SPRITE_COLUMNS, SPRITE_TILES, SPRITE_TILE_WIDTH
+from ffmpeg_utils import run_ffmpeg, probe_video
+from hls_packager import extract_poster, POSTER_FILENAME
+
+PREVIEW_BASENAME = "preview"
+SPRITE_FILENAME = "sprite.jpg"
+
+
+def make_animated_preview(video_path: str, out_path: str, fmt: str = PREVIEW_FORMAT) -> str:
+    """
+    Encode a short low-res looping preview (WebP or GIF, no audio)
+
+    Returns:
+        Path of the written preview (extension follows fmt)
+    """
+    scale = f"fps={PREVIEW_FPS},scale=-2:{PREVIEW_HEIGHT}:flags=lanczos"
+    out = str(Path(out_path).with_suffix(f".{fmt}"))
+
+    if fmt == "webp":
+        run_ffmpeg([
+            "-i", video_path,
+            "-vf", scale,
+            "-an",
+            "-c:v", "libwebp", "-lossless", "0", "-q:v", "50", "-loop", "0",
+            out,
+        ])
+    else:
+        # GIF: パレット生成で少ない色数でも破綻しにくくする
+        run_ffmpeg([
+            "-i", video_path,
+            "-vf", f"{scale},split[a][b];[a]palettegen=max_colors=128[p];[b][p]paletteuse=dither=bayer",
+            "-an",
+            "-loop", "0",
+            out,
+        ])
+    return out
+
+
+def make_sprite(video_path: str, out_path: str, duration: float, tiles: int = SPRITE_TILES) -> Dict:
+    """
+    Build a thumbnail sprite sheet (evenly spaced frames in a grid)
+
+    Returns:
+        Dict with path, columns, rows, tile size and interval (seconds per tile)
+    """
+    columns = min(SPRITE_COLUMNS, tiles)
+    rows = math.ceil(tiles / columns)
+    interval = duration / tiles if duration > 0 else 1.0
+
+    run_ffmpeg([
+        "-i", video_path,
+        "-vf", f"fps=1/{interval:.4f},scale={SPRITE_TILE_WIDTH}:-2,tile={columns}x{rows}",
+        "-frames:v", "1",
+        "-q:v", "5",
+        out_path,
+    ])
+
+    return {
+        "path": out_path,
+        "columns": columns,
+        "rows": rows,
+        "tile_width": SPRITE_TILE_WIDTH,
+        "interval": round(interval, 3),
+    }
+
+
+def make_previews(video_path: str, out_dir: str) -> Dict:
+    """
+    Generate poster, animated preview and sprite sheet for a video
+
+    Args:
+        video_path: Source mp4 path
+        out_dir: Directory to write the preview files into
+
+    Returns:
+        Dict with file names (poster/preview/sprite), sprite layout and total bytes
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    info = probe_video(video_path)
+
+    poster = out / POSTER_FILENAME
+    if not poster.exists():
+        extract_poster(video_path, str(poster), info["duration"])
+
+    preview = Path(make_animated_preview(video_path, str(out / PREVIEW_BASENAME)))
+    sprite = make_sprite(video_path, str(out / SPRITE_FILENAME), info["duration"])
+
+    result = {
+        "poster": poster.name,
+        "preview": preview.name,
+        "sprite": SPRITE_FILENAME,
+        "sprite_layout": {k: v for k, v in sprite.items() if k != "path"},
+        "bytes": sum(p.stat().st_size for p in (poster, preview, Path(sprite["path"]))),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate review previews for a video")
+    parser.add_argument("video", help="Input mp4")
+    parser.add_argument("--out", default="previews_out", help="Output directory")
+    args = parser.parse_args()
+
+    previews = make_previews(args.video, args.out)
+    print(f"Poster: {previews['poster']}")
+    print(f"Preview: {previews['preview']}")
+    print(f"Sprite: {previews['sprite']} {previews['sprite_layout']}")
+    print(f"Total: {previews['bytes'] / 1024:.1f} KB")
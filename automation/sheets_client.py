@@ -223,6 +223,11 @@ def mark_error(row_id: str, error: str):
     return update_row(row_id, {"status": "error", "error": error})
 
 
+def mark_qa_failed(row_id: str, reason: str):
+    """Mark a row as rejected by the automatic video QA"""
+    return update_row(row_id, {"status": "qa_failed", "error": f"QA: {reason}"})
+
+
 def init_sheet():
     """Initialize sheet with headers if empty"""
     service = get_service()
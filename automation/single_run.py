@@ -7,6 +7,7 @@ import argparse
 import random
 import base64
 import os
+import sys
 from datetime import datetime
 from pathlib import Path
 
@@ -15,14 +16,31 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from accounts import get_account, list_accounts, DEFAULT_ACCOUNT
-from config import DEFAULT_DURATION, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_STEPS
+from config import DEFAULT_DURATION, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_STEPS, PREVIEWS_ENABLED, QA_ENABLED, DEDUP_ENABLED
+from config import OUTPUT_RETENTION_GB, OUTPUT_RETENTION_DAYS, LONG_VIDEO_CACHE_DIR
+from config import METRICS_PATH, PUSHGATEWAY_URL
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from retention import GB, RetentionManager
+import metrics
 
 # Output folder for generated videos
 OUTPUT_DIR = Path(__file__).parent / "output"
 OUTPUT_DIR.mkdir(exist_ok=True)
+
+# Oldest videos/previews are removed past the quota or age limit
+output_retention = RetentionManager(
+    str(OUTPUT_DIR),
+    quota_bytes=int(OUTPUT_RETENTION_GB * GB),
+    ttl_seconds=OUTPUT_RETENTION_DAYS * 86400,
+    exclude={Path(LONG_VIDEO_CACHE_DIR).name},
+)
 import grok_client
 import sheets_client
 import ltx_client
+import previews
+import video_qa
+import video_index
 
 # Later client import (will fail gracefully if not configured)
 try:
@@ -135,12 +153,67 @@ def run_single(account_id: str = None, skip_post: bool = False):
 
         video_bytes = base64.b64decode(video_b64)
 
-        # Save video locally
+        # QA before saving / posting (regenerate with a new seed on failure)
+        if QA_ENABLED:
+            def regenerate(seed):
+                video, metadata = ltx_client.generate_video(
+                    prompt=prompt_data["prompt"],
+                    duration=DEFAULT_DURATION,
+                    width=DEFAULT_WIDTH,
+                    height=DEFAULT_HEIGHT,
+                    steps=DEFAULT_STEPS,
+                    seed=seed,
+                )
+                if row_id:
+                    sheets_client.mark_generating(row_id, metadata["job_id"])
+                return video, metadata["cost"], metadata["job_id"]
+
+            video_bytes, qa, extra_cost, retry_job_id = video_qa.qa_with_retry(video_bytes, regenerate, DEFAULT_DURATION)
+            cost += extra_cost
+            job_id = retry_job_id or job_id
+            if not qa["passed"]:
+                print(f"  QA FAILED: {qa['reason']}")
+                if row_id:
+                    sheets_client.mark_qa_failed(row_id, qa["reason"])
+                return {"status": "qa_failed", "phase": "qa", "error": qa["reason"], "cost": cost}
+            print(f"  QA passed (motion {qa['metrics']['motion_energy']})")
+
+        # Block near-duplicates of any past video (all accounts)
+        signature = None
+        if DEDUP_ENABLED:
+            index = video_index.VideoIndex()
+            signature = video_index.fingerprint_bytes(video_bytes)
+            dup = index.find_duplicate(signature)
+            if dup:
+                reason = f"near-duplicate of {dup['id']} ({dup['account']}, distance {dup['distance']})"
+                print(f"  DUPLICATE: {reason}")
+                if row_id:
+                    sheets_client.mark_qa_failed(row_id, reason)
+                return {"status": "qa_failed", "phase": "dedup", "error": reason, "cost": cost}
+
+        # Save video locally (make room first)
+        output_retention.ensure_space(len(video_bytes))
         timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         video_filename = f"{account_id or DEFAULT_ACCOUNT}_{timestamp}.mp4"
         video_path = OUTPUT_DIR / video_filename
         video_path.write_bytes(video_bytes)
         print(f"  Saved: {video_path}")
+        if signature is not None:
+            index.add(signature, video_filename, account_id or DEFAULT_ACCOUNT, str(video_path))
+
+        # Review previews next to the video (poster / animated preview / sprite)
+        preview_files = {}
+        if PREVIEWS_ENABLED:
+            try:
+                preview_dir = OUTPUT_DIR / video_path.stem
+                review = previews.make_previews(str(video_path), str(preview_dir))
+                preview_files = {
+                    key: str(preview_dir / review[key])
+                    for key in ("poster", "preview", "sprite")
+                }
+                print(f"  Previews: {preview_dir} ({review['bytes'] / 1024:.1f} KB)")
+            except Exception as e:
+                print(f"  Warning: Could not generate previews: {e}")
 
         # Update sheets
         if row_id:
@@ -210,6 +283,7 @@ def run_single(account_id: str = None, skip_post: bool = False):
         "job_id": job_id,
         "cost": cost,
         "video_path": str(video_path),
+        "previews": preview_files,
     }
 
 
@@ -240,7 +314,10 @@ def main():
             print(f"  - {acc_id}: {acc['name']}")
         return
 
-    result = run_single(args.account, args.skip_post)
+    with metrics.REGISTRY.histogram("ltx_stage_seconds", "Latency per stage", ("stage",)).time(stage="total"):
+        result = run_single(args.account, args.skip_post)
+    metrics.REGISTRY.counter("ltx_runs_total", "Single runs by final status", ("status",)).inc(status=result["status"])
+    metrics.export("ltx_single_run", path=METRICS_PATH, pushgateway=PUSHGATEWAY_URL, account=args.account)
 
     if result["status"] == "error":
         exit(1)
@@ -0,0 +1,220 @@
+"""
+Video Index: perceptual-hash fingerprints to block near-duplicate videos
+
+Each video gets a compact signature:
+- frames: 64-bit dHash of up to DEDUP_FRAMES evenly spaced frames
+- hash:   64-bit majority vote of the frame hashes (whole-clip fingerprint)
+
+Lookups use multi-index hashing on the 64-bit clip hash: the hash is split
+into 4 x 16-bit chunks, each with its own exact-match table. Two hashes within
+Hamming distance r share at least one chunk within r // 4 bits, so a query only
+probes a few hundred table buckets instead of scanning the whole history.
+Candidates are then verified against the per-frame hashes.
+
+The index is an append-only JSONL file shared by all accounts.
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import VIDEO_INDEX_PATH, DEDUP_MAX_DISTANCE, DEDUP_FRAME_DISTANCE, DEDUP_FRAMES
+from ffmpeg_utils import probe_video, read_gray_frames
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def hamming(a: int, b: int) -> int:
+    """Hamming distance of two 64-bit hashes"""
+    return (a ^ b).bit_count()
+
+
+def dhash_frames(frames: np.ndarray) -> List[int]:
+    """
+    64-bit difference hash per frame
+
+    Args:
+        frames: uint8 array (frames, 8, 9) - already downscaled grayscale
+
+    Returns:
+        List of 64-bit ints
+    """
+    bits = frames[:, :, 1:] > frames[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(frames), 64), axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+
+def clip_hash(frame_hashes: List[int]) -> int:
+    """Majority vote of each bit across the frame hashes"""
+    if not frame_hashes:
+        return 0
+    counts = [0] * 64
+    for h in frame_hashes:
+        for bit in range(64):
+            counts[bit] += (h >> bit) & 1
+    half = len(frame_hashes) / 2
+    return sum(1 << bit for bit, c in enumerate(counts) if c > half)
+
+
+def fingerprint(video_path: str, max_frames: int = DEDUP_FRAMES) -> Dict:
+    """
+    Compute the signature of a video file
+
+    Returns:
+        Dict with hash (int) and frames (list of int)
+    """
+    duration = probe_video(video_path)["duration"] or 1.0
+    # ffmpeg が 9x8 に縮小するので Python 側はビット比較だけ
+    frames = read_gray_frames(video_path, fps=max_frames / duration, width=9, height=8)
+    frame_hashes = dhash_frames(frames[:max_frames])
+    return {"hash": clip_hash(frame_hashes), "frames": frame_hashes}
+
+
+def fingerprint_bytes(video_bytes: bytes) -> Dict:
+    """Compute the signature of in-memory mp4 bytes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.mp4")
+        with open(path, "wb") as f:
+            f.write(video_bytes)
+        return fingerprint(path)
+
+
+def frame_distance(a: List[int], b: List[int]) -> float:
+    """Mean over a's frames of the closest frame hash in b"""
+    if not a or not b:
+        return 64.0
+    return sum(min(hamming(x, y) for y in b) for x in a) / len(a)
+
+
+def _neighbors(value: int, radius: int):
+    """All CHUNK_BITS-bit values within the given Hamming radius"""
+    yield value
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            yield flipped
+
+
+class VideoIndex:
+    """Append-only fingerprint index with multi-index hash lookup"""
+
+    def __init__(self, path: str = VIDEO_INDEX_PATH):
+        self.path = Path(path)
+        self.entries: List[Dict] = []
+        self.tables = [dict() for _ in range(CHUNKS)]
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    self._insert(json.loads(line))
+
+    def _insert(self, entry: Dict):
+        entry["hash"] = int(entry["hash"], 16) if isinstance(entry["hash"], str) else entry["hash"]
+        entry["frames"] = [int(h, 16) if isinstance(h, str) else h for h in entry["frames"]]
+        idx = len(self.entries)
+        self.entries.append(entry)
+        for i, table in enumerate(self.tables):
+            chunk = (entry["hash"] >> (i * CHUNK_BITS)) & CHUNK_MASK
+            table.setdefault(chunk, []).append(idx)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find_duplicate(
+        self,
+        signature: Dict,
+        max_distance: int = DEDUP_MAX_DISTANCE,
+        max_frame_distance: float = DEDUP_FRAME_DISTANCE,
+    ) -> Optional[Dict]:
+        """
+        Find the closest indexed video within the thresholds
+
+        Returns:
+            Matching entry (with "distance" / "frame_distance") or None
+        """
+        query = signature["hash"]
+        probe_radius = max_distance // CHUNKS
+
+        candidates = set()
+        for i, table in enumerate(self.tables):
+            chunk = (query >> (i * CHUNK_BITS)) & CHUNK_MASK
+            for value in _neighbors(chunk, probe_radius):
+                candidates.update(table.get(value, ()))
+
+        best = None
+        for idx in candidates:
+            entry = self.entries[idx]
+            distance = hamming(query, entry["hash"])
+            if distance > max_distance:
+                continue
+            fd = frame_distance(signature["frames"], entry["frames"])
+            if fd <= max_frame_distance and (best is None or fd < best["frame_distance"]):
+                best = {**entry, "distance": distance, "frame_distance": round(fd, 2)}
+
+        return best
+
+    def add(self, signature: Dict, video_id: str, account_id: str = "", url: str = "") -> Dict:
+        """Append a video signature to the index (memory + JSONL file)"""
+        record = {
+            "id": video_id,
+            "account": account_id,
+            "url": url,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "hash": f"{signature['hash']:016x}",
+            "frames": [f"{h:016x}" for h in signature["frames"]],
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        self._insert(dict(record))
+        return record
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Near-duplicate video index")
+    parser.add_argument("videos", nargs="*", help="Videos to check (and add with --add)")
+    parser.add_argument("--add", action="store_true", help="Add non-duplicate videos to the index")
+    parser.add_argument("--benchmark", type=int, default=0, help="Benchmark lookup with N random entries")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        index = VideoIndex(os.devnull)
+        for n in range(args.benchmark):
+            frames = [random.getrandbits(64) for _ in range(DEDUP_FRAMES)]
+            index._insert({"id": str(n), "hash": clip_hash(frames), "frames": frames})
+        queries = [index.entries[random.randrange(len(index))] for _ in range(100)]
+        start = time.perf_counter()
+        for q in queries:
+            index.find_duplicate(q)
+        elapsed = (time.perf_counter() - start) / len(queries)
+        print(f"{len(index)} entries: {elapsed * 1000:.2f} ms / lookup")
+
+    index = VideoIndex()
+    for video in args.videos:
+        sig = fingerprint(video)
+        dup = index.find_duplicate(sig)
+        if dup:
+            print(f"{video}: DUPLICATE of {dup['id']} (distance {dup['distance']}, frames {dup['frame_distance']})")
+        else:
+            print(f"{video}: unique")
+            if args.add:
+                index.add(sig, Path(video).name)
@@ -0,0 +1,171 @@
+"""
+Video QA: cheap CPU checks to catch failed generations before upload
+
+Frames are sampled at low resolution with ffmpeg and scored with NumPy:
+- black / near-black clips (mean luminance)
+- near-static clips (inter-frame motion energy)
+- frozen segments (runs of ~identical consecutive frames)
+- garbled / noise frames (spatial high-frequency energy)
+- duration sanity (actual vs requested)
+"""
+
+import os
+import random
+import tempfile
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    QA_SAMPLE_FPS,
+    QA_SAMPLE_WIDTH,
+    QA_MIN_LUMA,
+    QA_MIN_MOTION,
+    QA_FROZEN_DIFF,
+    QA_FROZEN_MAX_SECONDS,
+    QA_MAX_NOISE,
+    QA_MIN_DURATION_RATIO,
+    QA_MAX_RETRIES,
+)
+from ffmpeg_utils import probe_video, read_gray_frames
+
+
+def compute_metrics(frames: np.ndarray, sample_fps: float = QA_SAMPLE_FPS) -> Dict:
+    """
+    Compute QA metrics from grayscale frames
+
+    Args:
+        frames: uint8 array (frames, height, width)
+        sample_fps: Rate the frames were sampled at (for segment lengths)
+
+    Returns:
+        Dict of metrics (luminance, motion, frozen, noise)
+    """
+    f = frames.astype(np.float32)
+    luma = f.mean(axis=(1, 2))
+
+    if len(f) > 1:
+        # フレーム間の平均絶対差分 = 動き量
+        diffs = np.abs(f[1:] - f[:-1]).mean(axis=(1, 2))
+    else:
+        diffs = np.zeros(0, dtype=np.float32)
+
+    # 連続して静止しているフレーム区間の最長値
+    longest = run = 0
+    for d in diffs:
+        run = run + 1 if d < QA_FROZEN_DIFF else 0
+        longest = max(longest, run)
+
+    # 空間方向の高周波エネルギー（砂嵐・ブロック崩れ検出）
+    noise = (
+        np.abs(np.diff(f, axis=2)).mean(axis=(1, 2))
+        + np.abs(np.diff(f, axis=1)).mean(axis=(1, 2))
+    ) / 2
+
+    return {
+        "frames_sampled": int(len(f)),
+        "mean_luma": round(float(luma.mean()), 2) if len(f) else 0.0,
+        "dark_ratio": round(float((luma < QA_MIN_LUMA).mean()), 3) if len(f) else 1.0,
+        "motion_energy": round(float(diffs.mean()), 3) if len(diffs) else 0.0,
+        "frozen_seconds": round(longest / sample_fps, 2),
+        "max_noise": round(float(noise.max()), 2) if len(f) else 0.0,
+    }
+
+
+def evaluate(metrics: Dict, duration: float, expected_duration: Optional[float] = None) -> list:
+    """Return the list of failure reasons (empty = passed)"""
+    reasons = []
+
+    if metrics["frames_sampled"] == 0:
+        return ["no decodable frames"]
+    if metrics["dark_ratio"] > 0.9:
+        reasons.append(f"black ({metrics['dark_ratio']:.0%} dark frames, mean luma {metrics['mean_luma']})")
+    if metrics["motion_energy"] < QA_MIN_MOTION:
+        reasons.append(f"near-static (motion {metrics['motion_energy']} < {QA_MIN_MOTION})")
+    if metrics["frozen_seconds"] > QA_FROZEN_MAX_SECONDS:
+        reasons.append(f"frozen for {metrics['frozen_seconds']}s")
+    if metrics["max_noise"] > QA_MAX_NOISE:
+        reasons.append(f"garbled frames (noise {metrics['max_noise']} > {QA_MAX_NOISE})")
+    if expected_duration and duration < expected_duration * QA_MIN_DURATION_RATIO:
+        reasons.append(f"too short ({duration:.1f}s, expected ~{expected_duration}s)")
+
+    return reasons
+
+
+def check_video(video_path: str, expected_duration: Optional[float] = None) -> Dict:
+    """
+    Run the QA pass on a video file
+
+    Returns:
+        Dict with passed, reason (joined string), reasons, metrics
+    """
+    info = probe_video(video_path)
+    frames = read_gray_frames(video_path, QA_SAMPLE_FPS, QA_SAMPLE_WIDTH)
+
+    metrics = compute_metrics(frames)
+    metrics["duration"] = round(info["duration"], 2)
+    reasons = evaluate(metrics, info["duration"], expected_duration)
+
+    return {
+        "passed": not reasons,
+        "reason": "; ".join(reasons),
+        "reasons": reasons,
+        "metrics": metrics,
+    }
+
+
+def check_video_bytes(video_bytes: bytes, expected_duration: Optional[float] = None) -> Dict:
+    """Run the QA pass on in-memory mp4 bytes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "qa.mp4")
+        with open(path, "wb") as f:
+            f.write(video_bytes)
+        return check_video(path, expected_duration)
+
+
+def qa_with_retry(
+    video_bytes: bytes,
+    regenerate: Callable[[int], Tuple[bytes, float, str]],
+    expected_duration: Optional[float] = None,
+    max_retries: int = QA_MAX_RETRIES,
+) -> Tuple[bytes, Dict, float, Optional[str]]:
+    """
+    QA a video and regenerate with a new seed while it fails
+
+    Args:
+        video_bytes: First generated video
+        regenerate: Called with a new seed, returns (video_bytes, cost, job_id)
+        expected_duration: Requested duration in seconds
+        max_retries: Max regenerations (0 = QA only)
+
+    Returns:
+        Tuple of (final video_bytes, last QA result, extra cost spent on retries,
+        job_id of the final video if it was regenerated, else None)
+    """
+    extra_cost = 0.0
+    job_id = None
+    qa = check_video_bytes(video_bytes, expected_duration)
+
+    for attempt in range(max_retries):
+        if qa["passed"]:
+            break
+        seed = random.randint(0, 2147483647)
+        print(f"      QA failed ({qa['reason']}), regenerating with seed {seed} [{attempt + 1}/{max_retries}]")
+        video_bytes, cost, job_id = regenerate(seed)
+        extra_cost += cost
+        qa = check_video_bytes(video_bytes, expected_duration)
+
+    return video_bytes, qa, extra_cost, job_id
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="QA check a generated video")
+    parser.add_argument("video", help="Input mp4")
+    parser.add_argument("--duration", type=float, default=None, help="Expected duration (seconds)")
+    args = parser.parse_args()
+
+    result = check_video(args.video, args.duration)
+    print(json.dumps(result, indent=2))
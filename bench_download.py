@@ -0,0 +1,104 @@
+"""
+Benchmark: concurrent downloads from the Pods API server
+
+Hits /download/{job_id} with N concurrent clients and reports throughput and
+latency for three request kinds:
+
+- full:   whole file (FileResponse / sendfile path)
+- range:  1 MB byte ranges at random offsets (resume path)
+- revalidate: If-None-Match with the current ETag (304, no body)
+
+    python bench_download.py --server http://<POD_URL> --job <job_id> --concurrency 16
+
+Watch `top` on the Pod while it runs to see the server CPU cost.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import aiohttp
+
+RANGE_BYTES = 1024 * 1024
+
+
+async def fetch(session: aiohttp.ClientSession, url: str, headers: dict) -> tuple:
+    start = time.perf_counter()
+    received = 0
+    async with session.get(url, headers=headers) as resp:
+        if resp.status not in (200, 206, 304):
+            raise Exception(f"HTTP {resp.status}")
+        async for chunk in resp.content.iter_chunked(256 * 1024):
+            received += len(chunk)
+    return time.perf_counter() - start, received
+
+
+async def run_kind(url: str, kind: str, size: int, etag: str, concurrency: int, requests: int) -> dict:
+    def headers():
+        if kind == "range":
+            start = random.randrange(0, max(1, size - RANGE_BYTES))
+            return {"Range": f"bytes={start}-{start + RANGE_BYTES - 1}"}
+        if kind == "revalidate":
+            return {"If-None-Match": etag}
+        return {}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=120)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def one():
+            async with semaphore:
+                return await fetch(session, url, headers())
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(requests)))
+        wall = time.perf_counter() - start
+
+    latencies = sorted(r[0] for r in results)
+    total_bytes = sum(r[1] for r in results)
+    return {
+        "kind": kind,
+        "requests": requests,
+        "req_per_s": round(requests / wall, 1),
+        "mb_per_s": round(total_bytes / wall / 1024 / 1024, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 1),
+    }
+
+
+async def main_async(args):
+    url = f"{args.server.rstrip('/')}/download/{args.job}"
+    async with aiohttp.ClientSession() as session:
+        async with session.head(url) as resp:
+            resp.raise_for_status()
+            size = int(resp.headers["Content-Length"])
+            etag = resp.headers.get("ETag", "")
+
+    print(f"{url}: {size / 1024 / 1024:.1f} MB, ETag {etag}, concurrency {args.concurrency}")
+
+    results = []
+    for kind in args.kinds.split(","):
+        results.append(await run_kind(url, kind, size, etag, args.concurrency, args.requests))
+
+    print(f"\n{'kind':<12}{'req/s':>10}{'MB/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in results:
+        print(f"{r['kind']:<12}{r['req_per_s']:>10}{r['mb_per_s']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent /download requests")
+    parser.add_argument("--server", required=True, help="Server URL")
+    parser.add_argument("--job", required=True, help="Completed job ID to download")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64, help="Requests per kind")
+    parser.add_argument("--kinds", default="full,range,revalidate")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
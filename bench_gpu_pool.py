@@ -0,0 +1,84 @@
+"""
+Benchmark: GPU pool throughput scaling
+
+Dispatches N stub generation jobs through gpu_pool.GPUPool with 1, 2 and 4
+simulated devices. Each stub is a real child process (like the LTX CLI) that
+checks its CUDA_VISIBLE_DEVICES and sleeps for the job time, so the numbers
+include process spawn and dispatch overhead but no GPU work:
+
+    python bench_gpu_pool.py --jobs 16 --seconds 2 --gpus 1,2,4
+
+Throughput should scale roughly linearly with the device count.
+"""
+
+import argparse
+import subprocess
+import sys
+import threading
+import time
+
+from gpu_pool import GB, GPUPool, LEAST_LOADED, DISPATCH_POLICIES
+
+STUB = (
+    "import os, sys, time\n"
+    "assert os.environ['CUDA_VISIBLE_DEVICES'] == sys.argv[1], 'wrong device'\n"
+    "time.sleep(float(sys.argv[2]))\n"
+)
+
+
+def run_stub(pool: GPUPool, job_id: str, seconds: float, results: list):
+    start = time.perf_counter()
+    with pool.lease(job_id) as worker:
+        subprocess.run(
+            [sys.executable, "-c", STUB, worker.index, str(seconds)],
+            env=worker.env(), check=True,
+        )
+        device = worker.index
+    results.append((device, time.perf_counter() - start))
+
+
+def run_pool(gpu_count: int, jobs: int, seconds: float, policy: str) -> dict:
+    gpus = [{"index": str(i), "name": "stub", "total_bytes": 48 * GB} for i in range(gpu_count)]
+    pool = GPUPool(gpus, policy=policy)
+    results = []
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_stub, args=(pool, f"job{i}", seconds, results))
+        for i in range(jobs)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    per_gpu = {gpu["index"]: gpu["completed"] for gpu in pool.status()}
+    return {
+        "gpus": gpu_count,
+        "wall_s": round(wall, 2),
+        "jobs_per_min": round(jobs / wall * 60, 1),
+        "mean_latency_s": round(sum(r[1] for r in results) / len(results), 2),
+        "per_gpu": per_gpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GPU pool throughput with stub jobs")
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=2, help="Stub job time")
+    parser.add_argument("--gpus", default="1,2,4", help="Device counts to compare")
+    parser.add_argument("--policy", default=LEAST_LOADED, choices=DISPATCH_POLICIES)
+    args = parser.parse_args()
+
+    results = [run_pool(int(n), args.jobs, args.seconds, args.policy) for n in args.gpus.split(",")]
+    baseline = results[0]["jobs_per_min"] / results[0]["gpus"]
+
+    print(f"\n{'gpus':<6}{'wall s':>10}{'jobs/min':>10}{'scaling':>10}{'latency s':>12}  per-GPU jobs")
+    for r in results:
+        scaling = r["jobs_per_min"] / baseline / r["gpus"]
+        print(f"{r['gpus']:<6}{r['wall_s']:>10}{r['jobs_per_min']:>10}{scaling:>10.0%}{r['mean_latency_s']:>12}  {r['per_gpu']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: completion latency, status polling vs webhook
+
+Runs a local stand-in for the Pods API server (/generate, /status/{id} and
+callback_url) whose jobs finish after a random delay, then measures how long
+after the real completion the client notices it:
+
+    python bench_webhook.py --jobs 20 --min 2 --max 20
+
+No GPU involved - this isolates the polling/notification overhead.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+from async_client import AsyncLTXClient, PodBackend
+from webhook_receiver import WebhookReceiver
+
+
+class StandInServer:
+    """server.py と同じ形のレスポンスを返すダミーサーバー"""
+
+    def __init__(self, port: int, min_seconds: float, max_seconds: float):
+        self.port = port
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.jobs = {}
+        self.status_requests = 0
+        self._runner = None
+        self._tasks = set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/generate", self.generate)
+        app.router.add_get("/status/{job_id}", self.status)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await self._runner.cleanup()
+
+    def _status(self, job_id: str) -> dict:
+        job = self.jobs[job_id]
+        done = job["completed_at"] is not None
+        return {
+            "job_id": job_id,
+            "status": "completed" if done else "processing",
+            "result": {"completed_at": job["completed_at"]} if done else None,
+        }
+
+    async def generate(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        job_id = uuid.uuid4().hex[:8]
+        self.jobs[job_id] = {"completed_at": None}
+        task = asyncio.create_task(self._run(job_id, body.get("callback_url")))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({"job_id": job_id, "status": "pending"})
+
+    async def _run(self, job_id: str, callback_url):
+        await asyncio.sleep(random.uniform(self.min_seconds, self.max_seconds))
+        self.jobs[job_id]["completed_at"] = time.time()
+        if callback_url:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(callback_url, json=self._status(job_id)):
+                    pass
+
+    async def status(self, request: web.Request) -> web.Response:
+        self.status_requests += 1
+        return web.json_response(self._status(request.match_info["job_id"]))
+
+
+async def run_mode(server: StandInServer, jobs: int, webhook_port: int = None) -> dict:
+    server.status_requests = 0
+    client = AsyncLTXClient(PodBackend(f"http://127.0.0.1:{server.port}"))
+    receiver = None
+    if webhook_port:
+        receiver = WebhookReceiver(host="127.0.0.1", port=webhook_port)
+        await receiver.start()
+        client.attach_receiver(receiver)
+
+    latencies = []
+    async with client:
+        handles = await client.submit_many([{"prompt": f"job {i}"} for i in range(jobs)])
+        async for job in client.as_completed(handles, timeout=300):
+            latencies.append(time.time() - job.data["result"]["completed_at"])
+
+    if receiver:
+        await receiver.stop()
+
+    latencies.sort()
+    return {
+        "mode": "webhook" if webhook_port else "polling",
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "status_requests": server.status_requests,
+    }
+
+
+async def main_async(args):
+    server = StandInServer(args.port, args.min, args.max)
+    await server.start()
+    try:
+        results = [
+            await run_mode(server, args.jobs),
+            await run_mode(server, args.jobs, webhook_port=args.webhook_port),
+        ]
+    finally:
+        await server.stop()
+
+    print(f"\n{'mode':<10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'status reqs':>14}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['mean_ms']:>10}{r['p95_ms']:>10}{r['max_ms']:>10}{r['status_requests']:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark webhook vs polling completion latency")
+    parser.add_argument("--jobs", type=int, default=20, help="Jobs per mode")
+    parser.add_argument("--min", type=float, default=2, help="Min stand-in job time (s)")
+    parser.add_argument("--max", type=float, default=20, help="Max stand-in job time (s)")
+    parser.add_argument("--port", type=int, default=18000, help="Stand-in server port")
+    parser.add_argument("--webhook-port", type=int, default=18787, help="Webhook receiver port")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Shape buckets (server.py / handler.py)
+
+リクエストの解像度・フレーム数を決まったバケットに丸めて生成し、
+後処理で要求サイズへ戻す。生成する形を少数に絞ることで、常駐エンジンの
+アロケータ / コンパイル / latent のキャッシュが効くようにする。
+
+- 解像度: 要求と縦横比が最も近く、要求を覆う（幅・高さとも以上）最小のバケット
+  覆えるものがなければ縦横比が最も近い最大のバケット
+- フレーム数: 要求以上で最小のバケット（どれも足りなければ要求どおり）
+  低fpsモードはバケットが粗すぎて減らした分を食うので丸めない (frame_buckets=False)
+- 戻し方 (fit):
+  crop = 拡大縮小して中央を切り出す / pad = 収まるように縮小して黒帯 / none = バケットのまま返す
+  フレーム数は要求の長さで切る（none 以外）
+
+SHAPE_BUCKETS / FRAME_BUCKETS で変更、SHAPE_BUCKETS を空にすると無効。
+"""
+
+import os
+import shutil
+import subprocess
+import time
+from typing import Dict, List, Tuple
+
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
+
+FITS = ("crop", "pad", "none")
+
+DEFAULT_SHAPE_BUCKETS = "1280x720,720x1280,1280x768,768x1280,1024x576,576x1024,960x960,1920x1088,1088x1920"
+DEFAULT_FRAME_BUCKETS = "49,73,97,121,169,241,361"
+
+
+def parse_shapes(spec: str) -> List[Tuple[int, int]]:
+    shapes = []
+    for item in spec.split(","):
+        if item.strip():
+            width, height = item.strip().lower().split("x")
+            shapes.append((int(width), int(height)))
+    return shapes
+
+
+def parse_frames(spec: str) -> List[int]:
+    return sorted(int(item) for item in spec.split(",") if item.strip())
+
+
+SHAPE_BUCKETS = parse_shapes(os.environ.get("SHAPE_BUCKETS", DEFAULT_SHAPE_BUCKETS))
+FRAME_BUCKETS = parse_frames(os.environ.get("FRAME_BUCKETS", DEFAULT_FRAME_BUCKETS))
+
+
+def _aspect_distance(shape: Tuple[int, int], width: int, height: int) -> float:
+    return abs(shape[0] / shape[1] - width / height)
+
+
+def snap_shape(width: int, height: int, shapes: List[Tuple[int, int]] = None) -> Tuple[int, int]:
+    """解像度をバケットに丸める（バケットがなければそのまま）"""
+    shapes = SHAPE_BUCKETS if shapes is None else shapes
+    if not shapes or (width, height) in shapes:
+        return width, height
+
+    # 縦横比が近いもの（差 0.05 以内）を候補に、なければ最も近い比率のもの
+    best = min(_aspect_distance(s, width, height) for s in shapes)
+    similar = [s for s in shapes if _aspect_distance(s, width, height) <= best + 0.05]
+    covering = [s for s in similar if s[0] >= width and s[1] >= height]
+    if covering:
+        return min(covering, key=lambda s: (s[0] * s[1], _aspect_distance(s, width, height)))
+    return max(similar, key=lambda s: (s[0] * s[1], -_aspect_distance(s, width, height)))
+
+
+def snap_frame_count(num_frames: int, frames: List[int] = None) -> int:
+    """フレーム数をバケットに丸める（要求以上の最小、なければそのまま）"""
+    frames = FRAME_BUCKETS if frames is None else frames
+    larger = [f for f in frames if f >= num_frames]
+    return min(larger) if larger else num_frames
+
+
+def plan(width: int, height: int, num_frames: int, fit: str = "crop", frame_buckets: bool = True) -> Dict:
+    """
+    生成する形を決める
+
+    frame_buckets: False ならフレーム数は要求どおり（解像度だけ丸める）
+
+    Returns:
+        {"name", "width", "height", "frames", "fit", "exact",
+         "requested": {"width", "height", "frames"}}
+    """
+    if fit not in FITS:
+        raise ValueError(f"Unknown bucket fit '{fit}'. Available: {list(FITS)}")
+    bucket_width, bucket_height = snap_shape(width, height)
+    bucket_frames = snap_frame_count(num_frames) if frame_buckets else num_frames
+    return {
+        "name": f"{bucket_width}x{bucket_height}x{bucket_frames}",
+        "width": bucket_width,
+        "height": bucket_height,
+        "frames": bucket_frames,
+        "fit": fit,
+        "exact": (bucket_width, bucket_height, bucket_frames) == (width, height, num_frames),
+        "requested": {"width": width, "height": height, "frames": num_frames},
+    }
+
+
+def exact_plan(width: int, height: int, num_frames: int) -> Dict:
+    """バケットを使わない（要求どおりに生成）"""
+    return {
+        "name": f"{width}x{height}x{num_frames}",
+        "width": width,
+        "height": height,
+        "frames": num_frames,
+        "fit": "none",
+        "exact": True,
+        "requested": {"width": width, "height": height, "frames": num_frames},
+    }
+
+
+def needs_restore(bucket: Dict) -> bool:
+    return not bucket["exact"] and bucket["fit"] != "none"
+
+
+def restore(input_path: str, output_path: str, bucket: Dict, fps: float) -> float:
+    """
+    バケットで生成した動画を要求サイズ / 長さへ戻す (ffmpeg)
+
+    Returns:
+        かかった秒数
+    """
+    requested = bucket["requested"]
+    width, height = requested["width"], requested["height"]
+    if bucket["fit"] == "crop":
+        video_filter = f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height}"
+    else:
+        video_filter = (
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+        )
+    if (bucket["width"], bucket["height"]) == (width, height):
+        video_filter = "null"
+
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", input_path,
+        "-vf", video_filter,
+        "-frames:v", str(requested["frames"]),
+        "-t", f"{requested['frames'] / fps:.3f}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    start = time.time()
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=900)
+    if result.returncode != 0:
+        raise Exception(f"Bucket restore failed: {result.stderr[-2000:]}")
+    return time.time() - start
@@ -6,9 +6,11 @@ Pods API Server 用
 import os
 import time
 import base64
-import requests
 import argparse
 
+from async_client import JobFailed, pod_client, run_sync, iterate_sync
+from webhook_receiver import enable_webhooks
+
 
 def generate_video_sync(
     server_url: str,
@@ -39,15 +41,12 @@ def generate_video_sync(
     print("Generating...")
 
     start_time = time.time()
-    response = requests.post(url, json=payload, timeout=600)
-
-    if response.status_code != 200:
-        print(f"Error: {response.status_code}")
-        print(response.text)
+    try:
+        result = run_sync(pod_client(server_url).request_json("POST", url, json=payload, timeout=600))
+    except Exception as e:
+        print(f"Error: {e}")
         return None
 
-    result = response.json()
-
     if result.get("status") != "success":
         print(f"Error: {result.get('error')}")
         return None
@@ -77,11 +76,17 @@ def generate_video_async(
     seed: int = None,
     output_path: str = "output.mp4",
     poll_interval: int = 5,
+    webhook_url: str = None,
+    webhook_port: int = 8787,
 ):
-    """動画生成（非同期・ポーリング）"""
+    """
+    動画生成（非同期・ポーリング）
+
+    webhook_url: サーバーから届くこのマシンのURL（webhook_port に転送されるもの）。
+        指定すると完了通知で即座に起き、ポーリングはフォールバックのみになる
+    """
 
     # ジョブ投入
-    url = f"{server_url}/generate"
     payload = {
         "prompt": prompt,
         "negative_prompt": negative_prompt,
@@ -94,52 +99,51 @@ def generate_video_async(
     print(f"Server: {server_url}")
     print(f"Prompt: {prompt}")
 
-    response = requests.post(url, json=payload)
-    if response.status_code != 200:
-        print(f"Error: {response.status_code}")
+    client = pod_client(server_url, poll_max=poll_interval)
+    if webhook_url and client.receiver is None:
+        enable_webhooks(client, webhook_port, webhook_url)
+    try:
+        job = run_sync(client.submit(payload))
+    except Exception as e:
+        print(f"Error: {e}")
         return None
 
-    job_id = response.json().get("job_id")
-    print(f"Job ID: {job_id}")
+    print(f"Job ID: {job.id}")
 
-    # ステータスポーリング
+    # ステータスポーリング（間隔は poll_interval まで徐々に伸ばす）
     start_time = time.time()
-    while True:
-        status_url = f"{server_url}/status/{job_id}"
-        status_resp = requests.get(status_url)
-        status = status_resp.json()
-
+    for update in iterate_sync(client.updates([job])):
+        status = update.data
         print(f"  Status: {status['status']} - {status.get('progress', '')}")
 
-        if status["status"] == "completed":
-            # ダウンロード
-            download_url = f"{server_url}/download/{job_id}"
-            video_resp = requests.get(download_url)
-            with open(output_path, "wb") as f:
-                f.write(video_resp.content)
-
-            elapsed = time.time() - start_time
-            print(f"Saved: {output_path}")
-            print(f"Time: {elapsed:.1f}s")
-            return output_path
+    try:
+        result = job.result().get("result") or {}
+    except JobFailed as e:
+        print(f"Error: {e.error}")
+        return None
 
-        elif status["status"] == "failed":
-            print(f"Error: {status.get('error')}")
-            return None
+    # ダウンロード（ファイルへ直接書き込み、切断時は続きから再開・sha256 検証）
+    run_sync(client.download(
+        client.backend.download_url(job.id),
+        output_path,
+        expected_size=result.get("size"),
+        expected_sha256=result.get("sha256"),
+    ))
 
-        time.sleep(poll_interval)
+    elapsed = time.time() - start_time
+    print(f"Saved: {output_path}")
+    print(f"Time: {elapsed:.1f}s")
+    return output_path
 
 
 def check_health(server_url: str):
     """サーバーヘルスチェック"""
     try:
-        response = requests.get(f"{server_url}/health", timeout=5)
-        if response.status_code == 200:
-            info = response.json()
-            print(f"Status: {info['status']}")
-            print(f"Model loaded: {info['model_loaded']}")
-            print(f"GPU: {info['gpu_name']}")
-            return True
+        info = run_sync(pod_client(server_url).health())
+        print(f"Status: {info['status']}")
+        print(f"Model loaded: {info['model_loaded']}")
+        print(f"GPU: {info['gpu_name']}")
+        return True
     except Exception as e:
         print(f"Server not reachable: {e}")
     return False
@@ -157,6 +161,9 @@ def main():
     parser.add_argument("--output", type=str, default="output.mp4", help="出力ファイル")
     parser.add_argument("--async", dest="async_mode", action="store_true", help="非同期モード")
     parser.add_argument("--health", action="store_true", help="ヘルスチェックのみ")
+    parser.add_argument("--webhook-url", type=str, default=os.environ.get("LTX2_WEBHOOK_URL"),
+                        help="完了通知の受信URL（非同期モード、サーバーから到達できること）")
+    parser.add_argument("--webhook-port", type=int, default=8787, help="完了通知の待受ポート")
     args = parser.parse_args()
 
     # 環境変数からも取得可能
@@ -187,6 +194,8 @@ def main():
             height=args.height,
             seed=args.seed,
             output_path=args.output,
+            webhook_url=args.webhook_url,
+            webhook_port=args.webhook_port,
         )
     else:
         generate_video_sync(
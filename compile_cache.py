@@ -0,0 +1,376 @@
+"""
+Compile artifact cache (server.py)
+
+torch.compile / Triton の自動チューニング結果をシェイプバケットごとに
+Network Volume 上へ保存し、Pod をまたいで使い回す。
+
+- キー: バケット名 (WxHxF) + バージョン指紋（torch / CUDA / ドライバ / GPU / モデルファイル）
+  バージョンが変わると別のキーになり、古いエントリは LRU で消える
+- 生成の子プロセスには TORCHINDUCTOR_CACHE_DIR / TRITON_CACHE_DIR でエントリを渡す
+- max_entries / max_bytes を超えたら最終使用が古い順に削除（使用中は除く）
+  コンパイルが何も書かなかった / 途中で失敗したエントリのディレクトリも一定時間後に削除
+- prewarm(): よく使われたバケットを起動時にバックグラウンドでコンパイル
+- 索引 (index.json) は flock + アトミック置換で複数 Pod から更新
+
+コンパイラは差し替え可能（compiler(bucket, env)）。CPU だけで動作確認するには:
+
+    python compile_cache.py --demo
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+# 未完成のエントリを消すまでの猶予（他の Pod がコンパイル中かもしれないので、最長のコンパイルより長く）
+STALE_SECONDS = 3600
+
+
+def default_versions(python: Optional[str] = None, model_paths: Iterable[str] = ()) -> Dict:
+    """
+    コンパイル結果に影響するバージョン
+
+    python: 生成に使う Python（LTX の venv。サーバーと torch が違うため）
+    model_paths: チェックポイント（名前・サイズ・更新時刻で識別、中身は読まない）
+    """
+    versions = {}
+    try:
+        out = subprocess.run(
+            [python or "python", "-c", "import torch; print(torch.__version__, torch.version.cuda)"],
+            capture_output=True, text=True, timeout=60,
+        ).stdout.split()
+        versions["torch"], versions["cuda"] = (out + [None, None])[:2]
+    except (OSError, subprocess.TimeoutExpired):
+        versions["torch"] = versions["cuda"] = None
+
+    nvidia_smi = shutil.which("nvidia-smi")
+    if nvidia_smi:
+        try:
+            out = subprocess.run(
+                [nvidia_smi, "--query-gpu=driver_version,name", "--format=csv,noheader"],
+                capture_output=True, text=True, timeout=10,
+            ).stdout.strip().splitlines()
+            if out:
+                versions["driver"], versions["gpu"] = [v.strip() for v in out[0].split(",", 1)]
+        except (OSError, subprocess.TimeoutExpired, ValueError):
+            pass
+
+    models = []
+    for path in model_paths:
+        try:
+            stat = os.stat(path)
+            models.append(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}")
+        except OSError:
+            models.append(f"{os.path.basename(path)}:missing")
+    versions["models"] = sorted(models)
+    return versions
+
+
+def fingerprint(versions: Dict) -> str:
+    canonical = json.dumps(versions, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class CompileCache:
+    """シェイプバケット単位のコンパイル結果キャッシュ"""
+
+    def __init__(
+        self,
+        root: str,
+        max_entries: int = 16,
+        max_bytes: Optional[int] = None,
+        versions: Union[Dict, Callable[[], Dict], None] = None,
+    ):
+        self.root = Path(root)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._versions = versions
+        self._fingerprint: Optional[str] = None
+        self._in_use: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prewarmed = 0
+        self._prewarm_thread: Optional[threading.Thread] = None
+
+    # --- キー ---
+
+    @property
+    def fingerprint(self) -> str:
+        """バージョン指紋（初回に計算）"""
+        if self._fingerprint is None:
+            versions = self._versions() if callable(self._versions) else (self._versions or {})
+            self._fingerprint = fingerprint(versions)
+        return self._fingerprint
+
+    def key(self, bucket: str) -> str:
+        return f"{bucket}-{self.fingerprint}"
+
+    def entry_dir(self, bucket: str) -> Path:
+        return self.root / self.key(bucket)
+
+    # --- 索引 ---
+
+    @contextmanager
+    def _index(self):
+        """索引を排他的に読み書き（with の中で dict を書き換える）"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                path = self.root / INDEX_FILE
+                try:
+                    index = json.loads(path.read_text())
+                except (FileNotFoundError, ValueError):
+                    index = {}
+                yield index
+                fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".index-")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(index, f, indent=1)
+                os.replace(tmp, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self) -> Dict:
+        try:
+            return json.loads((self.root / INDEX_FILE).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    # --- 利用 ---
+
+    def lookup(self, bucket: str, prewarm: bool = False) -> bool:
+        """
+        コンパイル済みか（ヒット / ミスを記録）
+
+        prewarm: 事前コンパイルからの確認。実際のリクエストではないので
+            ヒット / ミスにも利用回数（prewarm の順位付け）にも数えない
+        """
+        key = self.key(bucket)
+        with self._index() as index:
+            entry = index.setdefault(key, {
+                "bucket": bucket, "fingerprint": self.fingerprint, "ready": False,
+                "created": time.time(), "uses": 0, "size_bytes": 0,
+            })
+            if not prewarm:
+                entry["uses"] += 1
+            entry["last_used"] = time.time()
+            hit = entry["ready"] and self.entry_dir(bucket).is_dir()
+        if not prewarm:
+            with self._lock:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return hit
+
+    @contextmanager
+    def use(self, bucket: str, prewarm: bool = False):
+        """
+        生成の間エントリを使う（env を子プロセスに渡す）
+
+        成功してコンパイル結果が書かれていたらエントリをコンパイル済みにしてサイズを記録し、
+        上限を超えた分を削除する（空のままならコンパイル済みにしない）。
+
+        Yields:
+            {"hit": bool, "env": {...}}
+        """
+        key = self.key(bucket)
+        path = self.entry_dir(bucket)
+        hit = self.lookup(bucket, prewarm=prewarm)
+        path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield {
+                "hit": hit,
+                "env": {
+                    "TORCHINDUCTOR_CACHE_DIR": str(path / "inductor"),
+                    "TRITON_CACHE_DIR": str(path / "triton"),
+                },
+            }
+            size = _dir_size(path)
+            if size > 0:
+                with self._index() as index:
+                    entry = index.get(key)
+                    if entry is not None:
+                        entry.update(ready=True, size_bytes=size)
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+        self.evict()
+
+    def evict(self) -> List[str]:
+        """
+        上限を超えた分を最終使用が古い順に削除（使用中は残す）
+
+        コンパイル済みにならないまま STALE_SECONDS 使われていないエントリのディレクトリも消す
+        """
+        removed = []
+        with self._index() as index:
+            stale = time.time() - STALE_SECONDS
+            for key, entry in index.items():
+                if entry["ready"] or entry.get("last_used", 0) > stale or not (self.root / key).is_dir():
+                    continue
+                with self._lock:
+                    if self._in_use.get(key):
+                        continue
+                shutil.rmtree(self.root / key, ignore_errors=True)
+                removed.append(key)
+
+            ready = sorted(
+                (k for k, e in index.items() if e["ready"]),
+                key=lambda k: index[k].get("last_used", 0),
+            )
+            total = sum(index[k]["size_bytes"] for k in ready)
+            kept = len(ready)
+            for key in ready:
+                over_count = kept > self.max_entries
+                over_bytes = self.max_bytes is not None and total > self.max_bytes
+                if not (over_count or over_bytes):
+                    break
+                with self._lock:
+                    if self._in_use.get(key):
+                        continue
+                shutil.rmtree(self.root / key, ignore_errors=True)
+                total -= index[key]["size_bytes"]
+                kept -= 1
+                # 利用回数は prewarm の順位付けに使うので残し、未コンパイルに戻す
+                index[key].update(ready=False, size_bytes=0)
+                removed.append(key)
+        if removed:
+            print(f"[COMPILE_CACHE] Evicted {len(removed)} entries: {', '.join(removed)}", flush=True)
+        return removed
+
+    # --- 事前コンパイル ---
+
+    def top_buckets(self, n: int) -> List[str]:
+        """よく使われたバケット（バージョンをまたいで集計）"""
+        uses: Dict[str, int] = {}
+        for entry in self._read_index().values():
+            uses[entry["bucket"]] = uses.get(entry["bucket"], 0) + entry["uses"]
+        return sorted(uses, key=lambda b: -uses[b])[:n]
+
+    def prewarm(
+        self,
+        buckets: List[str],
+        compiler: Callable[[str, Dict], None],
+        background: bool = True,
+    ) -> Optional[threading.Thread]:
+        """
+        まだコンパイルされていないバケットを compiler(bucket, env) で順にコンパイル
+
+        background なら起動を待たせないようスレッドで実行して返す
+        """
+        def run():
+            for bucket in buckets:
+                if self.is_ready(bucket):
+                    continue
+                try:
+                    start = time.time()
+                    with self.use(bucket, prewarm=True) as entry:
+                        compiler(bucket, entry["env"])
+                    if not self.is_ready(bucket):
+                        raise RuntimeError("compiler wrote no artifacts")
+                    self.prewarmed += 1
+                    print(f"[COMPILE_CACHE] Prewarmed {bucket} in {time.time() - start:.1f}s", flush=True)
+                except Exception as e:
+                    print(f"[COMPILE_CACHE] Prewarm of {bucket} failed: {e}", flush=True)
+
+        if not background:
+            run()
+            return None
+        self._prewarm_thread = threading.Thread(target=run, name="compile-prewarm", daemon=True)
+        self._prewarm_thread.start()
+        return self._prewarm_thread
+
+    def is_ready(self, bucket: str) -> bool:
+        entry = self._read_index().get(self.key(bucket))
+        return bool(entry and entry["ready"] and self.entry_dir(bucket).is_dir())
+
+    # --- 集計 ---
+
+    def stats(self) -> Dict:
+        """/health 用"""
+        index = self._read_index()
+        current = [e for e in index.values() if e["fingerprint"] == self.fingerprint and e["ready"]]
+        lookups = self.hits + self.misses
+        return {
+            "root": str(self.root),
+            "fingerprint": self.fingerprint,
+            "entries": len(current),
+            "bytes": sum(e["size_bytes"] for e in current),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "prewarmed": self.prewarmed,
+        }
+
+
+def _stub_compiler(bucket: str, env: Dict):
+    """CPU 用のダミー: シェイプに比例したファイルを書いて少し待つ"""
+    width, height, frames = (int(v) for v in bucket.split("x"))
+    target = Path(env["TORCHINDUCTOR_CACHE_DIR"])
+    target.mkdir(parents=True, exist_ok=True)
+    (target / "graph.bin").write_bytes(b"\0" * (width * height * frames // 10000))
+    time.sleep(0.05)
+
+
+def demo(entries: int = 3):
+    """スタブのコンパイラで索引・LRU・ヒット率・事前コンパイルの動作を確認"""
+    with tempfile.TemporaryDirectory() as root:
+        cache = CompileCache(root, max_entries=entries, versions={"torch": "stub"})
+        workload = ["1280x720x121"] * 5 + ["720x1280x121"] * 3 + ["960x960x97"] * 2 + ["1920x1088x241", "576x1024x361"]
+        for bucket in workload:
+            with cache.use(bucket) as entry:
+                if not entry["hit"]:
+                    _stub_compiler(bucket, entry["env"])
+        print("after workload:", cache.stats())
+
+        # バージョンが変わった新しいワーカー: 上位バケットを事前コンパイル
+        upgraded = CompileCache(root, max_entries=entries, versions={"torch": "stub-2"})
+        top = upgraded.top_buckets(2)
+        upgraded.prewarm(top, _stub_compiler, background=False)
+        for bucket in top:
+            with upgraded.use(bucket) as entry:
+                print(f"{bucket}: {'hit' if entry['hit'] else 'miss'}")
+        print("after prewarm:", upgraded.stats())
+        print("on disk:", sorted(p.name for p in Path(root).iterdir() if p.is_dir()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile artifact cache")
+    parser.add_argument("--root", help="Cache directory to inspect")
+    parser.add_argument("--demo", action="store_true", help="Run the stub-compiler demo (CPU only)")
+    args = parser.parse_args()
+
+    if args.demo:
+        demo()
+    elif args.root:
+        index = json.loads((Path(args.root) / INDEX_FILE).read_text())
+        for key, entry in sorted(index.items(), key=lambda item: -item[1].get("last_used", 0)):
+            state = "ready" if entry["ready"] else "-"
+            print(f"{key:<40}{state:>7}{entry['uses']:>7} uses{entry['size_bytes'] / 1024 / 1024:>10.1f} MB")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
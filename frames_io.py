@@ -0,0 +1,196 @@
+"""
+Frame-sequence output (server.py / handler.py)
+
+生成した mp4 をデコード済みのフレーム配列 (.npy, uint8, T×H×W×3 RGB) と音声 (.wav) にして書き出す。
+後段（QA・補間・合成）は np.load(path, mmap_mode="r") で開くだけでフレームを読め、再デコードが要らない。
+
+- 出力形式 (output_format): mp4 = 動画のみ / mp4+frames = 両方 / frames = フレームと音声のみ
+- フレームは ffmpeg の rawvideo を1フレームずつメモリマップに書き込む（全体をメモリに載せない）
+- 一時ファイルに書いてから rename（読み手が書きかけを開かない）
+- 音声がない動画は wav を作らない
+- contact_sheet(): 数フレームを横に並べた JPEG（生成途中のプレビュー用）
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
+FFPROBE = shutil.which("ffprobe") or "ffprobe"
+
+OUTPUT_FORMATS = ("mp4", "mp4+frames", "frames")
+
+
+def wants_frames(output_format: str) -> bool:
+    return output_format in ("mp4+frames", "frames")
+
+
+def wants_mp4(output_format: str) -> bool:
+    return output_format in ("mp4", "mp4+frames")
+
+
+def estimate_bytes(width: int, height: int, num_frames: int) -> int:
+    """フレーム配列のサイズ（空き確保用）"""
+    return width * height * 3 * num_frames
+
+
+def probe(video_path: str) -> Dict:
+    """
+    Returns:
+        {"width", "height", "frames", "fps", "has_audio"}
+    """
+    cmd = [
+        FFPROBE, "-v", "error",
+        "-count_packets",
+        "-show_entries", "stream=codec_type,width,height,nb_read_packets,r_frame_rate",
+        "-of", "json",
+        video_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe failed: {result.stderr[-2000:]}")
+    streams = json.loads(result.stdout)["streams"]
+    video = next(s for s in streams if s["codec_type"] == "video")
+    num, _, den = video["r_frame_rate"].partition("/")
+    return {
+        "width": int(video["width"]),
+        "height": int(video["height"]),
+        "frames": int(video["nb_read_packets"]),
+        "fps": float(num) / float(den or 1),
+        "has_audio": any(s["codec_type"] == "audio" for s in streams),
+    }
+
+
+def write_frames(video_path: str, npy_path: str, info: Optional[Dict] = None) -> tuple:
+    """
+    フレームを .npy (uint8, T×H×W×3) に書き出す
+
+    Returns:
+        配列の shape
+    """
+    info = info or probe(video_path)
+    width, height = info["width"], info["height"]
+    frame_bytes = width * height * 3
+    tmp_path = f"{npy_path}.tmp"
+
+    frames = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(info["frames"], height, width, 3))
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error",
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-f", "rawvideo", "-pix_fmt", "rgb24",
+        "-",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    count = 0
+    try:
+        while count < info["frames"]:
+            buffer = proc.stdout.read(frame_bytes)
+            if len(buffer) < frame_bytes:
+                break
+            frames[count] = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+            count += 1
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode("utf-8", "replace")
+        returncode = proc.wait(timeout=60)
+    except BaseException:
+        proc.kill()
+        del frames
+        os.unlink(tmp_path)
+        raise
+    frames.flush()
+
+    if returncode != 0 and count == 0:
+        del frames
+        os.unlink(tmp_path)
+        raise Exception(f"Frame decode failed: {stderr[-2000:]}")
+
+    if count < info["frames"]:
+        # パケット数よりデコードできたフレームが少ない: 実際の枚数で作り直す
+        trimmed = np.lib.format.open_memmap(f"{tmp_path}.trim", mode="w+", dtype=np.uint8, shape=(count, height, width, 3))
+        trimmed[:] = frames[:count]
+        trimmed.flush()
+        del trimmed
+        del frames
+        os.replace(f"{tmp_path}.trim", tmp_path)
+    else:
+        del frames
+
+    os.replace(tmp_path, npy_path)
+    return (count, height, width, 3)
+
+
+def write_audio(video_path: str, wav_path: str):
+    """音声を 16bit PCM の WAV に書き出す"""
+    tmp_path = f"{wav_path}.tmp.wav"
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", video_path,
+        "-map", "0:a:0",
+        "-c:a", "pcm_s16le",
+        tmp_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise Exception(f"Audio extraction failed: {result.stderr[-2000:]}")
+    os.replace(tmp_path, wav_path)
+
+
+def export(video_path: str, base_path: str) -> Dict:
+    """
+    mp4 から {base_path}.npy と {base_path}.wav を作る
+
+    Returns:
+        {"frames_path", "frames_shape", "audio_path" (なければ None), "fps", "seconds"}
+    """
+    start = time.time()
+    info = probe(video_path)
+    frames_path = f"{base_path}.npy"
+    shape = write_frames(video_path, frames_path, info)
+    audio_path = None
+    if info["has_audio"]:
+        audio_path = f"{base_path}.wav"
+        write_audio(video_path, audio_path)
+    return {
+        "frames_path": frames_path,
+        "frames_shape": list(shape),
+        "audio_path": audio_path,
+        "fps": info["fps"],
+        "seconds": round(time.time() - start, 2),
+    }
+
+
+def load_frames(frames_path: str) -> np.ndarray:
+    """書き出したフレームをメモリマップで開く（読み取り専用、デコードなし）"""
+    return np.load(frames_path, mmap_mode="r")
+
+
+def contact_sheet(video_path: str, jpeg_path: str, count: int = 4, width: int = 256) -> str:
+    """
+    動画から等間隔に count 枚取り出して横に並べた JPEG（プレビュー用）
+
+    Returns:
+        jpeg_path
+    """
+    frames = probe(video_path)["frames"]
+    step = max(1, frames // count)
+    video_filter = f"select='not(mod(n\\,{step}))',scale={width}:-2,tile={count}x1"
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", video_path,
+        "-vf", video_filter,
+        "-frames:v", "1",
+        "-q:v", "4",
+        jpeg_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise Exception(f"Contact sheet failed: {result.stderr[-2000:]}")
+    return jpeg_path
@@ -2,16 +2,191 @@
 """
 LTX-2 19B fp8 動画生成スクリプト
 RTX 4090 (24GB) / 1080p / 10秒動画用
+
+--prompt を複数指定すると続けて生成する。--jobs requests.jsonl ならオフラインのバッチとして動く:
+- パイプラインは1回だけロードし、同じ形（幅・高さ・フレーム数）のジョブをまとめて順に生成
+- 完了した id を --output_dir/manifest.jsonl に記録し、再実行時は飛ばす（途中で止めても続きから）
+- 出力は一時ファイルに書いてから rename（途中の mp4 が残らない）
+- 最後に本数 / 時間あたりの本数などのスループットを表示
+
+JSONL の1行: {"id": "...", "prompt": "...", "negative_prompt", "width", "height", "duration", "fps", "seed", "steps"}
+（prompt 以外は省略可、省略時はコマンドラインの値）
+
+--text_encoder service ならテキストエンコードを別プロセス (text_encoder_service.py) に任せ、
+生成中に次のプロンプトをエンコードしておく。
+
+--stage 1 / --stage 2 で2つのワーカー（2枚の GPU / 2つの Pod）に段を分ける (stage_pipeline.py)。
+stage 1 が latent を --handoff_dir に書き、stage 2 が upsampler + stage 2 を行って保存する。
+先に stage 1 を起動する（前回の終了印を消すため）。--text_encoder service なら両方の段で指定する
+（stage 2 のワーカーもサービスを起動してプロンプトをエンコードする）。
 """
 
 import argparse
+import json
 import os
+import socket
+import time
 import torch
 from pathlib import Path
 
+
+def frame_count(duration: float, fps: int) -> int:
+    """フレーム数計算 (8+1の倍数に調整)"""
+    num_frames = int(duration * fps)
+    return ((num_frames - 1) // 8) * 8 + 1
+
+
+def make_job(job_id: str, prompt: str, output: Path, args, **overrides) -> dict:
+    job = {
+        "id": job_id,
+        "prompt": prompt,
+        "negative_prompt": overrides.get("negative_prompt", args.negative_prompt),
+        "width": int(overrides.get("width") or args.width),
+        "height": int(overrides.get("height") or args.height),
+        "duration": float(overrides.get("duration") or args.duration),
+        "fps": int(overrides.get("fps") or args.fps),
+        "seed": overrides.get("seed", args.seed),
+        "steps": int(overrides.get("steps") or args.steps),
+        "output": str(output),
+    }
+    job["num_frames"] = frame_count(job["duration"], job["fps"])
+    return job
+
+
+def jobs_from_prompts(args) -> list:
+    jobs = []
+    for index, prompt in enumerate(args.prompt):
+        output_path = Path(args.output)
+        if len(args.prompt) > 1:
+            output_path = output_path.with_name(f"{output_path.stem}_{index:03d}{output_path.suffix}")
+        jobs.append(make_job(output_path.stem, prompt, output_path, args))
+    return jobs
+
+
+def jobs_from_file(path: str, args) -> list:
+    """JSONL のリクエストを読む（id がなければ行番号）"""
+    jobs = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if not request.get("prompt"):
+                raise ValueError(f"{path}:{line_number}: prompt is required")
+            job_id = str(request.get("id") or request.get("request_id") or f"{line_number:05d}")
+            if job_id in seen:
+                raise ValueError(f"{path}:{line_number}: duplicate id {job_id}")
+            seen.add(job_id)
+            overrides = {k: request[k] for k in ("negative_prompt", "width", "height", "duration", "fps", "seed", "steps") if k in request}
+            jobs.append(make_job(job_id, request["prompt"], Path(args.output_dir) / f"{job_id}.mp4", args, **overrides))
+    return jobs
+
+
+def shape_key(job: dict) -> tuple:
+    return (job["width"], job["height"], job["num_frames"])
+
+
+class Manifest:
+    """完了したジョブの記録（JSONL、1行ずつ追記して fsync）"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.completed = set()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 書き込み途中で止まった最終行
+                    if entry.get("status") == "completed":
+                        self.completed.add(entry["id"])
+
+    def record(self, job_id: str, status: str, **fields):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"id": job_id, "status": status, "time": round(time.time(), 3), **fields}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if status == "completed":
+            self.completed.add(job_id)
+
+
+def save_atomic(output, output_path: Path):
+    """一時ファイルに保存してから置き換える（拡張子は保存形式の判定に使われるので残す）"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.stem}.tmp{output_path.suffix}")
+    try:
+        output.save(str(tmp_path))
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def start_encoder(args):
+    """--text_encoder service のときテキストエンコーダのプロセスを起動（inline なら None）"""
+    if args.text_encoder != "service":
+        return None
+    from text_encoder_service import TextEncoderService
+
+    options = {"device": args.text_encoder_device} if args.text_encoder_device else {}
+    return TextEncoderService(**options).start()
+
+
+def make_text_inputs(encoder):
+    """
+    ジョブのプロンプトをパイプラインの入力にする関数
+
+    encoder（TextEncoderService）があれば埋め込みを渡す（パイプラインにはテキストエンコーダがない）
+    """
+    negative_cache = {}
+
+    def text_inputs(job: dict) -> dict:
+        if encoder is None:
+            return {"prompt": job["prompt"], "negative_prompt": job["negative_prompt"]}
+        from text_encoder_service import to_torch
+
+        inputs = to_torch(encoder.get(job["prompt"]))
+        negative_prompt = job["negative_prompt"]
+        if negative_prompt:
+            # ネガティブプロンプトは共通のことが多いので1回だけ
+            if negative_prompt not in negative_cache:
+                negative_cache[negative_prompt] = to_torch(encoder.get(negative_prompt))
+            negative = negative_cache[negative_prompt]
+            inputs["negative_prompt_embeds"] = negative["prompt_embeds"]
+            inputs["negative_prompt_attention_mask"] = negative["prompt_attention_mask"]
+        return inputs
+
+    return text_inputs
+
+
+def print_summary(results: list, skipped: int, elapsed: float):
+    """スループットの集計"""
+    completed = [r for r in results if r["status"] == "completed"]
+    failed = len(results) - len(completed)
+    frames = sum(r["num_frames"] for r in completed)
+    print()
+    print("=== Summary ===")
+    print(f"Completed: {len(completed)}, failed: {failed}, skipped (already done): {skipped}")
+    print(f"Wall time: {elapsed / 60:.1f} min")
+    if completed and elapsed > 0:
+        print(f"Throughput: {len(completed) / elapsed * 3600:.1f} videos/h, {frames / elapsed:.2f} frames/s")
+    by_shape = {}
+    for r in completed:
+        by_shape.setdefault(r["shape"], []).append(r["seconds"])
+    for shape, seconds in sorted(by_shape.items()):
+        print(f"  {shape}: {len(seconds)} videos, {sum(seconds) / len(seconds):.1f}s avg")
+
+
 def main():
     parser = argparse.ArgumentParser(description="LTX-2 Video Generation")
-    parser.add_argument("--prompt", type=str, required=True, help="動画生成プロンプト")
+    parser.add_argument("--prompt", type=str, action="append", help="動画生成プロンプト（複数指定可）")
+    parser.add_argument("--jobs", type=str, default=None, help="リクエストの JSONL（オフラインバッチ）")
+    parser.add_argument("--output_dir", type=str, default="outputs", help="--jobs の出力先（{id}.mp4 と manifest.jsonl）")
+    parser.add_argument("--manifest", type=str, default=None, help="完了記録（デフォルト: --output_dir/manifest.jsonl）")
     parser.add_argument("--negative_prompt", type=str, default="", help="ネガティブプロンプト")
     parser.add_argument("--output", type=str, default="output.mp4", help="出力ファイル名")
     parser.add_argument("--duration", type=float, default=10.0, help="動画の長さ(秒)")
@@ -19,35 +194,63 @@ def main():
     parser.add_argument("--height", type=int, default=1080, help="出力高さ")
     parser.add_argument("--fps", type=int, default=24, help="フレームレート")
     parser.add_argument("--seed", type=int, default=None, help="シード値")
+    parser.add_argument("--steps", type=int, default=50, help="推論ステップ数")
     parser.add_argument("--model_dir", type=str, default="/workspace/models/ltx2", help="モデルディレクトリ")
+    parser.add_argument("--text_encoder", choices=["inline", "service"], default="inline",
+                        help="inline: パイプライン内でエンコード / service: 別プロセスで先にエンコード")
+    parser.add_argument("--text_encoder_device", type=str, default=None, help="service のデバイス (cpu, cuda:1 など)")
+    parser.add_argument("--stage", choices=["all", "1", "2"], default="all",
+                        help="all: 1プロセスで両段 / 1: stage 1 まで / 2: 受け渡された latent から stage 2")
+    parser.add_argument("--handoff_dir", type=str, default="/workspace/handoff", help="stage 1 → 2 の受け渡しディレクトリ")
+    parser.add_argument("--worker_id", type=str, default=socket.gethostname(), help="stage 2 のワーカー名")
     args = parser.parse_args()
+    if args.stage != "2" and not (args.prompt or args.jobs):
+        parser.error("--prompt or --jobs is required unless --stage 2")
+
+    if args.jobs:
+        jobs = jobs_from_file(args.jobs, args)
+        manifest = Manifest(args.manifest or Path(args.output_dir) / "manifest.jsonl")
+    else:
+        jobs = jobs_from_prompts(args) if args.prompt else []
+        manifest = Manifest(args.manifest) if args.manifest else None
+
+    # 済んだものを除き、同じ形をまとめる（形が変わらなければアロケータ / カーネルが使い回せる）
+    skipped = 0
+    if manifest is not None:
+        skipped = sum(1 for job in jobs if job["id"] in manifest.completed)
+        jobs = [job for job in jobs if job["id"] not in manifest.completed]
+    jobs.sort(key=shape_key)
 
     print(f"=== LTX-2 Video Generation ===")
-    print(f"Prompt: {args.prompt}")
-    print(f"Output: {args.output}")
-    print(f"Duration: {args.duration}s @ {args.fps}fps")
-    print(f"Resolution: {args.width}x{args.height}")
+    if args.jobs:
+        shapes = sorted({shape_key(job) for job in jobs})
+        print(f"Jobs: {len(jobs)} ({skipped} already done) from {args.jobs}")
+        print(f"Shapes: {', '.join(f'{w}x{h}x{n}' for w, h, n in shapes)}")
+    else:
+        for job in jobs:
+            print(f"Prompt: {job['prompt']}")
+        print(f"Output: {args.output}")
+        print(f"Duration: {args.duration}s @ {args.fps}fps")
+        print(f"Resolution: {args.width}x{args.height}")
+        print(f"Frames: {frame_count(args.duration, args.fps)}")
     print()
 
-    # フレーム数計算 (8+1の倍数に調整)
-    num_frames = int(args.duration * args.fps)
-    num_frames = ((num_frames - 1) // 8) * 8 + 1  # 8+1の倍数に
-    print(f"Frames: {num_frames}")
-
-    # シード設定
-    if args.seed is not None:
-        torch.manual_seed(args.seed)
-        print(f"Seed: {args.seed}")
+    if args.stage != "2" and not jobs:
+        print("Nothing to do.")
+        return
 
     # LTX-2パイプライン読み込み
     try:
         from ltx_pipelines import TI2VidTwoStagesPipeline
 
         print("Loading LTX-2 fp8 model...")
+        # service ならテキストエンコーダをメイン GPU に載せない
+        components = {"text_encoder": None} if args.text_encoder == "service" else {}
         pipe = TI2VidTwoStagesPipeline.from_pretrained(
             args.model_dir,
             torch_dtype=torch.bfloat16,
             fp8transformer=True,  # fp8有効化
+            **components,
         )
         pipe.to("cuda")
 
@@ -55,38 +258,144 @@ def main():
         pipe.enable_xformers_memory_efficient_attention()
 
     except ImportError:
+        job = jobs[0] if jobs else make_job("output", "...", Path(args.output), args)
         print("ltx_pipelinesが見つかりません。")
         print("代替方法: CLIを使用してください")
         print()
         print("CLI例:")
         print(f'  python -m ltx_pipelines.generate \\')
-        print(f'    --prompt "{args.prompt}" \\')
-        print(f'    --num_frames {num_frames} \\')
-        print(f'    --width {args.width} --height {args.height} \\')
-        print(f'    --output {args.output} \\')
+        print(f'    --prompt "{job["prompt"]}" \\')
+        print(f'    --num_frames {job["num_frames"]} \\')
+        print(f'    --width {job["width"]} --height {job["height"]} \\')
+        print(f'    --output {job["output"]} \\')
         print(f'    --fp8transformer')
         return
 
-    print("Generating video...")
-
-    # 動画生成
-    output = pipe(
-        prompt=args.prompt,
-        negative_prompt=args.negative_prompt,
-        num_frames=num_frames,
-        width=args.width,
-        height=args.height,
-        num_inference_steps=50,
-        guidance_scale=7.5,
-    )
-
-    # 保存
-    output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if args.stage != "all" and not (hasattr(pipe, "stage1") and hasattr(pipe, "stage2")):
+        print("この ltx_pipelines は stage 1 / stage 2 を個別に実行できません。--stage all を使ってください")
+        return
+
+    if args.stage == "2":
+        run_stage2(pipe, args)
+        print("Done!")
+        return
+
+    encoder = start_encoder(args)
+    if encoder is not None:
+        # 生成順に全プロンプトを先に投入（1本目の生成中に2本目以降がエンコードされる）
+        negatives = list(dict.fromkeys(job["negative_prompt"] for job in jobs if job["negative_prompt"]))
+        encoder.prefetch(negatives + [job["prompt"] for job in jobs])
+    text_inputs = make_text_inputs(encoder)
+
+    def generation(job: dict) -> dict:
+        return {
+            "num_frames": job["num_frames"],
+            "width": job["width"],
+            "height": job["height"],
+            "num_inference_steps": job["steps"],
+            "guidance_scale": 7.5,
+        }
+
+    start = time.time()
+    results = []
+    try:
+        if args.stage == "1":
+            from stage_pipeline import Handoff, produce
+
+            def stage1(job_id: str, job: dict) -> dict:
+                if job["seed"] is not None:
+                    torch.manual_seed(job["seed"])
+                print(f"Stage 1: {job_id}...")
+                try:
+                    latents = pipe.stage1(**text_inputs(job), **generation(job))
+                except Exception as e:
+                    # --stage all と同じく記録して次へ（produce が failed.json を残して続ける）
+                    torch.cuda.empty_cache()
+                    if manifest is not None:
+                        manifest.record(job_id, "failed", error=str(e))
+                    raise
+                return {"latents": latents.float().cpu().numpy()}
+
+            manifest_path = str(manifest.path) if manifest is not None else None
+            handoff_jobs = [(job["id"], {**job, "manifest": manifest_path}) for job in jobs]
+            summary = produce(Handoff(args.handoff_dir), handoff_jobs, stage1)
+            print(f"Handed off to stage 2: {summary}")
+        else:
+            for index, job in enumerate(jobs):
+                # シード設定
+                if job["seed"] is not None:
+                    torch.manual_seed(job["seed"])
+
+                shape = "{}x{}x{}".format(*shape_key(job))
+                print(f"Generating video {index + 1}/{len(jobs)} [{job['id']}, {shape}]...")
+                job_start = time.time()
+                try:
+                    # 動画生成
+                    output = pipe(**text_inputs(job), **generation(job))
+
+                    # 保存
+                    save_atomic(output, Path(job["output"]))
+                except Exception as e:
+                    # 1本の失敗（OOM など）でバッチ全体を止めない。次回の実行で再試行される
+                    print(f"Failed: {job['id']}: {e}")
+                    torch.cuda.empty_cache()
+                    if manifest is not None:
+                        manifest.record(job["id"], "failed", error=str(e))
+                    results.append({"status": "failed"})
+                    continue
+                seconds = time.time() - job_start
+                print(f"Saved: {job['output']} ({seconds:.1f}s)")
+                if manifest is not None:
+                    manifest.record(job["id"], "completed", output=job["output"], seconds=round(seconds, 1))
+                results.append({"status": "completed", "shape": shape, "num_frames": job["num_frames"], "seconds": seconds})
+    finally:
+        if encoder is not None:
+            print(f"Text encoder: {encoder.stats()}")
+            encoder.close()
+        if args.stage == "all" and len(results) + skipped > 1:
+            print_summary(results, skipped, time.time() - start)
 
-    output.save(str(output_path))
-    print(f"Saved: {output_path}")
     print("Done!")
 
+
+def run_stage2(pipe, args):
+    """
+    受け渡しディレクトリの latent を upsampler + stage 2 で仕上げる（stage 1 が終わるまで）
+
+    --text_encoder service ならパイプラインにテキストエンコーダがないので、
+    stage 2 のワーカーもサービスを起動して埋め込みを渡す
+    """
+    from stage_pipeline import Handoff
+
+    manifests = {}
+    encoder = start_encoder(args)
+    text_inputs = make_text_inputs(encoder)
+
+    def stage2(job_id: str, arrays: dict, job: dict):
+        print(f"Stage 2: {job_id}...")
+        job_start = time.time()
+        latents = torch.from_numpy(arrays["latents"]).to("cuda", torch.bfloat16)
+        output = pipe.stage2(
+            latents=latents,
+            **text_inputs(job),
+            num_inference_steps=job["steps"],
+            guidance_scale=7.5,
+        )
+        save_atomic(output, Path(job["output"]))
+        print(f"Saved: {job['output']}")
+        if job.get("manifest"):
+            if job["manifest"] not in manifests:
+                manifests[job["manifest"]] = Manifest(job["manifest"])
+            manifests[job["manifest"]].record(job_id, "completed", output=job["output"], seconds=round(time.time() - job_start, 1))
+
+    try:
+        summary = Handoff(args.handoff_dir).consume(args.worker_id, stage2)
+    finally:
+        if encoder is not None:
+            print(f"Text encoder: {encoder.stats()}")
+            encoder.close()
+    print(f"Stage 2 finished: {summary}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,230 @@
+"""
+GPU worker pool (server.py)
+
+見えている GPU ごとに GPU プロファイル (gpu_profiles.py) の concurrency 分のスロットを持ち、
+生成ジョブに GPU を割り当てる。同じ GPU で同時に走らせるのは、実行中のジョブの
+pixel_frames の合計がプロファイルの max_pixel_frames に収まる間だけ。生成は LTX CLI の子プロセスなので、
+CUDA_VISIBLE_DEVICES で割り当てた GPU に固定する。
+
+割り当て方式 (GPU_DISPATCH):
+- least_loaded: 空きのある GPU のうち実行中が少なく累計稼働時間が短いもの
+- vram_fit: プロファイルの上限 (max_pixel_frames) に収まる空き GPU のうち VRAM が最も小さいもの
+  （大きい GPU を大きいジョブ用に空けておく）。同じ大きさなら least_loaded
+
+GPU_DEVICES=0,1 で使う GPU を限定できる（未設定なら nvidia-smi で検出）。
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from gpu_profiles import detect_profile
+
+LEAST_LOADED = "least_loaded"
+VRAM_FIT = "vram_fit"
+DISPATCH_POLICIES = (LEAST_LOADED, VRAM_FIT)
+CANCEL_POLL_SECONDS = 1.0  # 待っている間に cancel を確認する間隔
+
+
+def discover_gpus() -> List[Dict]:
+    """
+    使える GPU の一覧
+
+    Returns:
+        [{"index": "0", "name": ..., "total_bytes": ...}, ...]（検出できなければ空）
+    """
+    only = [d.strip() for d in os.environ.get("GPU_DEVICES", "").split(",") if d.strip()]
+
+    gpus = []
+    nvidia_smi = shutil.which("nvidia-smi")
+    if nvidia_smi:
+        try:
+            result = subprocess.run(
+                [nvidia_smi, "--query-gpu=index,name,memory.total", "--format=csv,noheader,nounits"],
+                capture_output=True, text=True, timeout=10,
+            )
+            for line in result.stdout.strip().splitlines():
+                index, name, total = [v.strip() for v in line.split(",")]
+                gpus.append({"index": index, "name": name, "total_bytes": int(total) * 1024 * 1024})
+        except (OSError, subprocess.TimeoutExpired, ValueError):
+            gpus = []
+
+    if only:
+        known = {gpu["index"]: gpu for gpu in gpus}
+        gpus = [known.get(index, {"index": index, "name": None, "total_bytes": None}) for index in only]
+    return gpus
+
+
+class GPUWorker:
+    """GPU 1枚分のスロット（プロファイルの concurrency 件まで同時実行）"""
+
+    def __init__(
+        self,
+        index: str,
+        name: Optional[str] = None,
+        total_bytes: Optional[int] = None,
+        profile: Optional[Dict] = None,
+    ):
+        self.index = index
+        self.name = name
+        self.total_bytes = total_bytes
+        self.profile = profile or detect_profile(name, total_bytes)
+        self.capacity = self.profile["concurrency"]
+        self.running: Dict[str, float] = {}  # job_id -> 開始時刻
+        self.pixel_frames: Dict[str, int] = {}  # job_id -> width × height × フレーム数
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def busy(self) -> bool:
+        return len(self.running) >= self.capacity
+
+    @property
+    def load(self) -> int:
+        return len(self.running)
+
+    def env(self, base: Optional[Dict] = None) -> Dict:
+        """この GPU だけが見える子プロセス用の環境変数"""
+        env = dict(os.environ if base is None else base)
+        env["CUDA_VISIBLE_DEVICES"] = self.index
+        return env
+
+    def fits(self, pixel_frames: int) -> bool:
+        return pixel_frames <= self.profile["max_pixel_frames"]
+
+    def has_room(self, pixel_frames: int) -> bool:
+        """実行中のジョブと合わせても上限に収まるか（空いていれば常に入れる）"""
+        if not self.running:
+            return True
+        return sum(self.pixel_frames.values()) + pixel_frames <= self.profile["max_pixel_frames"]
+
+    def status(self) -> Dict:
+        now = time.time()
+        return {
+            "index": self.index,
+            "name": self.name,
+            "total_bytes": self.total_bytes,
+            "profile": self.profile["key"],
+            "capacity": self.capacity,
+            "busy": self.busy,
+            "pixel_frames": sum(self.pixel_frames.values()),
+            "jobs": {job_id: round(now - started, 1) for job_id, started in self.running.items()},
+            "completed": self.completed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 1),
+        }
+
+
+class GPUPool:
+    """GPU ごとにプロファイルの concurrency 件ずつ割り当てるプール"""
+
+    def __init__(self, gpus: Optional[List[Dict]] = None, policy: str = LEAST_LOADED):
+        if policy not in DISPATCH_POLICIES:
+            raise ValueError(f"Unknown dispatch policy: {policy} (expected one of {DISPATCH_POLICIES})")
+        gpus = discover_gpus() if gpus is None else gpus
+        # GPU が見つからなくても1枚（CUDA_VISIBLE_DEVICES=0、デフォルトプロファイル）として動かす
+        self.workers = [GPUWorker(**gpu) for gpu in gpus] or [GPUWorker("0")]
+        self.policy = policy
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    @property
+    def max_pixel_frames(self) -> int:
+        """どれかの GPU で実行できる最大サイズ（リクエストの検証用）"""
+        return max(w.profile["max_pixel_frames"] for w in self.workers)
+
+    def largest_profile(self) -> Dict:
+        return max((w.profile for w in self.workers), key=lambda p: p["max_pixel_frames"])
+
+    def _pick(self, pixel_frames: int) -> Optional[GPUWorker]:
+        idle = [w for w in self.workers if not w.busy and w.has_room(pixel_frames)]
+        if pixel_frames:
+            fitting = [w for w in self.workers if w.fits(pixel_frames)]
+            if fitting:
+                idle = [w for w in idle if w.fits(pixel_frames)]
+            else:
+                # どの GPU の上限も超える（検証済みのはずだが念のため）なら最大の GPU で試す
+                largest = max(self.workers, key=lambda w: w.profile["max_pixel_frames"])
+                idle = [largest] if not largest.running else []
+        if not idle:
+            return None
+        if self.policy == VRAM_FIT:
+            return min(idle, key=lambda w: (w.profile["max_pixel_frames"], w.load, w.busy_seconds))
+        return min(idle, key=lambda w: (w.load, w.busy_seconds, w.completed + w.failed))
+
+    def acquire(
+        self,
+        job_id: str,
+        pixel_frames: int = 0,
+        timeout: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Optional[GPUWorker]:
+        """
+        空いた GPU を確保（空くまで待つ）
+
+        pixel_frames: width × height × フレーム数（上限に収まる GPU だけに割り当てる）
+        cancel: 待っている間に立ったら諦めて None を返す
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    worker = self._pick(pixel_frames)
+                    if worker is not None:
+                        worker.running[job_id] = time.time()
+                        worker.pixel_frames[job_id] = pixel_frames
+                        return worker
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No GPU available for job {job_id} within {timeout}s")
+                    if cancel is not None:
+                        remaining = CANCEL_POLL_SECONDS if remaining is None else min(remaining, CANCEL_POLL_SECONDS)
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def release(self, worker: GPUWorker, job_id: str, ok: bool = True):
+        with self._cond:
+            worker.busy_seconds += time.time() - worker.running.pop(job_id)
+            worker.pixel_frames.pop(job_id, None)
+            if ok:
+                worker.completed += 1
+            else:
+                worker.failed += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, job_id: str, pixel_frames: int = 0):
+        """with 中は GPU のスロットを占有（例外なら failed として数える）"""
+        worker = self.acquire(job_id, pixel_frames)
+        ok = False
+        try:
+            yield worker
+            ok = True
+        finally:
+            self.release(worker, job_id, ok)
+
+    @property
+    def capacity(self) -> int:
+        """全 GPU の同時実行数の合計"""
+        return sum(w.capacity for w in self.workers)
+
+    @property
+    def running(self) -> int:
+        return sum(w.load for w in self.workers)
+
+    def status(self) -> List[Dict]:
+        """/health 用の GPU ごとの状態"""
+        with self._cond:
+            return [w.status() for w in self.workers]
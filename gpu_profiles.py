@@ -0,0 +1,113 @@
+"""
+GPU profiles (server.py / handler.py)
+
+GPU の種類ごとの上限とデフォルト値。検出した GPU 名（なければ VRAM）から自動で選び、
+リクエストの検証と GPU への割り当てに使う。
+
+- max_pixel_frames: width × height × フレーム数 の上限（これを超えると OOM）
+  同時に走らせる場合は実行中のジョブの合計がこれに収まる分だけ（gpu_pool.py）
+- concurrency: 1枚の GPU で同時に走らせる生成数（小さいジョブどうしのとき）
+
+値は fp8 19B + distilled LoRA の two-stage パイプラインでの実測ベース。
+GPU_PROFILE で固定、MAX_PIXEL_FRAMES で上限だけ上書きできる。
+"""
+
+import os
+import re
+from typing import Dict, Optional
+
+GB = 1024 ** 3
+
+PROFILES = {
+    "24gb": {
+        "name": "24GB (RTX A5000 / 4090)",
+        "match": ("A5000", "4090", "3090", "A10"),
+        "vram_gb": 24,
+        "max_pixel_frames": 1280 * 720 * 241,   # 1280x720 で 10秒
+        "max_duration": 10,
+        "default_width": 1280,
+        "default_height": 720,
+        "default_steps": 8,
+        "concurrency": 1,
+    },
+    "48gb": {
+        "name": "48GB (RTX 6000 Ada / A6000 / L40S)",
+        "match": ("RTX 6000 Ada", "A6000", "L40", "L40S"),  # Quadro RTX 6000 は 24GB
+        "vram_gb": 48,
+        "max_pixel_frames": 1920 * 1088 * 241,  # 1080p で 10秒
+        "max_duration": 15,
+        "default_width": 1280,
+        "default_height": 768,
+        "default_steps": 8,
+        "concurrency": 1,
+    },
+    "80gb": {
+        "name": "80GB (A100 / H100)",
+        "match": ("A100", "H100", "H200"),
+        "vram_gb": 80,
+        "max_pixel_frames": 1920 * 1088 * 361,  # 1080p で 15秒
+        "max_duration": 15,
+        "default_width": 1280,
+        "default_height": 768,
+        "default_steps": 8,
+        "concurrency": 2,
+    },
+}
+
+# GPU が検出できないとき（CPU のみの開発環境など）
+DEFAULT_PROFILE = "24gb"
+
+
+def get_profile(key: str) -> Dict:
+    if key not in PROFILES:
+        raise ValueError(f"Unknown GPU profile: {key} (available: {', '.join(PROFILES)})")
+    profile = dict(PROFILES[key], key=key)
+    if os.environ.get("MAX_PIXEL_FRAMES"):
+        profile["max_pixel_frames"] = int(os.environ["MAX_PIXEL_FRAMES"])
+    return profile
+
+
+def detect_profile(name: Optional[str] = None, total_bytes: Optional[int] = None) -> Dict:
+    """
+    GPU 名 / VRAM からプロファイルを選ぶ
+
+    GPU_PROFILE があればそれを使う。名前が一致しなければ（一致しても VRAM が足りなければ）
+    VRAM 以下で最大のもの。
+    """
+    if os.environ.get("GPU_PROFILE"):
+        return get_profile(os.environ["GPU_PROFILE"])
+
+    if name:
+        for key, profile in PROFILES.items():
+            # 単語単位で比べる（"A10" が "A100" に一致しないように）
+            if not any(re.search(rf"\b{re.escape(pattern)}\b", name, re.IGNORECASE) for pattern in profile["match"]):
+                continue
+            # 同じ名前で VRAM の小さい型番がある（名前だけでは決めきれない）
+            if total_bytes and profile["vram_gb"] * GB * 0.9 > total_bytes:
+                continue
+            return get_profile(key)
+
+    if total_bytes:
+        # nvidia-smi の memory.total は公称値より少し小さい
+        fitting = [key for key, p in PROFILES.items() if p["vram_gb"] * GB * 0.9 <= total_bytes]
+        if fitting:
+            return get_profile(max(fitting, key=lambda k: PROFILES[k]["vram_gb"]))
+
+    return get_profile(DEFAULT_PROFILE)
+
+
+def pixel_frames(width: int, height: int, num_frames: int) -> int:
+    return width * height * num_frames
+
+
+def check_limits(profile: Dict, width: int, height: int, duration: float, num_frames: int) -> Optional[str]:
+    """プロファイルの上限を超えていればエラーメッセージ、収まれば None"""
+    if duration > profile["max_duration"]:
+        return f"duration {duration}s exceeds {profile['max_duration']}s for {profile['name']}"
+    size = pixel_frames(width, height, num_frames)
+    if size > profile["max_pixel_frames"]:
+        return (
+            f"{width}x{height} x {num_frames} frames exceeds the {profile['name']} limit "
+            f"({profile['max_pixel_frames'] / 1e6:.0f}M pixel-frames); lower resolution or duration"
+        )
+    return None
@@ -6,11 +6,12 @@ Local GUI for generating videos with Runpod Serverless
 import os
 import base64
 import time
-import requests
 import gradio as gr
 from datetime import datetime
 from dotenv import load_dotenv
 
+from async_client import serverless_client, run_sync, iterate_sync
+
 # Load .env file
 load_dotenv()
 
@@ -23,73 +24,80 @@ OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "videos")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 
+def _client():
+    """Shared async client (pooled session, adaptive polling)"""
+    return serverless_client(RUNPOD_ENDPOINT, RUNPOD_API_KEY, poll_max=5)
+
+
 def check_health():
     """Check endpoint health"""
     try:
-        response = requests.get(
-            f"{RUNPOD_ENDPOINT}/health",
-            headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
-            timeout=10,
-        )
-        if response.status_code == 200:
-            data = response.json()
-            workers = data.get("workers", {})
-            return f"Ready ({workers.get('ready', 0)} workers)"
-        return "Not responding"
+        data = run_sync(_client().health())
+        workers = data.get("workers", {})
+        return f"Ready ({workers.get('ready', 0)} workers)"
     except Exception as e:
         return f"Error: {e}"
 
 
-def submit_job(prompt, duration, width, height, steps, seed, image_base64=None, image_strength=1.0):
+def submit_job(prompt, duration, width, height, steps, seed, image_base64=None, image_strength=1.0, preview=False):
     """Submit generation job (T2V or I2V)"""
-    payload = {
-        "input": {
-            "prompt": prompt,
-            "duration": duration,
-            "width": width,
-            "height": height,
-            "steps": steps,
-        }
+    job_input = {
+        "prompt": prompt,
+        "duration": duration,
+        "width": width,
+        "height": height,
+        "steps": steps,
     }
 
+    # 本番の前に低解像度プレビューを受け取る
+    if preview:
+        job_input["preview"] = True
+
     if seed and seed > 0:
-        payload["input"]["seed"] = seed
+        job_input["seed"] = seed
 
     # I2V: 画像パラメータ
     if image_base64:
-        payload["input"]["image_base64"] = image_base64
-        payload["input"]["image_strength"] = image_strength
-
-    response = requests.post(
-        f"{RUNPOD_ENDPOINT}/run",
-        headers={
-            "Authorization": f"Bearer {RUNPOD_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        json=payload,
-        timeout=30,
-    )
+        job_input["image_base64"] = image_base64
+        job_input["image_strength"] = image_strength
 
-    response.raise_for_status()
-    return response.json()["id"]
+    return run_sync(_client().submit(job_input)).id
 
 
 def get_status(job_id):
     """Get job status"""
-    response = requests.get(
-        f"{RUNPOD_ENDPOINT}/status/{job_id}",
-        headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
-        timeout=30,
-    )
-    response.raise_for_status()
-    return response.json()
+    return run_sync(_client().status(job_id))
+
 
+def cancel_job(job_id):
+    """Cancel the running job (e.g. after a bad preview)"""
+    if not job_id:
+        return "No job to cancel"
+    try:
+        run_sync(_client().cancel(job_id))
+        return f"Cancelled: {job_id}"
+    except Exception as e:
+        return f"Error: {e}"
 
-def generate_video(prompt, duration, width, height, steps, seed, input_image, image_strength, progress=gr.Progress()):
-    """Main generation function (T2V or I2V)"""
+
+def save_preview(job_id, preview_b64):
+    """プレビュー JPEG を保存してパスを返す"""
+    filepath = os.path.join(OUTPUT_DIR, f"preview_{job_id}.jpg")
+    with open(filepath, "wb") as f:
+        f.write(base64.b64decode(preview_b64))
+    return filepath
+
+
+def generate_video(prompt, duration, width, height, steps, seed, input_image, image_strength, preview, progress=gr.Progress()):
+    """Main generation function (T2V or I2V)
+
+    generator: (video, info, download, preview image, job_id) を順に返す
+    （プレビューが届いた時点で一度表示を更新する）
+    """
 
     if not prompt.strip():
-        return None, "Error: Prompt is required", None
+        yield None, "Error: Prompt is required", None, None, None
+        return
 
     # I2V: 画像をBase64エンコード
     image_base64 = None
@@ -105,47 +113,54 @@ def generate_video(prompt, duration, width, height, steps, seed, input_image, im
 
     # Validate resolution
     if width % 64 != 0 or height % 64 != 0:
-        return None, f"Error: Resolution {width}x{height} must be divisible by 64", None
+        yield None, f"Error: Resolution {width}x{height} must be divisible by 64", None, None, None
+        return
 
     try:
         # Submit job
         progress(0.1, desc=f"Submitting {mode} job...")
-        job_id = submit_job(prompt, duration, width, height, steps, seed if seed else None, image_base64, image_strength)
+        job_id = submit_job(prompt, duration, width, height, steps, seed if seed else None, image_base64, image_strength, preview)
+        preview_path = None
+        yield None, f"Submitted: {job_id}", None, None, job_id
 
-        # Poll for completion
+        # Poll for completion (adaptive interval, up to 5s)
         start_time = time.time()
         max_time = 600  # 10 minutes
+        client = _client()
+        job = client.job(job_id)
 
-        while time.time() - start_time < max_time:
-            status = get_status(job_id)
-            state = status.get("status")
+        try:
+            for update in iterate_sync(client.updates([job], timeout=max_time)):
+                status = update.data
+                state = status.get("status")
 
-            elapsed = int(time.time() - start_time)
-            progress_pct = min(0.1 + (elapsed / max_time) * 0.8, 0.9)
+                elapsed = int(time.time() - start_time)
+                progress_pct = min(0.1 + (elapsed / max_time) * 0.8, 0.9)
 
-            if state == "COMPLETED":
-                progress(0.95, desc="Downloading video...")
+                if state == "COMPLETED":
+                    progress(0.95, desc="Downloading video...")
 
-                output = status.get("output", {})
-                video_b64 = output.get("video_base64")
+                    output = status.get("output", {})
+                    video_b64 = output.get("video_base64")
 
-                if not video_b64:
-                    return None, "Error: No video in response", None
+                    if not video_b64:
+                        yield None, "Error: No video in response", None, preview_path, None
+                        return
 
-                # Decode and save
-                video_bytes = base64.b64decode(video_b64)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"ltx2_{timestamp}.mp4"
-                filepath = os.path.join(OUTPUT_DIR, filename)
+                    # Decode and save
+                    video_bytes = base64.b64decode(video_b64)
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    filename = f"ltx2_{timestamp}.mp4"
+                    filepath = os.path.join(OUTPUT_DIR, filename)
 
-                with open(filepath, "wb") as f:
-                    f.write(video_bytes)
+                    with open(filepath, "wb") as f:
+                        f.write(video_bytes)
 
-                # Calculate cost
-                exec_time = status.get("executionTime", 0) / 1000
-                cost = exec_time * 0.00106
+                    # Calculate cost
+                    exec_time = status.get("executionTime", 0) / 1000
+                    cost = exec_time * 0.00106
 
-                info = f"""Generation complete! ({mode})
+                    info = f"""Generation complete! ({mode})
 
 Mode: {mode}
 Duration: {output.get('duration')}s
@@ -156,24 +171,32 @@ Cost: ${cost:.4f}
 
 Saved to: {filepath}"""
 
-                progress(1.0, desc="Done!")
-                return filepath, info, filepath
+                    progress(1.0, desc="Done!")
+                    yield filepath, info, filepath, preview_path, None
+                    return
+
+                elif update.done():
+                    error = status.get("error", "Unknown error")
+                    yield None, f"Error: {error}", None, preview_path, None
+                    return
 
-            elif state == "FAILED":
-                error = status.get("error", "Unknown error")
-                return None, f"Error: {error}", None
+                elif state == "IN_PROGRESS" and preview_path is None and (status.get("output") or {}).get("preview_jpeg_base64"):
+                    output = status["output"]
+                    preview_path = save_preview(job_id, output["preview_jpeg_base64"])
+                    progress(progress_pct, desc=f"Preview ready, rendering full video... ({elapsed}s)")
+                    yield None, f"Preview ready (seed {output.get('seed')}). Cancel if it looks wrong.", None, preview_path, job_id
 
-            elif state in ("IN_QUEUE", "IN_PROGRESS"):
-                progress(progress_pct, desc=f"{state}... ({elapsed}s)")
-                time.sleep(5)
-            else:
-                progress(progress_pct, desc=f"Status: {state}")
-                time.sleep(5)
+                elif state in ("IN_QUEUE", "IN_PROGRESS"):
+                    progress(progress_pct, desc=f"{state}... ({elapsed}s)")
+                else:
+                    progress(progress_pct, desc=f"Status: {state}")
+        except TimeoutError:
+            pass
 
-        return None, "Error: Timeout (10 minutes)", None
+        yield None, "Error: Timeout (10 minutes)", None, preview_path, None
 
     except Exception as e:
-        return None, f"Error: {str(e)}", None
+        yield None, f"Error: {str(e)}", None, None, None
 
 
 # Preset resolutions
@@ -223,6 +246,7 @@ with gr.Blocks(title="LTX-2 Video Generator", theme=gr.themes.Soft()) as app:
                 steps = gr.Slider(8, 30, value=20, step=1, label="Steps")
 
             seed = gr.Number(value=0, label="Seed (0 = random)", precision=0)
+            preview = gr.Checkbox(value=False, label="Preview first (low-res draft before the full render)")
 
             # I2V: Image-to-Video section
             with gr.Accordion("🖼️ Image-to-Video (I2V)", open=False):
@@ -240,8 +264,12 @@ with gr.Blocks(title="LTX-2 Video Generator", theme=gr.themes.Soft()) as app:
             with gr.Row():
                 generate_btn = gr.Button("Generate Video", variant="primary", size="lg")
                 health_btn = gr.Button("Check Status")
+                cancel_btn = gr.Button("Cancel", variant="stop")
+
+            job_state = gr.State(None)
 
         with gr.Column(scale=2):
+            preview_output = gr.Image(label="Preview", height=160)
             video_output = gr.Video(label="Generated Video")
             info_output = gr.Textbox(label="Info", lines=10)
             download_output = gr.File(label="Download")
@@ -294,8 +322,14 @@ speaking in enthusiastic English, "This is amazing!"
 
     generate_btn.click(
         fn=generate_video,
-        inputs=[prompt, duration, width, height, steps, seed, input_image, image_strength],
-        outputs=[video_output, info_output, download_output],
+        inputs=[prompt, duration, width, height, steps, seed, input_image, image_strength, preview],
+        outputs=[video_output, info_output, download_output, preview_output, job_state],
+    )
+
+    cancel_btn.click(
+        fn=cancel_job,
+        inputs=[job_state],
+        outputs=[info_output],
     )
 
     health_btn.click(
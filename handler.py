@@ -1,6 +1,6 @@
 """
 LTX-2 Serverless Handler for Runpod
-RTX 6000 Ada (48GB) - fp8 + LoRA
+fp8 + LoRA, GPU プロファイル自動選択 (gpu_profiles.py)
 Supports: Text-to-Video (T2V) and Image-to-Video (I2V)
 """
 
@@ -10,8 +10,18 @@ import subprocess
 import base64
 import uuid
 import random
+import time
 import runpod
 
+from interpolation import interpolate, check_interpolator, snap_frames, estimate_gpu_seconds_saved
+from retention import RetentionManager
+import metrics
+from gpu_pool import discover_gpus
+from gpu_profiles import check_limits, detect_profile
+import buckets
+import frames_io
+from compile_cache import CompileCache, default_versions
+
 # Force unbuffered output for logging
 sys.stdout = sys.stdout if hasattr(sys.stdout, 'flush') else open(1, 'w', buffering=1)
 print("[HANDLER] LTX-2 Handler loaded with I2V support", flush=True)
@@ -25,6 +35,46 @@ OUTPUT_DIR = "/tmp/outputs"
 INPUT_DIR = "/tmp/inputs"
 LTX2_PATH = f"{VOLUME_PATH}/LTX-2"
 VENV_PYTHON = f"{LTX2_PATH}/.venv/bin/python"
+# output_format=frames のフレーム配列は Network Volume に残す（Pod からは /workspace/outputs/frames）
+FRAMES_DIR = f"{VOLUME_PATH}/outputs/frames"
+FRAMES_TTL_HOURS = float(os.environ.get("FRAMES_TTL_HOURS", "24"))
+
+# 生成前の低解像度プレビュー（preview=true）: 半分の解像度・低fps・少ステップ
+PREVIEW_FPS = int(os.environ.get("PREVIEW_FPS", "8"))
+PREVIEW_STEPS = int(os.environ.get("PREVIEW_STEPS", "4"))
+
+# /tmp の取り残し（クラッシュしたジョブの残骸）は1時間で削除
+STALE_SECONDS = 3600
+retention = [
+    RetentionManager(OUTPUT_DIR, ttl_seconds=STALE_SECONDS),
+    RetentionManager(INPUT_DIR, ttl_seconds=STALE_SECONDS),
+    RetentionManager(FRAMES_DIR, ttl_seconds=FRAMES_TTL_HOURS * 3600),
+]
+
+# メトリクス（ジョブごとに METRICS_PATH / PUSHGATEWAY_URL へ書き出し）
+JOBS_TOTAL = metrics.REGISTRY.counter("ltx_jobs_total", "Finished jobs by outcome", ("outcome",))
+JOB_STARTS = metrics.REGISTRY.counter("ltx_job_starts_total", "Jobs by cold (first on this worker) or warm start", ("start",))
+STAGE_SECONDS = metrics.REGISTRY.histogram("ltx_stage_seconds", "Latency per stage", ("stage",))
+CACHE_REQUESTS = metrics.REGISTRY.counter("ltx_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+WORKER_ID = os.environ.get("RUNPOD_POD_ID", "local")
+metrics.register_gpu_metrics()
+jobs_handled = 0
+
+# ワーカーの GPU に合わせたデフォルト値と上限
+_gpus = discover_gpus()
+PROFILE = detect_profile(_gpus[0]["name"], _gpus[0]["total_bytes"]) if _gpus else detect_profile()
+print(f"[HANDLER] GPU profile: {PROFILE['name']}", flush=True)
+
+# コンパイル結果のキャッシュ（Network Volume 上、Pod の server.py と共有）
+compile_cache = CompileCache(
+    os.environ.get("COMPILE_CACHE_DIR", f"{VOLUME_PATH}/compile_cache"),
+    max_entries=int(os.environ.get("COMPILE_CACHE_ENTRIES", "16")),
+    versions=lambda: default_versions(VENV_PYTHON, [
+        f"{MODEL_DIR}/ltx-2-19b-dev-fp8.safetensors",
+        f"{MODEL_DIR}/ltx-2-19b-distilled-lora-384.safetensors",
+        f"{MODEL_DIR}/ltx-2-spatial-upscaler-x2-1.0.safetensors",
+    ]),
+)
 
 # LTX-2 パッケージパスを環境変数に追加
 os.environ["PYTHONPATH"] = f"{LTX2_PATH}/packages/ltx-pipelines/src:{LTX2_PATH}/packages/ltx-core/src:" + os.environ.get("PYTHONPATH", "")
@@ -41,6 +91,8 @@ def run_generation(
     steps: int = 8,
     image_path: str = None,
     image_strength: float = 1.0,
+    frame_rate: float = None,
+    extra_env: dict = None,
 ):
     """
     LTX-2 CLIで動画生成
@@ -48,6 +100,8 @@ def run_generation(
     Args:
         image_path: I2V用の入力画像パス（Noneの場合はT2V）
         image_strength: 画像の影響度（0.0-1.0、デフォルト1.0）
+        frame_rate: 生成fps（低fpsモード用、Noneの場合はCLIのデフォルト）
+        extra_env: 子プロセスに追加する環境変数（コンパイルキャッシュの場所など）
     """
 
     cmd = [
@@ -68,6 +122,9 @@ def run_generation(
     if negative_prompt:
         cmd.extend(["--negative-prompt", negative_prompt])
 
+    if frame_rate:
+        cmd.extend(["--frame-rate", str(frame_rate)])
+
     # Always use a seed (random if not provided)
     if seed is None:
         seed = random.randint(0, 2147483647)
@@ -84,6 +141,7 @@ def run_generation(
     # 環境変数にPYTHONPATHを追加
     env = os.environ.copy()
     env["PYTHONPATH"] = f"{LTX2_PATH}/packages/ltx-pipelines/src:{LTX2_PATH}/packages/ltx-core/src:" + env.get("PYTHONPATH", "")
+    env.update(extra_env or {})
 
     result = subprocess.run(
         cmd,
@@ -111,36 +169,77 @@ def handler(job):
     Supports:
     - Text-to-Video (T2V): promptのみで動画生成
     - Image-to-Video (I2V): prompt + image_base64で画像から動画生成
+    - 低fpsモード: internal_fps で生成し、fps へCPUで補間 (interpolator で方式指定)
+    - output_format: mp4 / mp4+frames / frames（フレーム配列 .npy と .wav を FRAMES_DIR に書いてパスを返す）
+    - preview: 本番の前に同じシードの低解像度プレビューを作り progress_update で送る
+      （/status の output に入るので、見て悪ければ Runpod の /cancel で止める）
+    - exact_shape: バケットに丸めず width x height のまま生成（automation の低解像度ドラフト用）
     """
 
+    global jobs_handled
+
     job_input = job["input"]
+    job_start = time.time()
+    outcome = "failed"
 
     # 入力パラメータ
     prompt = job_input.get("prompt")
     if not prompt:
-        return {"error": "prompt is required"}
+        return reject("prompt is required")
 
     negative_prompt = job_input.get("negative_prompt", "")
     duration = job_input.get("duration", 3)
-    width = job_input.get("width", 1280)
-    height = job_input.get("height", 768)
+    width = job_input.get("width") or PROFILE["default_width"]
+    height = job_input.get("height") or PROFILE["default_height"]
     fps = job_input.get("fps", 24)
     seed = job_input.get("seed")
-    steps = job_input.get("steps", 8)
+    steps = job_input.get("steps") or PROFILE["default_steps"]
 
     # I2V用パラメータ
     image_base64 = job_input.get("image_base64")
     image_strength = job_input.get("image_strength", 1.0)
 
+    # 低fpsモード: internal_fps で生成 → fps に補間
+    internal_fps = job_input.get("internal_fps")
+    interpolator = job_input.get("interpolator", "minterpolate")
+    interpolator_error = check_interpolator(interpolator)
+    if interpolator_error:
+        return reject(interpolator_error)
+    low_fps = bool(internal_fps) and internal_fps < fps
+    generation_fps = internal_fps if low_fps else fps
+
     # フレーム数計算 (8の倍数+1)
-    num_frames = int(duration * fps)
-    num_frames = ((num_frames - 1) // 8) * 8 + 1
+    num_frames = snap_frames(duration, generation_fps)
+    limit_error = check_limits(PROFILE, width, height, duration, num_frames)
+    if limit_error:
+        return reject(limit_error)
+
+    # 決まった形（バケット）で生成して後で要求サイズへ戻す（exact_shape なら要求どおり: 低解像度ドラフト用）
+    if job_input.get("exact_shape"):
+        bucket = buckets.exact_plan(width, height, num_frames)
+    else:
+        try:
+            bucket = buckets.plan(
+                width, height, num_frames, job_input.get("bucket_fit", "crop"), frame_buckets=not low_fps,
+            )
+        except ValueError as e:
+            return reject(str(e))
+        if check_limits(PROFILE, bucket["width"], bucket["height"], duration, bucket["frames"]):
+            bucket = buckets.exact_plan(width, height, num_frames)
+
+    output_format = job_input.get("output_format", "mp4")
+    if output_format not in frames_io.OUTPUT_FORMATS:
+        return reject(f"Unknown output_format '{output_format}'. Available: {list(frames_io.OUTPUT_FORMATS)}")
 
     # 出力パス
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(INPUT_DIR, exist_ok=True)
+    for manager in retention:
+        manager.sweep()
     job_id = str(uuid.uuid4())[:8]
     output_path = f"{OUTPUT_DIR}/{job_id}.mp4"
+    interp_path = f"{OUTPUT_DIR}/{job_id}_{fps}fps.mp4"
+    restore_path = f"{OUTPUT_DIR}/{job_id}_restore.mp4"
 
     # I2V: 画像をデコードして保存
     image_path = None
@@ -152,49 +251,157 @@ def handler(job):
                 f.write(image_bytes)
             print(f"I2V mode: saved input image to {image_path}")
         except Exception as e:
-            return {"error": f"Failed to decode image: {str(e)}"}
+            _cleanup(image_path)
+            return reject(f"Failed to decode image: {str(e)}")
+
+    # 検証を通ったジョブだけを生成の開始として数える（弾いたジョブは reject() で記録済み）
+    start = "cold" if jobs_handled == 0 else "warm"
+    jobs_handled += 1
+    JOB_STARTS.inc(start=start)
 
     mode = "I2V" if image_path else "T2V"
 
     try:
         print(f"[{mode}] Generating: {prompt[:50]}...")
 
-        run_generation(
-            prompt=prompt,
-            output_path=output_path,
-            negative_prompt=negative_prompt,
-            num_frames=num_frames,
-            width=width,
-            height=height,
-            seed=seed,
-            steps=steps,
-            image_path=image_path,
-            image_strength=image_strength,
-        )
+        if job_input.get("preview"):
+            # プレビューと本番でシードを揃える
+            seed = random.randint(0, 2147483647) if seed is None else seed
+            preview_base64 = render_preview(
+                prompt, negative_prompt, bucket, duration, seed, image_path, image_strength,
+                f"{OUTPUT_DIR}/{job_id}_preview",
+            )
+            runpod.serverless.progress_update(job, {"phase": "preview", "seed": seed, "preview_jpeg_base64": preview_base64})
+
+        generation_start = time.time()
+        with compile_cache.use(bucket["name"]) as compiled:
+            CACHE_REQUESTS.inc(cache="compile", result="hit" if compiled["hit"] else "miss")
+            run_generation(
+                prompt=prompt,
+                output_path=output_path,
+                negative_prompt=negative_prompt,
+                num_frames=bucket["frames"],
+                width=bucket["width"],
+                height=bucket["height"],
+                seed=seed,
+                steps=steps,
+                image_path=image_path,
+                image_strength=image_strength,
+                frame_rate=generation_fps if low_fps else None,
+                extra_env=compiled["env"],
+            )
+        generation_seconds = time.time() - generation_start
+        STAGE_SECONDS.observe(generation_seconds, stage="generation")
+
+        resolution = f"{width}x{height}"
+        if buckets.needs_restore(bucket):
+            buckets.restore(output_path, restore_path, bucket, generation_fps)
+            os.replace(restore_path, output_path)
+        elif not bucket["exact"]:
+            num_frames = bucket["frames"]
+            resolution = f"{bucket['width']}x{bucket['height']}"
+
+        fps_info = {}
+        if low_fps:
+            output_frames = snap_frames(duration, fps)
+            interpolation_seconds = 0.0
+            if interpolator != "none":
+                print(f"[INTERP] {generation_fps}fps -> {fps}fps ({interpolator})", flush=True)
+                interpolation_seconds = interpolate(output_path, interp_path, fps, interpolator)
+                STAGE_SECONDS.observe(interpolation_seconds, stage="interpolation")
+                os.replace(interp_path, output_path)
+            fps_info = {
+                "internal_fps": generation_fps,
+                "fps": fps if interpolator != "none" else generation_fps,
+                "interpolator": interpolator,
+                "output_frames": output_frames,
+                "generation_seconds": round(generation_seconds, 1),
+                "interpolation_seconds": round(interpolation_seconds, 1),
+                "gpu_seconds_saved": estimate_gpu_seconds_saved(generation_seconds, bucket["frames"], output_frames),
+            }
+
+        frames_info = {}
+        if frames_io.wants_frames(output_format):
+            os.makedirs(FRAMES_DIR, exist_ok=True)
+            frames_info = frames_io.export(output_path, f"{FRAMES_DIR}/{job_id}")
+            STAGE_SECONDS.observe(frames_info.pop("seconds"), stage="frames_export")
 
         # Base64エンコード
-        with open(output_path, "rb") as f:
-            video_base64 = base64.b64encode(f.read()).decode("utf-8")
-
-        # クリーンアップ
-        os.remove(output_path)
-        if image_path and os.path.exists(image_path):
-            os.remove(image_path)
+        video_base64 = None
+        if frames_io.wants_mp4(output_format):
+            with STAGE_SECONDS.time(stage="encode"):
+                with open(output_path, "rb") as f:
+                    video_base64 = base64.b64encode(f.read()).decode("utf-8")
 
+        outcome = "completed"
         return {
             "status": "success",
             "mode": mode,
             "video_base64": video_base64,
+            **frames_info,
             "duration": duration,
-            "resolution": f"{width}x{height}",
+            "resolution": resolution,
             "frames": num_frames,
+            "bucket": bucket["name"],
+            "seed": seed,
+            "compile_cache": "hit" if compiled["hit"] else "miss",
+            **fps_info,
         }
 
     except Exception as e:
-        # エラー時もクリーンアップ
-        if image_path and os.path.exists(image_path):
-            os.remove(image_path)
         return {"error": str(e)}
 
+    finally:
+        # 成功 / 失敗どちらでも一時ファイルを残さない
+        _cleanup(output_path, interp_path, restore_path, image_path)
+        total_seconds = time.time() - job_start
+        STAGE_SECONDS.observe(total_seconds, stage="total")
+        JOBS_TOTAL.inc(outcome=outcome)
+        print(f"[METRICS] {outcome} {start} start, {total_seconds:.1f}s total", flush=True)
+        metrics.export("ltx_handler", worker=WORKER_ID)
+
+
+def reject(error: str) -> dict:
+    """入力の検証で弾いたジョブ（GPU は使わない）も結果別の件数に残してエラーを返す"""
+    JOBS_TOTAL.inc(outcome="rejected")
+    print(f"[METRICS] rejected: {error}", flush=True)
+    metrics.export("ltx_handler", worker=WORKER_ID)
+    return {"error": error}
+
+
+def render_preview(prompt, negative_prompt, bucket, duration, seed, image_path, image_strength, base_path) -> str:
+    """
+    同じシードで半分の解像度・PREVIEW_FPS・PREVIEW_STEPS の短い生成をして、
+    数フレームを並べた JPEG を base64 で返す（構図の確認用で、本番と同一ではない）
+    """
+    video_path = f"{base_path}.mp4"
+    jpeg_path = f"{base_path}.jpg"
+    try:
+        with STAGE_SECONDS.time(stage="preview"):
+            run_generation(
+                prompt=prompt,
+                output_path=video_path,
+                negative_prompt=negative_prompt,
+                num_frames=snap_frames(duration, PREVIEW_FPS),
+                width=max(256, bucket["width"] // 2 // 32 * 32),
+                height=max(256, bucket["height"] // 2 // 32 * 32),
+                seed=seed,
+                steps=PREVIEW_STEPS,
+                image_path=image_path,
+                image_strength=image_strength,
+                frame_rate=PREVIEW_FPS,
+            )
+            frames_io.contact_sheet(video_path, jpeg_path)
+        with open(jpeg_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    finally:
+        _cleanup(video_path, jpeg_path)
+
+
+def _cleanup(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
 
 runpod.serverless.start({"handler": handler})
@@ -0,0 +1,99 @@
+"""
+Frame interpolation post stage (CPU)
+低fpsで生成した動画を配信fpsに補間する
+
+Interpolators are pluggable: register a function (input_path, output_path, fps)
+with @register_interpolator("name") and select it by name in the request.
+"""
+
+import shutil
+import subprocess
+import time
+from typing import Optional
+
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
+
+INTERPOLATORS = {}
+
+
+def register_interpolator(name: str):
+    """補間器を登録するデコレータ"""
+    def decorator(func):
+        INTERPOLATORS[name] = func
+        return func
+    return decorator
+
+
+def _run_ffmpeg_filter(input_path: str, output_path: str, video_filter: str):
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", input_path,
+        "-vf", video_filter,
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
+        "-c:a", "copy",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=900)
+    if result.returncode != 0:
+        raise Exception(f"Interpolation failed: {result.stderr[-2000:]}")
+
+
+@register_interpolator("minterpolate")
+def minterpolate(input_path: str, output_path: str, fps: int):
+    """ffmpeg モーション補間（高品質・CPU負荷高）"""
+    _run_ffmpeg_filter(
+        input_path, output_path,
+        f"minterpolate=fps={fps}:mi_mode=mci:mc_mode=aobmc:me_mode=bidir:vsbmc=1",
+    )
+
+
+@register_interpolator("blend")
+def blend(input_path: str, output_path: str, fps: int):
+    """フレームブレンド（高速・動きの速いシーンはゴーストが出る）"""
+    _run_ffmpeg_filter(input_path, output_path, f"framerate=fps={fps}")
+
+
+@register_interpolator("duplicate")
+def duplicate(input_path: str, output_path: str, fps: int):
+    """フレーム複製（最速・カクつきは残る）"""
+    _run_ffmpeg_filter(input_path, output_path, f"fps={fps}")
+
+
+def check_interpolator(method: str) -> Optional[str]:
+    """補間方式名の確認（GPU で生成する前に呼ぶ）。問題なければ None、あればエラーメッセージ"""
+    if method != "none" and method not in INTERPOLATORS:
+        return f"Unknown interpolator '{method}'. Available: {sorted(INTERPOLATORS) + ['none']}"
+    return None
+
+
+def interpolate(input_path: str, output_path: str, fps: int, method: str = "minterpolate") -> float:
+    """
+    動画を指定fpsに補間
+
+    Returns:
+        補間にかかった秒数
+    """
+    if method not in INTERPOLATORS:
+        raise ValueError(f"Unknown interpolator '{method}'. Available: {sorted(INTERPOLATORS)}")
+
+    start = time.time()
+    INTERPOLATORS[method](input_path, output_path, fps)
+    return time.time() - start
+
+
+def snap_frames(duration: float, fps: float) -> int:
+    """フレーム数計算 (8の倍数+1)"""
+    num_frames = int(duration * fps)
+    return ((num_frames - 1) // 8) * 8 + 1
+
+
+def estimate_gpu_seconds_saved(generation_seconds: float, generated_frames: int, delivered_frames: int) -> float:
+    """
+    配信fpsで直接生成した場合との差分（GPU秒）の概算
+
+    生成時間はフレーム数にほぼ比例（attentionは超線形なので実際はこれ以上）と仮定
+    """
+    if generated_frames <= 0 or delivered_frames <= generated_frames:
+        return 0.0
+    return round(generation_seconds * (delivered_frames / generated_frames - 1), 1)
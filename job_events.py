@@ -0,0 +1,133 @@
+"""
+Job event bus + Server-Sent Events helpers (server.py)
+
+生成スレッドから publish() したイベントを、イベントループ上の購読者
+（/events の SSE 接続）へ配る。購読者の管理はループスレッドだけで行い、
+別スレッドからの publish は call_soon_threadsafe で受け渡す。
+
+ProgressTracker は LTX CLI の tqdm 出力からステップ数と ETA を取り出す。
+"""
+
+import asyncio
+import json
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+# イベント種別
+STATE = "state"
+PROGRESS = "progress"
+COMPLETED = "completed"
+FAILED = "failed"
+TERMINAL_EVENTS = (COMPLETED, FAILED)
+
+
+class EventBus:
+    """ジョブごとのイベント配信"""
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: Dict[str, set] = {}
+        self.published = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """配信先のイベントループ（サーバー起動時に設定）"""
+        self.loop = loop
+
+    def publish(self, job_id: str, event_type: str, **data):
+        """イベントを発行（どのスレッドからでも可）"""
+        if self.loop is None or self.loop.is_closed():
+            return
+        event = {"job_id": job_id, "event": event_type, "time": round(time.time(), 3), **data}
+        self.published += 1
+        self.loop.call_soon_threadsafe(self._dispatch, job_id, event)
+
+    def _dispatch(self, job_id: str, event: Dict):
+        for queue in self.subscribers.get(job_id, ()):
+            queue.put_nowait(event)
+
+    @contextmanager
+    def subscribe(self, job_ids: Iterable[str]):
+        """複数ジョブのイベントを1つのキューで受け取る（ループスレッドから呼ぶ）"""
+        queue = asyncio.Queue()
+        job_ids = list(job_ids)
+        for job_id in job_ids:
+            self.subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            for job_id in job_ids:
+                queue_set = self.subscribers.get(job_id)
+                if queue_set is not None:
+                    queue_set.discard(queue)
+                    if not queue_set:
+                        del self.subscribers[job_id]
+
+    @property
+    def connections(self) -> int:
+        return len({id(q) for qs in self.subscribers.values() for q in qs})
+
+
+def format_sse(event: Dict, event_id: Optional[int] = None) -> str:
+    """SSE の1メッセージ"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _parse_clock(value: str) -> Optional[int]:
+    """tqdm の "MM:SS" / "H:MM:SS" を秒に"""
+    if not value or "?" in value:
+        return None
+    seconds = 0
+    for part in value.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+class ProgressTracker:
+    """
+    tqdm の進捗行からステップと ETA を追跡
+
+    2段階パイプラインではバーが2本出るので、カウンタが戻るか total が
+    変わったら次のステージとして数える。
+    """
+
+    PATTERN = re.compile(r"(\d+)/(\d+)\s*\[([\d:]+)<([\d:?]+)")
+
+    def __init__(self):
+        self.stage = 0
+        self.step: Optional[int] = None
+        self.total: Optional[int] = None
+
+    def feed(self, line: str) -> Optional[Dict]:
+        """
+        出力1行を解釈
+
+        Returns:
+            ステップが進んだら {"stage", "step", "total", "percent", "eta_seconds"}、それ以外は None
+        """
+        match = self.PATTERN.search(line)
+        if not match:
+            return None
+
+        step, total = int(match.group(1)), int(match.group(2))
+        if total <= 0:
+            return None
+        if self.step is None or step < self.step or total != self.total:
+            self.stage += 1
+        elif step == self.step:
+            return None
+
+        self.step, self.total = step, total
+        return {
+            "stage": self.stage,
+            "step": step,
+            "total": total,
+            "percent": round(100 * step / total, 1),
+            "eta_seconds": _parse_clock(match.group(4)),
+        }
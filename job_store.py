@@ -0,0 +1,382 @@
+"""
+Shared job store for cluster mode (server.py)
+
+複数 Pod で1つのジョブキューを共有する。API ノードは submit() でジョブを登録し、
+GPU ワーカーは lease() でジョブを借りて heartbeat() で期限を延ばしながら生成する。
+ワーカーが落ちて期限が切れたジョブは requeue_expired() で pending に戻る
+（max_attempts 回失敗したら failed）。
+
+- SQLiteStore: Network Volume 上の SQLite（全 Pod から同じファイルを開く）
+- MemoryStore: 1プロセス内の代用（ローカルでの動作確認用）
+
+ジョブは server.py の jobs と同じ形の dict:
+    status, request, key, callbacks, coalesced, created_at, progress, progress_detail,
+    result, error, gpu, worker, attempts
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+PENDING = "pending"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+ACTIVE_STATES = (PENDING, PROCESSING)
+
+# 専用カラムに持つ項目（それ以外は data の JSON）
+_COLUMNS = ("status", "key", "worker", "lease_expires", "attempts", "created_at", "updated_at")
+
+
+def _new_job(job: Dict) -> Dict:
+    now = time.time()
+    return {
+        "status": PENDING,
+        "callbacks": [],
+        "coalesced": 0,
+        "attempts": 0,
+        "worker": None,
+        "lease_expires": None,
+        **job,
+        "created_at": job.get("created_at", now),
+        "updated_at": now,
+    }
+
+
+class JobStore:
+    """ジョブストアの共通インターフェース"""
+
+    def submit(self, job_id: str, job: Dict, coalesce: bool = True) -> Tuple[str, bool]:
+        """
+        ジョブを登録（coalesce なら同じ key の未完了ジョブに相乗り）
+
+        Returns:
+            (job_id, coalesced) 相乗りした場合は既存の job_id
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, worker: Optional[str] = None, **fields) -> bool:
+        """
+        項目を更新
+
+        worker を指定するとそのワーカーがリースを持っている間だけ更新する
+        （期限切れで他のワーカーに渡ったジョブを上書きしないため）
+        """
+        raise NotImplementedError
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[Tuple[str, Dict]]:
+        """最も古い pending ジョブを借りる（なければ None）"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker: str, lease_seconds: float, **fields) -> bool:
+        """リースを延長（もう持っていなければ False）"""
+        return self.update(job_id, worker=worker, lease_expires=time.time() + lease_seconds, **fields)
+
+    def finish(self, job_id: str, worker: str, status: str, **fields) -> bool:
+        """completed / failed にしてリースを返す"""
+        return self.update(job_id, worker=worker, status=status, lease_expires=None, **fields)
+
+    def requeue_expired(self, max_attempts: int = 3) -> int:
+        """期限切れのリースを pending に戻す（試行回数を超えたら failed）"""
+        raise NotImplementedError
+
+    def list(self, limit: int = 100) -> List[Tuple[str, Dict]]:
+        """新しい順"""
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        """状態ごとの件数"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStore(JobStore):
+    """1プロセス内のジョブストア"""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, job, coalesce=True):
+        with self._lock:
+            if coalesce and job.get("key"):
+                for existing_id, existing in self.jobs.items():
+                    if existing["key"] == job["key"] and existing["status"] in ACTIVE_STATES:
+                        existing["callbacks"].extend(job.get("callbacks", []))
+                        existing["coalesced"] += 1
+                        existing["updated_at"] = time.time()
+                        return existing_id, True
+            self.jobs[job_id] = _new_job(job)
+            return job_id, False
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+    def update(self, job_id, worker=None, **fields):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or (worker is not None and job["worker"] != worker):
+                return False
+            job.update(fields, updated_at=time.time())
+            return True
+
+    def lease(self, worker, lease_seconds):
+        with self._lock:
+            pending = [(j["created_at"], job_id) for job_id, j in self.jobs.items() if j["status"] == PENDING]
+            if not pending:
+                return None
+            job_id = min(pending)[1]
+            job = self.jobs[job_id]
+            job.update(
+                status=PROCESSING, worker=worker, lease_expires=time.time() + lease_seconds,
+                attempts=job["attempts"] + 1, updated_at=time.time(),
+            )
+            return job_id, json.loads(json.dumps(job))
+
+    def requeue_expired(self, max_attempts=3):
+        now = time.time()
+        count = 0
+        with self._lock:
+            for job in self.jobs.values():
+                if job["status"] == PROCESSING and job["lease_expires"] is not None and job["lease_expires"] < now:
+                    _expire(job, max_attempts)
+                    count += 1
+        return count
+
+    def list(self, limit=100):
+        with self._lock:
+            items = sorted(self.jobs.items(), key=lambda item: item[1]["created_at"], reverse=True)
+            return [(job_id, dict(job)) for job_id, job in items[:limit]]
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+
+def _expire(job: Dict, max_attempts: int):
+    """期限切れリースの後始末（job を直接書き換える）"""
+    lost = f"Worker {job['worker']} lost its lease"
+    if job["attempts"] >= max_attempts:
+        job.update(status=FAILED, error=f"{lost} ({job['attempts']} attempts)")
+    else:
+        job.update(status=PENDING, progress=f"Requeued: {lost}")
+    job.update(worker=None, lease_expires=None, updated_at=time.time())
+
+
+class SQLiteStore(JobStore):
+    """
+    SQLite のジョブストア
+
+    Network Volume は共有メモリが使えないので WAL ではなく rollback journal。
+    書き込みは BEGIN IMMEDIATE で直列化し、ロック待ちは busy_timeout に任せる。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            key TEXT,
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+        CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+            db.execute("PRAGMA journal_mode = DELETE")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = json.loads(row["data"])
+        job.update({name: row[name] for name in _COLUMNS})
+        return job
+
+    @staticmethod
+    def _split(job: Dict) -> Tuple[Dict, str]:
+        columns = {name: job.get(name) for name in _COLUMNS}
+        data = {k: v for k, v in job.items() if k not in _COLUMNS}
+        return columns, json.dumps(data, ensure_ascii=False)
+
+    def _write(self, db: sqlite3.Connection, job_id: str, job: Dict):
+        columns, data = self._split(job)
+        db.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, key, worker, lease_expires, attempts, created_at, updated_at, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, columns["status"], columns["key"], columns["worker"], columns["lease_expires"],
+             columns["attempts"], columns["created_at"], columns["updated_at"], data),
+        )
+
+    def _read(self, db: sqlite3.Connection, job_id: str) -> Optional[Dict]:
+        row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def submit(self, job_id, job, coalesce=True):
+        with self._transaction() as db:
+            if coalesce and job.get("key"):
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                    (job["key"], *ACTIVE_STATES),
+                ).fetchone()
+                if row:
+                    existing = self._row_to_job(row)
+                    existing["callbacks"].extend(job.get("callbacks", []))
+                    existing["coalesced"] += 1
+                    existing["updated_at"] = time.time()
+                    self._write(db, row["job_id"], existing)
+                    return row["job_id"], True
+            self._write(db, job_id, _new_job(job))
+            return job_id, False
+
+    def get(self, job_id):
+        return self._read(self._connect(), job_id)
+
+    def update(self, job_id, worker=None, **fields):
+        with self._transaction() as db:
+            job = self._read(db, job_id)
+            if job is None or (worker is not None and job["worker"] != worker):
+                return False
+            job.update(fields, updated_at=time.time())
+            self._write(db, job_id, job)
+            return True
+
+    def lease(self, worker, lease_seconds):
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._row_to_job(row)
+            job.update(
+                status=PROCESSING, worker=worker, lease_expires=time.time() + lease_seconds,
+                attempts=job["attempts"] + 1, updated_at=time.time(),
+            )
+            self._write(db, row["job_id"], job)
+            return row["job_id"], job
+
+    def requeue_expired(self, max_attempts=3):
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT * FROM jobs WHERE status = ? AND lease_expires < ?", (PROCESSING, time.time())
+            ).fetchall()
+            for row in rows:
+                job = self._row_to_job(row)
+                _expire(job, max_attempts)
+                self._write(db, row["job_id"], job)
+            return len(rows)
+
+    def list(self, limit=100):
+        rows = self._connect().execute(
+            "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [(row["job_id"], self._row_to_job(row)) for row in rows]
+
+    def counts(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+def open_store(spec: str) -> JobStore:
+    """"memory" なら MemoryStore、それ以外は SQLite のパス"""
+    if spec == "memory":
+        return MemoryStore()
+    return SQLiteStore(spec)
+
+
+class LeaseKeeper:
+    """
+    生成中のリースを定期的に延長するスレッド
+
+    fields() の戻り値（進捗など）も一緒に書き込む。リースを失ったら lost が立ち、on_lost が呼ばれる
+    （生成を止めるのは呼び出し側: 例えばキャンセル用の Event を立てる）。
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        job_id: str,
+        worker: str,
+        lease_seconds: float,
+        fields: Optional[Callable[[], Dict]] = None,
+        on_lost: Optional[Callable[[], None]] = None,
+    ):
+        self.store = store
+        self.job_id = job_id
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.fields = fields or dict
+        self.on_lost = on_lost
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.store.heartbeat(self.job_id, self.worker, self.lease_seconds, **self.fields()):
+                    print(f"[CLUSTER] Lost lease on job {self.job_id}", flush=True)
+                    self.lost.set()
+                    if self.on_lost is not None:
+                        self.on_lost()
+                    return
+            except Exception as e:
+                # 一時的なロック待ち / I/O エラーは次の周期で再試行
+                print(f"[CLUSTER] Heartbeat failed for job {self.job_id}: {e}", flush=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join(timeout=5)
@@ -0,0 +1,309 @@
+"""
+Metrics registry (Prometheus text format) + exporters
+
+- server.py は GET /metrics で render() を返す
+- handler.py / automation スクリプトは export() で JSONL 追記 / Pushgateway へ送信
+  （METRICS_PATH / PUSHGATEWAY_URL 環境変数、未設定なら何もしない）
+
+外部ライブラリなし。Counter / Gauge / Histogram はラベル付きでスレッドセーフ。
+"""
+
+import json
+import math
+import os
+import shutil
+import subprocess
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 動画生成向けのレイテンシバケット（秒）
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+
+METRICS_PATH = os.environ.get("METRICS_PATH", "")
+PUSHGATEWAY_URL = os.environ.get("PUSHGATEWAY_URL", "")
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict) -> Tuple:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {list(labelnames)}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Dict] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, Tuple, Optional[Dict], float]]:
+        """(suffix, label values, extra labels, value) の一覧"""
+        with self._lock:
+            return [("", key, None, value) for key, value in self._values.items()]
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {"labels": dict(zip(self.labelnames, key)), "value": value}
+                for key, value in self._values.items()
+            ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with ブロックの経過秒を記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state["counts"]):
+                    out.append(("_bucket", key, {"le": _format_value(bound)}, count))
+                out.append(("_sum", key, None, state["sum"]))
+                out.append(("_count", key, None, state["count"]))
+        return out
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "labels": dict(zip(self.labelnames, key)),
+                    "count": state["count"],
+                    "sum": round(state["sum"], 3),
+                    "buckets": {_format_value(b): c for b, c in zip(self.buckets, state["counts"])},
+                }
+                for key, state in self._values.items()
+            ]
+
+
+class Registry:
+    """メトリクスの登録とテキスト出力"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help: str, labelnames: Sequence[str] = (), **kwargs) -> Metric:
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, func: Callable[[], None]):
+        """出力直前に呼ばれる関数（ゲージを最新値に更新する用）"""
+        self.collectors.append(func)
+
+    def collect(self):
+        for func in self.collectors:
+            try:
+                func()
+            except Exception as e:
+                print(f"[METRICS] Collector {getattr(func, '__name__', func)} failed: {e}", flush=True)
+
+    def render(self) -> str:
+        """Prometheus テキスト形式"""
+        self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, key, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """JSON 向けの全メトリクス"""
+        self.collect()
+        return {
+            name: {"type": metric.type, "samples": metric.snapshot()}
+            for name, metric in self.metrics.items()
+        }
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def gpu_memory() -> List[Dict]:
+    """
+    GPUごとのメモリ使用量（nvidia-smi）
+
+    生成は別プロセス (LTX CLI) なので、torch.cuda ではなくデバイス全体の値を見る
+    """
+    nvidia_smi = shutil.which("nvidia-smi")
+    if not nvidia_smi:
+        return []
+    try:
+        result = subprocess.run(
+            [nvidia_smi, "--query-gpu=index,memory.used,memory.total,utilization.gpu", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    gpus = []
+    for line in result.stdout.strip().splitlines():
+        index, used, total, util = [v.strip() for v in line.split(",")]
+        gpus.append({
+            "gpu": index,
+            "used_bytes": int(used) * 1024 * 1024,
+            "total_bytes": int(total) * 1024 * 1024,
+            "utilization": float(util) if util.replace(".", "", 1).isdigit() else None,
+        })
+    return gpus
+
+
+def register_gpu_metrics(registry: Registry = REGISTRY):
+    """GPU メモリ / 使用率のゲージを登録（出力時に nvidia-smi で更新）"""
+    memory = registry.gauge("ltx_gpu_memory_bytes", "GPU memory by device", ("gpu", "kind"))
+    utilization = registry.gauge("ltx_gpu_utilization_percent", "GPU utilization by device", ("gpu",))
+
+    def collect_gpu():
+        for gpu in gpu_memory():
+            memory.set(gpu["used_bytes"], gpu=gpu["gpu"], kind="used")
+            memory.set(gpu["total_bytes"], gpu=gpu["gpu"], kind="total")
+            if gpu["utilization"] is not None:
+                utilization.set(gpu["utilization"], gpu=gpu["gpu"])
+
+    registry.add_collector(collect_gpu)
+
+
+def write_jsonl(path: str, job: str, registry: Registry = REGISTRY, **labels):
+    """スナップショットを JSONL に1行追記"""
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "job": job,
+        "labels": labels,
+        "metrics": registry.snapshot(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def push(url: str, job: str, registry: Registry = REGISTRY, **labels):
+    """Pushgateway へ PUT（/metrics/job/<job>/<label>/<value>...）"""
+    path = f"/metrics/job/{job}" + "".join(f"/{k}/{v}" for k, v in labels.items())
+    request = urllib.request.Request(
+        url.rstrip("/") + path,
+        data=registry.render().encode("utf-8"),
+        headers={"Content-Type": CONTENT_TYPE},
+        method="PUT",
+    )
+    with urllib.request.urlopen(request, timeout=10):
+        pass
+
+
+def export(job: str, registry: Registry = REGISTRY, path: Optional[str] = None, pushgateway: Optional[str] = None, **labels):
+    """
+    設定されている出力先すべてへ書き出す（失敗しても処理は止めない）
+
+    Args:
+        job: ジョブ名（Pushgateway の job ラベル / JSONL の job）
+        path: JSONL の出力先（省略時 METRICS_PATH）
+        pushgateway: Pushgateway URL（省略時 PUSHGATEWAY_URL）
+    """
+    path = path if path is not None else METRICS_PATH
+    pushgateway = pushgateway if pushgateway is not None else PUSHGATEWAY_URL
+    if path:
+        try:
+            write_jsonl(path, job, registry, **labels)
+        except OSError as e:
+            print(f"[METRICS] JSONL export failed: {e}", flush=True)
+    if pushgateway:
+        try:
+            push(pushgateway, job, registry, **labels)
+        except Exception as e:
+            print(f"[METRICS] Push failed: {e}", flush=True)
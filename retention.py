@@ -0,0 +1,217 @@
+"""
+Output retention manager
+出力ディレクトリの容量管理（クォータ / TTL / LRU 削除・使用中ファイルの保護）
+
+管理単位は root 直下のエントリ（ファイル or ディレクトリ丸ごと）。
+- TTL: 最終アクセスから ttl_seconds 経ったものを削除
+- クォータ: 合計が quota_bytes を超えたら最終アクセスが古い順に削除
+- 空き容量: ディスクの空きが min_free_bytes を切ったら同様に削除
+- pin() したエントリ（生成中・配信中のジョブ）は削除しない
+
+server.py（Pods）、handler.py（Serverless の /tmp）、automation/single_run.py が使用。
+"""
+
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+GB = 1024 ** 3
+
+
+class RetentionManager:
+    """出力ディレクトリのクォータ管理"""
+
+    def __init__(
+        self,
+        root: str,
+        quota_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        min_free_bytes: int = 0,
+        exclude: Iterable[str] = (),
+        on_evict: Optional[Callable[[Path], None]] = None,
+    ):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.min_free_bytes = min_free_bytes
+        self.exclude = set(exclude)
+        self.on_evict = on_evict
+        self.evicted = 0
+        self.freed_bytes = 0
+        self._pins: Dict[str, int] = {}
+        self._access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # --- 保護 / アクセス記録 ---
+
+    def _key(self, path) -> str:
+        """path を root 直下のエントリ名に"""
+        path = Path(path)
+        try:
+            return path.resolve().relative_to(self.root.resolve()).parts[0]
+        except (ValueError, IndexError):
+            return str(path)
+
+    def pin(self, path):
+        with self._lock:
+            key = self._key(path)
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, path):
+        with self._lock:
+            key = self._key(path)
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+            self._access[key] = time.time()
+
+    @contextmanager
+    def pinned(self, path):
+        """with 中は削除しない"""
+        self.pin(path)
+        try:
+            yield path
+        finally:
+            self.unpin(path)
+
+    def touch(self, path):
+        """アクセスを記録（LRU 順の更新）"""
+        with self._lock:
+            self._access[self._key(path)] = time.time()
+
+    # --- 集計 ---
+
+    def _entries(self) -> List[Dict]:
+        entries = []
+        if not self.root.exists():
+            return entries
+        for path in self.root.iterdir():
+            if path.name in self.exclude:
+                continue
+            try:
+                if path.is_dir():
+                    files = [p for p in path.rglob("*") if p.is_file()]
+                    size = sum(p.stat().st_size for p in files)
+                    mtime = max([p.stat().st_mtime for p in files] or [path.stat().st_mtime])
+                else:
+                    stat = path.stat()
+                    size, mtime = stat.st_size, stat.st_mtime
+            except FileNotFoundError:
+                continue
+            last_access = max(mtime, self._access.get(path.name, 0))
+            entries.append({"path": path, "size": size, "last_access": last_access})
+        return entries
+
+    def free_bytes(self) -> int:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return shutil.disk_usage(self.root).free
+
+    def usage(self) -> Dict:
+        """使用量（/health 用）"""
+        entries = self._entries()
+        disk = shutil.disk_usage(self.root) if self.root.exists() else None
+        return {
+            "used_bytes": sum(e["size"] for e in entries),
+            "quota_bytes": self.quota_bytes,
+            "files": len(entries),
+            "pinned": len(self._pins),
+            "free_bytes": disk.free if disk else None,
+            "disk_total_bytes": disk.total if disk else None,
+            "evicted": self.evicted,
+            "freed_bytes": self.freed_bytes,
+        }
+
+    # --- 削除 ---
+
+    def _remove(self, entry: Dict) -> bool:
+        path = entry["path"]
+        with self._lock:
+            if self._pins.get(path.name):
+                return False
+            self._access.pop(path.name, None)
+        try:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        except FileNotFoundError:
+            return False
+        self.evicted += 1
+        self.freed_bytes += entry["size"]
+        if self.on_evict:
+            self.on_evict(path)
+        return True
+
+    def sweep(self, reserve_bytes: int = 0) -> Dict:
+        """
+        TTL 切れを削除し、クォータ / 空き容量を満たすまで古い順に削除
+
+        Args:
+            reserve_bytes: これから書き込む分（空き容量の判定に上乗せ）
+
+        Returns:
+            Dict with deleted, freed_bytes, used_bytes, free_bytes
+        """
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda e: e["last_access"])
+        used = sum(e["size"] for e in entries)
+        free = self.free_bytes()
+        deleted = 0
+        freed = 0
+
+        for entry in entries:
+            expired = self.ttl_seconds is not None and now - entry["last_access"] > self.ttl_seconds
+            over_quota = self.quota_bytes is not None and used + reserve_bytes > self.quota_bytes
+            low_disk = free < self.min_free_bytes + reserve_bytes
+            if not (expired or over_quota or low_disk):
+                continue
+            if self._remove(entry):
+                deleted += 1
+                freed += entry["size"]
+                used -= entry["size"]
+                free += entry["size"]
+
+        if deleted:
+            print(f"[RETENTION] Deleted {deleted} entries ({freed / 1024 / 1024:.1f} MB) from {self.root}", flush=True)
+        return {"deleted": deleted, "freed_bytes": freed, "used_bytes": used, "free_bytes": free}
+
+    def ensure_space(self, reserve_bytes: int) -> bool:
+        """書き込み前に空きを確保（確保できなければ False）"""
+        result = self.sweep(reserve_bytes)
+        return result["free_bytes"] >= reserve_bytes
+
+    # --- 定期実行 ---
+
+    def start_sweeper(self, interval: float = 300):
+        """バックグラウンドで定期的に sweep()"""
+        if self._sweeper is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[RETENTION] Sweep failed: {e}", flush=True)
+
+        self._sweeper = threading.Thread(target=loop, name="retention-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+
+def estimate_output_bytes(width: int, height: int, duration: float) -> int:
+    """出力 mp4 サイズの大まかな見積もり（空き確保用、補間の一時ファイル込みで2倍）"""
+    bits_per_second = width * height * 0.25 * 24
+    return int(bits_per_second / 8 * duration * 2)
@@ -4,10 +4,10 @@ Pod管理 + 動画生成API
 """
 
 import os
-import time
-import requests
 import runpod
 
+from async_client import JobFailed, pod_client, run_sync, iterate_sync
+
 # 設定
 RUNPOD_API_KEY = os.environ.get("RUNPOD_API_KEY", "your_api_key_here")
 POD_ID = "i8k4ha2yjgdaep"  # 現在のPod ID
@@ -27,13 +27,16 @@ def get_api_url():
     return f"https://{POD_ID}-{API_PORT}.proxy.runpod.net"
 
 
+def _client():
+    """共有の非同期クライアント（接続プール + 適応ポーリング）"""
+    return pod_client(get_api_url(), poll_max=10)
+
+
 def health_check():
     """ヘルスチェック"""
-    url = f"{get_api_url()}/health"
     try:
-        r = requests.get(url, timeout=10)
-        return r.json()
-    except:
+        return run_sync(_client().health())
+    except Exception:
         return {"status": "unavailable"}
 
 
@@ -47,7 +50,6 @@ def generate_video(
     steps: int = 8,
 ):
     """動画生成ジョブを投入"""
-    url = f"{get_api_url()}/generate"
     data = {
         "prompt": prompt,
         "duration": duration,
@@ -59,43 +61,41 @@ def generate_video(
     if seed is not None:
         data["seed"] = seed
 
-    r = requests.post(url, json=data, timeout=30)
-    return r.json()
+    return run_sync(_client().submit(data)).data
 
 
 def get_job_status(job_id: str):
     """ジョブステータス確認"""
-    url = f"{get_api_url()}/status/{job_id}"
-    r = requests.get(url, timeout=10)
-    return r.json()
+    return run_sync(_client().status(job_id))
 
 
 def wait_for_completion(job_id: str, poll_interval: int = 10, timeout: int = 600):
-    """ジョブ完了を待つ"""
-    start = time.time()
-    while time.time() - start < timeout:
-        status = get_job_status(job_id)
-        print(f"Status: {status['status']}")
-
-        if status["status"] == "completed":
-            return status
-        elif status["status"] == "failed":
-            raise Exception(f"Job failed: {status.get('error')}")
+    """ジョブ完了を待つ（poll_interval はポーリング間隔の上限）"""
+    client = pod_client(get_api_url(), poll_max=poll_interval)
+    job = client.job(job_id)
 
-        time.sleep(poll_interval)
-
-    raise TimeoutError("Job timed out")
+    try:
+        for update in iterate_sync(client.updates([job], timeout=timeout)):
+            print(f"Status: {update.data.get('status')}")
+        return job.result()
+    except JobFailed as e:
+        raise Exception(f"Job failed: {e.error}")
+    except TimeoutError:
+        raise TimeoutError("Job timed out")
 
 
 def download_video(job_id: str, output_path: str):
-    """動画をダウンロード"""
-    url = f"{get_api_url()}/download/{job_id}"
-    r = requests.get(url, timeout=60)
-
-    with open(output_path, "wb") as f:
-        f.write(r.content)
-
-    print(f"Downloaded: {output_path}")
+    """動画をダウンロード（ストリーミング・Range 再開・サイズ / sha256 検証）"""
+    client = _client()
+    result = get_job_status(job_id).get("result") or {}
+    info = run_sync(client.download(
+        client.backend.download_url(job_id),
+        output_path,
+        expected_size=result.get("size"),
+        expected_sha256=result.get("sha256"),
+    ))
+
+    print(f"Downloaded: {output_path} ({info['size'] / 1024 / 1024:.1f} MB)")
     return output_path
 
 
@@ -1,23 +1,45 @@
 """
 LTX-2 Video Generation API Server
-FastAPI + RTX A5000 (24GB)
+FastAPI + GPU プロファイル自動選択 (24GB / 48GB / 80GB, gpu_profiles.py)
 CLI wrapper approach
 """
 
 import os
 import sys
+import json
+import socket
 import uuid
+import asyncio
 import base64
+import hashlib
+import random
 import subprocess
 import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional
 from contextlib import asynccontextmanager
 
 import torch
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, validator
+
+from interpolation import interpolate, check_interpolator, snap_frames, estimate_gpu_seconds_saved
+import job_events
+from job_events import EventBus, ProgressTracker, format_sse
+from retention import GB, RetentionManager, estimate_output_bytes
+from metrics import REGISTRY, CONTENT_TYPE, register_gpu_metrics
+from gpu_pool import GPUPool
+from gpu_profiles import check_limits, pixel_frames
+import buckets
+import frames_io
+from job_store import LeaseKeeper, open_store
+from compile_cache import CompileCache, default_versions
 
 # パス設定
 LTX2_PATH = "/workspace/LTX-2"
@@ -25,19 +47,180 @@ MODEL_DIR = os.environ.get("MODEL_DIR", "/workspace/models")
 OUTPUT_DIR = "/workspace/outputs"
 VENV_PYTHON = f"{LTX2_PATH}/.venv/bin/python"
 
-# 生成ジョブ管理
+# 出力の保持設定（クォータ / TTL / 最低空き容量）
+OUTPUT_QUOTA_GB = float(os.environ.get("OUTPUT_QUOTA_GB", "50"))
+OUTPUT_TTL_HOURS = float(os.environ.get("OUTPUT_TTL_HOURS", "72"))
+MIN_FREE_GB = float(os.environ.get("MIN_FREE_GB", "5"))
+RETENTION_SWEEP_SECONDS = 300
+
+# 生成ジョブ管理（このノードで生成中 / 生成したジョブ）
 jobs = {}
+events = EventBus()
+cancels = {}  # job_id -> threading.Event（/cancel で立てる）
+
+# 生成前の低解像度プレビュー（preview=true）: 半分の解像度・低fps・少ステップ
+PREVIEW_FPS = int(os.environ.get("PREVIEW_FPS", "8"))
+PREVIEW_STEPS = int(os.environ.get("PREVIEW_STEPS", "4"))
+PREVIEW_FRAMES = 4  # 並べて返すフレーム数
+
+# クラスタモード: 全 Pod で共有するジョブストア（SQLite のパス or "memory"）
+CLUSTER_STORE = os.environ.get("CLUSTER_STORE", "")
+CLUSTER_ROLE = os.environ.get("CLUSTER_ROLE", "all")  # api: 受付のみ / worker: 生成のみ / all: 両方
+CLUSTER_ROLES = ("api", "worker", "all")
+if CLUSTER_ROLE not in CLUSTER_ROLES:
+    raise ValueError(f"Unknown CLUSTER_ROLE: {CLUSTER_ROLE} (expected one of {CLUSTER_ROLES})")
+NODE_ID = os.environ.get("RUNPOD_POD_ID") or socket.gethostname()
+LEASE_SECONDS = 60
+LEASE_POLL_SECONDS = 2
+MAX_ATTEMPTS = 3
+store = open_store(CLUSTER_STORE) if CLUSTER_STORE else None
+cluster_stop = threading.Event()
+
+
+
+def evicted_result(result: dict, path: Path) -> Optional[dict]:
+    """
+    path が削除されたあとのジョブ結果（このジョブの出力でなければ None）
+
+    消えたファイルを evicted_files に記録し、主の出力（動画、frames のみなら frames）が
+    消えたときだけ evicted を立てる（.npy / .wav だけ消えても動画は残っている）
+    """
+    removed = [
+        key for key in ("video_path", "frames_path", "audio_path")
+        if result.get(key) and Path(result[key]).resolve() == path.resolve()
+    ]
+    if not removed:
+        return None
+    updated = {**result, "evicted_files": sorted(set(result.get("evicted_files", [])) | set(removed))}
+    primary = "video_path" if result.get("video_path") else "frames_path"
+    if primary in removed:
+        updated["evicted"] = True
+    return updated
+
+
+def on_output_evicted(path: Path):
+    """保持期限切れ / 容量超過で削除された出力をジョブ結果に反映"""
+    etags.pop(str(path), None)
+    job = jobs.get(path.stem)
+    if job and job.get("result"):
+        updated = evicted_result(job["result"], path)
+        if updated is not None:
+            job["result"] = updated
+    if store is not None:
+        shared = store.get(path.stem)
+        if shared and shared.get("result"):
+            updated = evicted_result(shared["result"], path)
+            if updated is not None:
+                store.update(path.stem, result=updated)
+
+
+retention = RetentionManager(
+    OUTPUT_DIR,
+    quota_bytes=int(OUTPUT_QUOTA_GB * GB),
+    ttl_seconds=OUTPUT_TTL_HOURS * 3600,
+    min_free_bytes=int(MIN_FREE_GB * GB),
+    on_evict=on_output_evicted,
+)
+
+# 処理中ジョブ: 正規化リクエストのハッシュ -> job_id（同一リクエストの相乗り用）
+inflight = {}
+inflight_lock = threading.Lock()
+
+# GPU ごとに1件ずつ生成（全 GPU が埋まっている間は pending のまま）
+GPU_DISPATCH = os.environ.get("GPU_DISPATCH", "least_loaded")  # least_loaded / vram_fit
+gpu_pool = GPUPool(policy=GPU_DISPATCH)
+# 生成ジョブ専用のスレッド（GPU 待ちで塞がっても API の to_thread が使う既定のスレッドプールを食わない）
+GENERATION_THREADS = int(os.environ.get("GENERATION_THREADS", "32"))
+generation_executor = ThreadPoolExecutor(max_workers=GENERATION_THREADS, thread_name_prefix="generation")
+# デフォルト値と上限（複数 GPU なら最も大きいもの。GPU のない API ノードは GPU_PROFILE で指定）
+profile = gpu_pool.largest_profile()
+
+# コンパイル結果のキャッシュ（MODEL_DIR と同じ Network Volume、バケット × バージョンごと）
+COMPILE_CACHE_DIR = os.environ.get("COMPILE_CACHE_DIR", f"{os.path.dirname(MODEL_DIR)}/compile_cache")
+COMPILE_CACHE_ENTRIES = int(os.environ.get("COMPILE_CACHE_ENTRIES", "16"))
+COMPILE_CACHE_GB = float(os.environ.get("COMPILE_CACHE_GB", "20"))
+COMPILE_PREWARM = int(os.environ.get("COMPILE_PREWARM", "0"))  # 起動時に事前コンパイルする上位バケット数
+compile_cache = CompileCache(
+    COMPILE_CACHE_DIR,
+    max_entries=COMPILE_CACHE_ENTRIES,
+    max_bytes=int(COMPILE_CACHE_GB * GB),
+    versions=lambda: default_versions(VENV_PYTHON, [
+        f"{MODEL_DIR}/ltx-2-19b-dev-fp8.safetensors",
+        f"{MODEL_DIR}/ltx-2-19b-distilled-lora-384.safetensors",
+        f"{MODEL_DIR}/ltx-2-spatial-upscaler-x2-1.0.safetensors",
+    ]),
+)
+SERVER_STARTED = time.time()
+
+# メトリクス (/metrics)
+JOBS_TOTAL = REGISTRY.counter("ltx_jobs_total", "Finished jobs by outcome", ("outcome",))
+JOBS_BY_STATE = REGISTRY.gauge("ltx_jobs", "Jobs currently known to the server by state", ("state",))
+QUEUE_DEPTH = REGISTRY.gauge("ltx_queue_depth", "Jobs waiting for the GPU")
+STAGE_SECONDS = REGISTRY.histogram("ltx_stage_seconds", "Latency per stage", ("stage",))
+JOB_STARTS = REGISTRY.counter("ltx_job_starts_total", "Generations by cold (first after start) or warm start", ("start",))
+CACHE_REQUESTS = REGISTRY.counter("ltx_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+DOWNLOAD_REQUESTS = REGISTRY.counter("ltx_download_requests_total", "/download responses by status", ("status",))
+BYTES_SENT = REGISTRY.counter("ltx_bytes_sent_total", "Video bytes sent by /download")
+STORAGE_BYTES = REGISTRY.gauge("ltx_storage_bytes", "Output volume usage", ("kind",))
+UPTIME = REGISTRY.gauge("ltx_uptime_seconds", "Seconds since server start")
+BUCKET_REQUESTS = REGISTRY.counter("ltx_bucket_requests_total", "Generations by shape bucket", ("bucket",))
+GPU_RUNNING = REGISTRY.gauge("ltx_gpu_jobs_running", "Generations running on the device", ("gpu",))
+GPU_BUSY_SECONDS = REGISTRY.gauge("ltx_gpu_busy_seconds", "Cumulative generation time per device", ("gpu",))
+register_gpu_metrics()
+
+
+def collect_server_metrics():
+    states = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+    if store is not None:
+        states.update(store.counts())
+    else:
+        for job in list(jobs.values()):
+            states[job["status"]] = states.get(job["status"], 0) + 1
+    for state, count in states.items():
+        JOBS_BY_STATE.set(count, state=state)
+    QUEUE_DEPTH.set(states["pending"])
+    usage = retention.usage()
+    STORAGE_BYTES.set(usage["used_bytes"], kind="used")
+    STORAGE_BYTES.set(usage["free_bytes"] or 0, kind="free")
+    UPTIME.set(round(time.time() - SERVER_STARTED, 1))
+    for gpu in gpu_pool.status():
+        GPU_RUNNING.set(len(gpu["jobs"]), gpu=gpu["index"])
+        GPU_BUSY_SECONDS.set(gpu["busy_seconds"], gpu=gpu["index"])
+
+
+REGISTRY.add_collector(collect_server_metrics)
+SSE_HEARTBEAT_SECONDS = 15
+
+# ETag キャッシュ: path -> (mtime, size, sha256)
+etags = {}
+DOWNLOAD_CHUNK = 1024 * 1024
 
 
 class GenerateRequest(BaseModel):
     prompt: str = Field(..., description="動画生成プロンプト")
     negative_prompt: str = Field(default="", description="ネガティブプロンプト")
-    duration: float = Field(default=5, ge=1, le=10, description="動画長(秒)")
-    width: int = Field(default=1280, description="幅")
-    height: int = Field(default=720, description="高さ")
+    duration: float = Field(default=5, ge=1, le=15, description="動画長(秒、上限は GPU プロファイル)")
+    width: Optional[int] = Field(default=None, description="幅（省略時は GPU プロファイルのデフォルト）")
+    height: Optional[int] = Field(default=None, description="高さ（省略時は GPU プロファイルのデフォルト）")
     fps: int = Field(default=24, description="フレームレート")
     seed: Optional[int] = Field(default=None, description="シード値")
-    steps: int = Field(default=8, description="推論ステップ数")
+    steps: Optional[int] = Field(default=None, description="推論ステップ数（省略時は GPU プロファイルのデフォルト）")
+    internal_fps: Optional[int] = Field(default=None, description="内部生成fps（低fpsモード: fps へCPU補間）")
+    interpolator: str = Field(default="minterpolate", description="補間方式 (minterpolate/blend/duplicate/none)")
+    callback_url: Optional[str] = Field(default=None, description="完了/失敗時に JobStatus を POST するURL")
+    coalesce: bool = Field(default=True, description="同一リクエストが処理中ならそのジョブに相乗りする")
+    bucket_fit: str = Field(default="crop", description="バケットで生成した動画の戻し方 (crop/pad/none)")
+    exact_shape: bool = Field(default=False, description="バケットに丸めず要求どおりの形で生成する（低解像度ドラフト用）")
+    output_format: str = Field(default="mp4", description="出力形式 (mp4 / mp4+frames / frames: .npy のフレーム配列と .wav)")
+    preview: bool = Field(default=False, description="本番の前に低解像度プレビューを作り /preview/{job_id} で公開する")
+
+    @validator("interpolator")
+    def known_interpolator(cls, value):
+        # 生成（GPU）の後で補間に失敗しないよう、受け付け時に弾く
+        error = check_interpolator(value)
+        if error:
+            raise ValueError(error)
+        return value
 
 
 class JobStatus(BaseModel):
@@ -46,6 +229,8 @@ class JobStatus(BaseModel):
     progress: Optional[str] = None
     result: Optional[dict] = None
     error: Optional[str] = None
+    coalesced: bool = False
+    preview_url: Optional[str] = None
 
 
 def check_models():
@@ -75,8 +260,18 @@ def run_generation(
     height: int = 720,
     seed: Optional[int] = None,
     steps: int = 8,
+    frame_rate: Optional[float] = None,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    env: Optional[dict] = None,
+    cancel: Optional[threading.Event] = None,
 ):
-    """LTX-2 CLIを使って動画生成"""
+    """
+    LTX-2 CLIを使って動画生成
+
+    on_progress: tqdm 出力から取り出したステップ / ETA を受け取るコールバック
+    env: 子プロセスの環境変数（GPU 固定用の CUDA_VISIBLE_DEVICES など）
+    cancel: 立ったら子プロセスを止めて JobCancelled（残りの GPU 時間を使わない）
+    """
 
     cmd = [
         VENV_PYTHON, "-m", "ltx_pipelines.ti2vid_two_stages",
@@ -99,27 +294,276 @@ def run_generation(
     if seed is not None:
         cmd.extend(["--seed", str(seed)])
 
+    if frame_rate:
+        cmd.extend(["--frame-rate", str(frame_rate)])
+
     print(f"Running: {' '.join(cmd)}")
 
-    result = subprocess.run(
+    # 出力を逐次読んで進捗を拾う（tqdm の \r は text モードで改行扱い）
+    proc = subprocess.Popen(
         cmd,
         cwd=LTX2_PATH,
-        capture_output=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         text=True,
-        timeout=600,
+        bufsize=1,
+        env=env,
     )
-
-    if result.returncode != 0:
-        raise Exception(f"Generation failed: {result.stderr}")
+    tracker = ProgressTracker()
+    tail = deque(maxlen=200)
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        proc.kill()
+
+    watchdog = threading.Timer(600, kill)
+    watchdog.start()
+    cancelled = threading.Event()
+
+    def watch_cancel():
+        while proc.poll() is None:
+            if cancel.wait(1):
+                cancelled.set()
+                proc.kill()
+                return
+
+    if cancel is not None:
+        threading.Thread(target=watch_cancel, name="generation-cancel", daemon=True).start()
+    try:
+        for line in proc.stdout:
+            tail.append(line.rstrip())
+            progress = tracker.feed(line)
+            if progress and on_progress:
+                on_progress(progress)
+        returncode = proc.wait()
+    finally:
+        watchdog.cancel()
+
+    if cancelled.is_set():
+        raise JobCancelled()
+    if timed_out.is_set():
+        raise Exception("Generation failed: timed out after 600s")
+    if returncode != 0:
+        raise Exception("Generation failed: " + "\n".join(tail))
 
     return output_path
 
 
+class JobCancelled(Exception):
+    def __init__(self):
+        super().__init__("Cancelled")
+
+
+def file_sha256(path: str) -> str:
+    """ダウンロード検証用の sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_request(request: GenerateRequest) -> GenerateRequest:
+    """省略された値を GPU プロファイルで埋め、上限を超えるリクエストは 422"""
+    request = request.copy(update={
+        "width": request.width or profile["default_width"],
+        "height": request.height or profile["default_height"],
+        "steps": request.steps or profile["default_steps"],
+    })
+    num_frames = snap_frames(request.duration, generation_fps(request))
+    error = check_limits(profile, request.width, request.height, request.duration, num_frames)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+    if request.output_format not in frames_io.OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown output_format '{request.output_format}'. Available: {list(frames_io.OUTPUT_FORMATS)}",
+        )
+    try:
+        shape_bucket(request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return request
+
+
+def shape_bucket(request: GenerateRequest) -> dict:
+    """生成に使うバケット（バケットだとプロファイルの上限を超えるなら要求どおり）"""
+    num_frames = snap_frames(request.duration, generation_fps(request))
+    if request.exact_shape:
+        return buckets.exact_plan(request.width, request.height, num_frames)
+    bucket = buckets.plan(
+        request.width, request.height, num_frames, request.bucket_fit,
+        frame_buckets=generation_fps(request) == request.fps,
+    )
+    if check_limits(profile, bucket["width"], bucket["height"], request.duration, bucket["frames"]):
+        bucket = buckets.exact_plan(request.width, request.height, num_frames)
+    return bucket
+
+
+def generation_fps(request: GenerateRequest) -> int:
+    """実際に生成するfps（低fpsモードなら internal_fps）"""
+    if request.internal_fps and request.internal_fps < request.fps:
+        return request.internal_fps
+    return request.fps
+
+
+def render_preview(
+    request: GenerateRequest,
+    bucket: dict,
+    seed: int,
+    output_path: str,
+    env: Optional[dict] = None,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """
+    本番と同じシードで半分の解像度・PREVIEW_FPS・PREVIEW_STEPS の短い生成をして、
+    数フレームを並べた JPEG を作る（本番の数 % の GPU 時間。構図の確認用で、本番と同一ではない）
+
+    Returns:
+        JPEG のパス
+    """
+    preview_video = output_path.replace(".mp4", "_preview.mp4")
+    preview_jpeg = output_path.replace(".mp4", "_preview.jpg")
+    try:
+        with STAGE_SECONDS.time(stage="preview"):
+            run_generation(
+                prompt=request.prompt,
+                output_path=preview_video,
+                negative_prompt=request.negative_prompt,
+                num_frames=snap_frames(request.duration, PREVIEW_FPS),
+                width=max(256, bucket["width"] // 2 // 32 * 32),
+                height=max(256, bucket["height"] // 2 // 32 * 32),
+                seed=seed,
+                steps=PREVIEW_STEPS,
+                frame_rate=PREVIEW_FPS,
+                env=env,
+                cancel=cancel,
+            )
+            return frames_io.contact_sheet(preview_video, preview_jpeg, count=PREVIEW_FRAMES)
+    finally:
+        if os.path.exists(preview_video):
+            os.remove(preview_video)
+
+
+def render_request(
+    request: GenerateRequest,
+    output_path: str,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    env: Optional[dict] = None,
+    cancel: Optional[threading.Event] = None,
+) -> dict:
+    """
+    リクエストに従って動画生成（preview ならプレビュー → バケットの形で生成 → 要求サイズへ戻す → 低fpsモードなら補間）
+
+    Returns:
+        結果情報 (frames, bucket, size, sha256, 低fpsモード時は fps / GPU節約秒数など,
+        output_format が frames を含むなら frames_path / audio_path / frames_shape)
+    """
+    gen_fps = generation_fps(request)
+    low_fps = gen_fps < request.fps
+    num_frames = snap_frames(request.duration, gen_fps)
+    bucket = shape_bucket(request)
+    BUCKET_REQUESTS.inc(bucket=bucket["name"])
+
+    # プレビューと本番でシードを揃える
+    seed = request.seed
+    preview = None
+    if request.preview:
+        seed = random.randint(0, 2147483647) if seed is None else seed
+        preview = render_preview(request, bucket, seed, output_path, env=env, cancel=cancel)
+        if on_progress:
+            on_progress({"phase": "preview", "preview_url": f"/preview/{Path(output_path).stem}"})
+
+    generation_start = time.time()
+    with compile_cache.use(bucket["name"]) as compiled:
+        CACHE_REQUESTS.inc(cache="compile", result="hit" if compiled["hit"] else "miss")
+        run_generation(
+            prompt=request.prompt,
+            output_path=output_path,
+            negative_prompt=request.negative_prompt,
+            num_frames=bucket["frames"],
+            width=bucket["width"],
+            height=bucket["height"],
+            seed=seed,
+            steps=request.steps,
+            frame_rate=gen_fps if low_fps else None,
+            on_progress=on_progress,
+            env={**(env or os.environ), **compiled["env"]},
+            cancel=cancel,
+        )
+    generation_seconds = time.time() - generation_start
+    STAGE_SECONDS.observe(generation_seconds, stage="generation")
+
+    if buckets.needs_restore(bucket):
+        restore_path = output_path.replace(".mp4", "_restore.mp4")
+        STAGE_SECONDS.observe(buckets.restore(output_path, restore_path, bucket, gen_fps), stage="bucket_restore")
+        os.replace(restore_path, output_path)
+    info = {"frames": num_frames, "bucket": bucket, "compile_cache": "hit" if compiled["hit"] else "miss"}
+    if preview:
+        info.update(seed=seed, preview_url=f"/preview/{Path(output_path).stem}")
+    if not bucket["exact"] and bucket["fit"] == "none":
+        info.update(frames=bucket["frames"], resolution=f"{bucket['width']}x{bucket['height']}")
+    if low_fps:
+        output_frames = snap_frames(request.duration, request.fps)
+        interpolation_seconds = 0.0
+        if request.interpolator != "none":
+            if on_progress:
+                on_progress({"phase": "interpolating"})
+            interp_path = output_path.replace(".mp4", f"_{request.fps}fps.mp4")
+            interpolation_seconds = interpolate(output_path, interp_path, request.fps, request.interpolator)
+            STAGE_SECONDS.observe(interpolation_seconds, stage="interpolation")
+            os.replace(interp_path, output_path)
+        info.update({
+            "internal_fps": gen_fps,
+            "fps": request.fps if request.interpolator != "none" else gen_fps,
+            "interpolator": request.interpolator,
+            "output_frames": output_frames,
+            "generation_seconds": round(generation_seconds, 1),
+            "interpolation_seconds": round(interpolation_seconds, 1),
+            "gpu_seconds_saved": estimate_gpu_seconds_saved(generation_seconds, bucket["frames"], output_frames),
+        })
+    info["size"] = os.path.getsize(output_path)
+    info["sha256"] = file_sha256(output_path)
+
+    if frames_io.wants_frames(request.output_format):
+        exported = frames_io.export(output_path, output_path[:-len(".mp4")])
+        STAGE_SECONDS.observe(exported.pop("seconds"), stage="frames_export")
+        info.update(exported)
+        if not frames_io.wants_mp4(request.output_format):
+            os.remove(output_path)
+            del info["size"], info["sha256"]
+    return info
+
+
+def prewarm_bucket(bucket_name: str, env: dict):
+    """バケットの形で1ステップだけ生成してコンパイル結果をキャッシュに残す"""
+    width, height, frames = (int(v) for v in bucket_name.split("x"))
+    job_id = f"prewarm-{bucket_name}"
+    with gpu_pool.lease(job_id, pixel_frames(width, height, frames)) as worker:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_generation(
+                prompt="prewarm",
+                output_path=f"{tmp}/prewarm.mp4",
+                num_frames=frames,
+                width=width,
+                height=height,
+                steps=1,
+                env=worker.env({**os.environ, **env}),
+            )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """起動時の初期化"""
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+    events.bind(asyncio.get_running_loop())
+    retention.start_sweeper(RETENTION_SWEEP_SECONDS)
     print("Starting LTX-2 API Server...")
+    if store is not None:
+        print(f"Cluster mode: node {NODE_ID}, role {CLUSTER_ROLE}, store {CLUSTER_STORE}")
+        if CLUSTER_ROLE != "api":
+            start_lease_workers()
 
     # モデル確認
     ok, missing = check_models()
@@ -128,14 +572,21 @@ async def lifespan(app: FastAPI):
         print("Run download script first!")
     else:
         print("All models found!")
+        if COMPILE_PREWARM and CLUSTER_ROLE != "api":
+            top = compile_cache.top_buckets(COMPILE_PREWARM)
+            print(f"Prewarming compile cache: {top}")
+            compile_cache.prewarm(top, prewarm_bucket)
 
     yield
+    cluster_stop.set()
+    generation_executor.shutdown(wait=False, cancel_futures=True)
+    retention.stop_sweeper()
     print("Shutting down...")
 
 
 app = FastAPI(
     title="LTX-2 Video Generation API",
-    description="RTX A5000で動く動画生成API",
+    description="GPU プロファイルに合わせて動く動画生成API",
     version="2.0.0",
     lifespan=lifespan,
 )
@@ -148,6 +599,7 @@ async def root():
         "service": "LTX-2 Video Generation API",
         "status": "running",
         "model": "LTX-2 19B fp8 + Distilled LoRA",
+        "gpu_profile": profile,
         "models_ready": ok,
         "missing_models": missing if not ok else [],
     }
@@ -162,24 +614,117 @@ async def health():
         "missing_models": missing if not ok else [],
         "cuda_available": torch.cuda.is_available(),
         "gpu_name": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        "gpu_profile": profile["key"],
+        "gpu_dispatch": gpu_pool.policy,
+        "gpus": gpu_pool.status(),
+        "inflight_jobs": len(inflight),
+        "storage": retention.usage(),
+        "coalesced_requests": int(CACHE_REQUESTS.value(cache="coalesce", result="hit")),
+        "compile_cache": await asyncio.to_thread(compile_cache.stats),
+        "cluster": await asyncio.to_thread(cluster_status),
     }
 
 
+def cluster_status() -> Optional[dict]:
+    if store is None:
+        return None
+    return {"node": NODE_ID, "role": CLUSTER_ROLE, "store": CLUSTER_STORE, "jobs": store.counts()}
+
+
+def request_key(request: GenerateRequest) -> str:
+    """生成結果に影響するパラメータだけの正規化ハッシュ"""
+    params = request.dict(exclude={"callback_url", "coalesce"})
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def create_job(request: GenerateRequest):
+    """
+    ジョブを登録（同一リクエストが処理中ならそのジョブに相乗り）
+
+    Returns:
+        (job_id, coalesced)
+    """
+    key = request_key(request)
+
+    if store is not None:
+        # クラスタモード: 相乗りの判定も登録も共有ストアで1トランザクション
+        job_id, coalesced = store.submit(str(uuid.uuid4())[:8], {
+            "request": request.dict(),
+            "key": key if request.coalesce else None,
+            "callbacks": [request.callback_url] if request.callback_url else [],
+            "created_at": time.time(),
+        }, coalesce=request.coalesce)
+        if request.coalesce:
+            CACHE_REQUESTS.inc(cache="coalesce", result="hit" if coalesced else "miss")
+        return job_id, coalesced
+
+    with inflight_lock:
+        existing = inflight.get(key) if request.coalesce else None
+        if existing and jobs[existing]["status"] in ("pending", "processing"):
+            if request.callback_url:
+                jobs[existing]["callbacks"].append(request.callback_url)
+            jobs[existing]["coalesced"] += 1
+            CACHE_REQUESTS.inc(cache="coalesce", result="hit")
+            print(f"Coalesced duplicate request into job {existing}")
+            return existing, True
+
+        job_id = str(uuid.uuid4())[:8]
+        jobs[job_id] = {
+            "status": "pending",
+            "request": request.dict(),
+            "key": key,
+            "callbacks": [request.callback_url] if request.callback_url else [],
+            "coalesced": 0,
+            "created_at": time.time(),
+        }
+        if request.coalesce:
+            inflight[key] = job_id
+            CACHE_REQUESTS.inc(cache="coalesce", result="miss")
+
+    events.publish(job_id, job_events.STATE, status="pending")
+    return job_id, False
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """ジョブを取得（このノードで扱っていなければ共有ストアから）"""
+    job = jobs.get(job_id)
+    if job is None and store is not None:
+        job = store.get(job_id)
+    return job
+
+
+async def wait_for_job(job_id: str) -> dict:
+    """ジョブが完了/失敗するまで待つ（イベント購読、クラスタモードではストアも確認）"""
+    timeout = LEASE_POLL_SECONDS if store is not None else SSE_HEARTBEAT_SECONDS
+    with events.subscribe([job_id]) as queue:
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job["status"] in ("completed", "failed"):
+                return job
+            try:
+                await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
 @app.post("/generate", response_model=JobStatus)
-async def generate_video(request: GenerateRequest, background_tasks: BackgroundTasks):
+async def generate_video(request: GenerateRequest):
     """動画生成（非同期）"""
 
     ok, missing = check_models()
     if not ok:
         raise HTTPException(status_code=503, detail=f"Missing models: {missing}")
 
-    job_id = str(uuid.uuid4())[:8]
-    jobs[job_id] = {
-        "status": "pending",
-        "request": request.dict(),
-    }
+    request = resolve_request(request)
+    job_id, coalesced = await asyncio.to_thread(create_job, request)
+    if coalesced:
+        job = await asyncio.to_thread(get_job, job_id)
+        return job_status(job_id, job).copy(update={"coalesced": True})
 
-    background_tasks.add_task(process_generation, job_id, request)
+    # クラスタモードではどこかのワーカーがストアから借りていく
+    if store is None:
+        generation_executor.submit(process_generation, job_id, request)
 
     return JobStatus(
         job_id=job_id,
@@ -196,126 +741,512 @@ async def generate_video_sync(request: GenerateRequest):
     if not ok:
         raise HTTPException(status_code=503, detail=f"Missing models: {missing}")
 
-    try:
-        # フレーム数計算 (24fps, 8の倍数+1)
-        num_frames = int(request.duration * request.fps)
-        num_frames = ((num_frames - 1) // 8) * 8 + 1
-
-        job_id = str(uuid.uuid4())[:8]
-        output_path = f"{OUTPUT_DIR}/{job_id}.mp4"
-
+    request = resolve_request(request)
+    job_id, coalesced = await asyncio.to_thread(create_job, request)
+    if coalesced or store is not None:
+        job = await wait_for_job(job_id)
+    else:
         print(f"Generating: {request.prompt[:50]}...")
+        await asyncio.get_running_loop().run_in_executor(generation_executor, process_generation, job_id, request)
+        job = jobs[job_id]
 
-        run_generation(
-            prompt=request.prompt,
-            output_path=output_path,
-            negative_prompt=request.negative_prompt,
-            num_frames=num_frames,
-            width=request.width,
-            height=request.height,
-            seed=request.seed,
-            steps=request.steps,
-        )
+    if job["status"] != "completed":
+        raise HTTPException(status_code=500, detail=job.get("error"))
 
-        # Base64エンコード
+    result = dict(job["result"])
+    output_path = result.pop("video_path")
+
+    # Base64エンコード（output_format=frames なら動画はなく、frames_path / audio_path を返す）
+    video_base64 = None
+    if output_path:
         with open(output_path, "rb") as f:
             video_base64 = base64.b64encode(f.read()).decode("utf-8")
 
-        return {
-            "status": "success",
-            "job_id": job_id,
-            "video_base64": video_base64,
-            "duration": request.duration,
-            "resolution": f"{request.width}x{request.height}",
-            "frames": num_frames,
-            "download_url": f"/download/{job_id}",
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "job_id": job_id,
+        "video_base64": video_base64,
+        "coalesced": coalesced,
+        **result,
+    }
 
 
-async def process_generation(job_id: str, request: GenerateRequest):
-    """バックグラウンド生成処理"""
+def send_callback(url: str, payload: dict, retries: int = 3):
+    """完了通知を POST（失敗してもジョブには影響させない）"""
+    body = json.dumps(payload).encode("utf-8")
+    for attempt in range(retries):
+        try:
+            req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(req, timeout=10):
+                return True
+        except Exception as e:
+            print(f"Callback attempt {attempt + 1}/{retries} failed: {e}")
+            time.sleep(2 ** attempt)
+    return False
+
+
+def process_generation(job_id: str, request: GenerateRequest, lease_worker: Optional[str] = None):
+    """
+    バックグラウンド生成処理（generation_executor で実行、イベントループを塞がない）
+
+    lease_worker: クラスタモードでリースを持つワーカーID（結果を共有ストアへ書き戻す）
+    """
+
+    def on_progress(progress: dict):
+        if "step" in progress:
+            jobs[job_id]["progress"] = f"Stage {progress['stage']}: step {progress['step']}/{progress['total']}"
+        elif progress.get("phase") == "interpolating":
+            jobs[job_id]["progress"] = "Interpolating..."
+        elif progress.get("phase") == "preview":
+            jobs[job_id]["progress"] = "Preview ready, generating..."
+            jobs[job_id]["preview_url"] = progress["preview_url"]
+        jobs[job_id]["progress_detail"] = progress
+        events.publish(job_id, job_events.PROGRESS, **progress)
+
+    cancel = cancels.setdefault(job_id, threading.Event())
+    worker = None
+    ok = False
 
     try:
+        num_frames = snap_frames(request.duration, generation_fps(request))
+        bucket = shape_bucket(request)
+        worker = gpu_pool.acquire(
+            job_id, pixel_frames(bucket["width"], bucket["height"], bucket["frames"]), cancel=cancel,
+        )
+        # GPU 待ちの間にキャンセルされていたら生成しない
+        if worker is None:
+            raise JobCancelled()
+        started = time.time()
+        STAGE_SECONDS.observe(started - jobs[job_id]["created_at"], stage="queue_wait")
+        JOB_STARTS.inc(start="cold" if worker.completed + worker.failed == 0 else "warm")
+        jobs[job_id]["gpu"] = worker.index
+        if cancel.is_set():
+            raise JobCancelled()
         jobs[job_id]["status"] = "processing"
         jobs[job_id]["progress"] = "Starting generation..."
-
-        # フレーム数計算
-        num_frames = int(request.duration * request.fps)
-        num_frames = ((num_frames - 1) // 8) * 8 + 1
+        events.publish(job_id, job_events.STATE, status="processing", gpu=worker.index)
 
         jobs[job_id]["progress"] = f"Generating {num_frames} frames..."
 
         output_path = f"{OUTPUT_DIR}/{job_id}.mp4"
-
-        run_generation(
-            prompt=request.prompt,
-            output_path=output_path,
-            negative_prompt=request.negative_prompt,
-            num_frames=num_frames,
-            width=request.width,
-            height=request.height,
-            seed=request.seed,
-            steps=request.steps,
-        )
+        interp_path = output_path.replace(".mp4", f"_{request.fps}fps.mp4")
+        restore_path = output_path.replace(".mp4", "_restore.mp4")
+        frames_path = output_path.replace(".mp4", ".npy")
+        audio_path = output_path.replace(".mp4", ".wav")
+        preview_path = output_path.replace(".mp4", "_preview.mp4")
+
+        # 書き込み前に空きを確保（足りなければ古い出力から削除）
+        reserve = estimate_output_bytes(request.width, request.height, request.duration)
+        if frames_io.wants_frames(request.output_format):
+            reserve += frames_io.estimate_bytes(request.width, request.height, snap_frames(request.duration, request.fps))
+        if not retention.ensure_space(reserve):
+            raise Exception(f"Not enough disk space in {OUTPUT_DIR} (free {retention.free_bytes() / GB:.1f} GB)")
+
+        # 生成中は削除対象から外す
+        with retention.pinned(output_path), retention.pinned(interp_path), retention.pinned(restore_path), \
+                retention.pinned(frames_path), retention.pinned(audio_path), retention.pinned(preview_path):
+            info = render_request(request, output_path, on_progress=on_progress, env=worker.env(), cancel=cancel)
+        download_url = f"/download/{job_id}" if frames_io.wants_mp4(request.output_format) else None
 
         jobs[job_id]["status"] = "completed"
         jobs[job_id]["progress"] = "Done"
         jobs[job_id]["result"] = {
-            "video_path": output_path,
-            "download_url": f"/download/{job_id}",
+            "video_path": output_path if download_url else None,
+            "download_url": download_url,
             "duration": request.duration,
             "resolution": f"{request.width}x{request.height}",
-            "frames": num_frames,
+            "gpu": worker.index,
+            **info,
         }
+        ok = True
+        JOBS_TOTAL.inc(outcome="completed")
+        events.publish(
+            job_id, job_events.COMPLETED,
+            status="completed", download_url=download_url, result=jobs[job_id]["result"],
+        )
 
-    except Exception as e:
+    except JobCancelled as e:
         jobs[job_id]["status"] = "failed"
         jobs[job_id]["error"] = str(e)
+        JOBS_TOTAL.inc(outcome="cancelled")
+        events.publish(job_id, job_events.FAILED, status="failed", error=str(e), cancelled=True)
 
-
-@app.get("/status/{job_id}", response_model=JobStatus)
-async def get_job_status(job_id: str):
-    """ジョブステータス確認"""
-
-    if job_id not in jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
+    except Exception as e:
+        jobs[job_id]["status"] = "failed"
+        jobs[job_id]["error"] = str(e)
+        JOBS_TOTAL.inc(outcome="failed")
+        events.publish(job_id, job_events.FAILED, status="failed", error=str(e))
+
+    finally:
+        cancels.pop(job_id, None)
+        if worker is not None:
+            gpu_pool.release(worker, job_id, ok)
+            STAGE_SECONDS.observe(time.time() - started, stage="total")
+        with inflight_lock:
+            if inflight.get(jobs[job_id]["key"]) == job_id:
+                del inflight[jobs[job_id]["key"]]
 
     job = jobs[job_id]
+    callbacks = job["callbacks"]
+    if lease_worker is not None:
+        finished = store.finish(
+            job_id, lease_worker, job["status"],
+            progress=job.get("progress"), result=job.get("result"), error=job.get("error"), gpu=job.get("gpu"),
+        )
+        if not finished:
+            # 期限切れで他のワーカーに渡った（結果はそちらが書く）
+            print(f"[CLUSTER] Lease on job {job_id} was lost, result not recorded")
+            return
+        # 他のノードで相乗りした通知先も含める
+        callbacks = store.get(job_id)["callbacks"]
+
+    # 相乗りしたリクエストの通知先にも送る
+    for url in callbacks:
+        send_callback(url, job_status(job_id).dict())
+
+
+def lease_loop(worker_id: str):
+    """クラスタモードのワーカー: 共有ストアからジョブを借りて生成（GPU 1枚につき1スレッド）"""
+    while not cluster_stop.is_set():
+        try:
+            store.requeue_expired(MAX_ATTEMPTS)
+            leased = store.lease(worker_id, LEASE_SECONDS)
+        except Exception as e:
+            print(f"[CLUSTER] Store error: {e}")
+            leased = None
+        if leased is None:
+            cluster_stop.wait(LEASE_POLL_SECONDS)
+            continue
+
+        job_id, job = leased
+        print(f"[CLUSTER] {worker_id} leased job {job_id} (attempt {job['attempts']})")
+        if job.get("cancel_requested"):
+            store.finish(job_id, worker_id, "failed", error="Cancelled")
+            continue
+        try:
+            request = GenerateRequest(**job["request"])
+        except Exception as e:
+            # 他のバージョンのノードが受けた不正なリクエスト（何度借りても同じなのでここで失敗にする）
+            print(f"[CLUSTER] Invalid request in job {job_id}: {e}")
+            JOBS_TOTAL.inc(outcome="rejected")
+            store.finish(job_id, worker_id, "failed", error=f"Invalid request: {e}")
+            continue
+        jobs[job_id] = job
+
+        def progress_fields():
+            # 他のノードで受けた /cancel は共有ストアの cancel_requested で届く（ハートビートごとに確認）
+            if (store.get(job_id) or {}).get("cancel_requested"):
+                cancels.setdefault(job_id, threading.Event()).set()
+            return {
+                "progress": jobs[job_id].get("progress"),
+                "progress_detail": jobs[job_id].get("progress_detail"),
+                "preview_url": jobs[job_id].get("preview_url"),
+            }
+
+        # リースを失ったら（他のワーカーに渡った）子プロセスを止めて GPU を空ける
+        cancel = cancels.setdefault(job_id, threading.Event())
+        with LeaseKeeper(store, job_id, worker_id, LEASE_SECONDS, fields=progress_fields, on_lost=cancel.set):
+            process_generation(job_id, request, lease_worker=worker_id)
+
+
+def start_lease_workers():
+    for slot in range(gpu_pool.capacity):
+        worker_id = f"{NODE_ID}/{slot}"
+        threading.Thread(target=lease_loop, args=(worker_id,), name=f"lease-{slot}", daemon=True).start()
+
+
+def job_status(job_id: str, job: Optional[dict] = None) -> JobStatus:
+    job = job or jobs[job_id]
     return JobStatus(
         job_id=job_id,
         status=job["status"],
         progress=job.get("progress"),
         result=job.get("result"),
         error=job.get("error"),
+        preview_url=job.get("preview_url"),
+    )
+
+
+def snapshot_event(job_id: str, job: Optional[dict] = None) -> dict:
+    """購読開始時に送る現在の状態"""
+    job = job or jobs[job_id]
+    event = {"job_id": job_id, "time": round(time.time(), 3), "status": job["status"]}
+    if job["status"] == "completed":
+        result = job.get("result") or {}
+        event.update(event=job_events.COMPLETED, download_url=result.get("download_url"), result=job.get("result"))
+    elif job["status"] == "failed":
+        event.update(event=job_events.FAILED, error=job.get("error"))
+    else:
+        event.update(event=job_events.STATE, progress=job.get("progress"), **(job.get("progress_detail") or {}))
+    return event
+
+
+async def event_stream(job_ids: List[str], request: Request):
+    """
+    SSE ストリーム
+
+    現在の状態を送ってから遷移 / 進捗を流し、全ジョブが終わったら閉じる。
+    完了イベントには download_url が入る。
+    クラスタモードで他のノードが処理しているジョブは、共有ストアの変化を送る。
+    """
+    with events.subscribe(job_ids) as queue:
+        pending = set(job_ids)
+        remote = {}  # job_id -> 最後に送った (status, progress)
+        event_id = 0
+
+        for job_id in job_ids:
+            job = await asyncio.to_thread(get_job, job_id)
+            event = snapshot_event(job_id, job)
+            event_id += 1
+            yield format_sse(event, event_id)
+            if event["event"] in job_events.TERMINAL_EVENTS:
+                pending.discard(job_id)
+            elif job_id not in jobs:
+                remote[job_id] = (job["status"], job.get("progress"))
+
+        last_sent = time.monotonic()
+        while pending:
+            timeout = LEASE_POLL_SECONDS if remote else SSE_HEARTBEAT_SECONDS
+            try:
+                received = [await asyncio.wait_for(queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                received = []
+
+            for job_id in list(remote):
+                if job_id in jobs:
+                    # このノードが借りた: 以降はイベントで届く
+                    del remote[job_id]
+                    continue
+                job = await asyncio.to_thread(get_job, job_id)
+                if (job["status"], job.get("progress")) != remote[job_id]:
+                    remote[job_id] = (job["status"], job.get("progress"))
+                    received.append(snapshot_event(job_id, job))
+
+            for event in received:
+                if event["job_id"] not in pending:
+                    continue
+                event_id += 1
+                last_sent = time.monotonic()
+                yield format_sse(event, event_id)
+                if event["event"] in job_events.TERMINAL_EVENTS:
+                    pending.discard(event["job_id"])
+                    remote.pop(event["job_id"], None)
+
+            if pending and time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                if await request.is_disconnected():
+                    return
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+
+
+async def sse_response(job_ids: List[str], request: Request) -> StreamingResponse:
+    missing = [j for j in job_ids if await asyncio.to_thread(get_job, j) is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Job not found: {', '.join(missing)}")
+    return StreamingResponse(
+        event_stream(job_ids, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.get("/download/{job_id}")
-async def download_video(job_id: str):
-    """動画ダウンロード"""
+@app.get("/events/{job_id}")
+async def job_events_stream(job_id: str, request: Request):
+    """1ジョブの進捗を SSE で配信"""
+    return await sse_response([job_id], request)
+
+
+@app.get("/events")
+async def jobs_events_stream(request: Request, jobs_param: str = Query(..., alias="jobs")):
+    """複数ジョブ (?jobs=a,b,c) の進捗を1本の SSE で配信"""
+    job_ids = list(dict.fromkeys(j.strip() for j in jobs_param.split(",") if j.strip()))
+    if not job_ids:
+        raise HTTPException(status_code=400, detail="jobs is empty")
+    return await sse_response(job_ids, request)
+
+
+@app.get("/status/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    """ジョブステータス確認"""
+
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job_status(job_id, job)
+
+
+@app.post("/cancel/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """
+    ジョブをキャンセル（生成中なら子プロセスを止めて GPU を空ける）
+
+    status=failed / error="Cancelled" になる。終了済みなら 409
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in ("completed", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+
+    if job_id in jobs:
+        cancels.setdefault(job_id, threading.Event()).set()
+    if store is not None:
+        def request_cancel():
+            # 生成中のノードはハートビートで、まだ借りられていなければここで失敗にする
+            store.update(job_id, cancel_requested=True)
+            shared = store.get(job_id)
+            if shared and shared["status"] == "pending":
+                store.update(job_id, status="failed", error="Cancelled")
+        await asyncio.to_thread(request_cancel)
+    return job_status(job_id, await asyncio.to_thread(get_job, job_id))
+
+
+@app.get("/preview/{job_id}")
+async def get_preview(job_id: str):
+    """preview=true のジョブのプレビュー（数フレームを横に並べた JPEG）"""
+    preview_path = f"{OUTPUT_DIR}/{job_id}_preview.jpg"
+    if not os.path.exists(preview_path):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return FileResponse(preview_path, media_type="image/jpeg", headers={"Cache-Control": "no-cache"})
+
+
+def video_etag(job_id: str, video_path: str, stat: os.stat_result) -> str:
+    """内容の sha256 から強い ETag（生成時の値があれば再計算しない）"""
+    cached = etags.get(video_path)
+    if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+        CACHE_REQUESTS.inc(cache="etag", result="hit")
+        return f'"{cached[2]}"'
+
+    result = (get_job(job_id) or {}).get("result") or {}
+    sha256 = result.get("sha256") if result.get("size") == stat.st_size else None
+    CACHE_REQUESTS.inc(cache="etag", result="hit" if sha256 else "miss")
+    sha256 = sha256 or file_sha256(video_path)
+    etags[video_path] = (stat.st_mtime, stat.st_size, sha256)
+    return f'"{sha256}"'
+
+
+def parse_range(header: str, size: int):
+    """
+    単一の "bytes=start-end" を解釈
+
+    Returns:
+        (start, end) 両端含む / 解釈できなければ None / 範囲外なら ValueError
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            # "bytes=-N": 末尾 N バイト
+            start = max(0, size - int(end_s))
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def iter_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@app.api_route("/download/{job_id}", methods=["GET", "HEAD"])
+async def download_video(job_id: str, request: Request):
+    """
+    動画ダウンロード
+
+    - ETag (sha256) / If-None-Match で再検証（304）
+    - Range: bytes=start-end で部分取得（206、中断からの再開用）
+    - HEAD でサイズ / ETag のみ取得
+    全体の送信は FileResponse（サーバーが対応していれば pathsend / sendfile）
+    """
 
     video_path = f"{OUTPUT_DIR}/{job_id}.mp4"
 
     if not os.path.exists(video_path):
+        DOWNLOAD_REQUESTS.inc(status="404")
         raise HTTPException(status_code=404, detail="Video not found")
 
+    retention.touch(video_path)
+    stat = os.stat(video_path)
+    etag = await asyncio.to_thread(video_etag, job_id, video_path, stat)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        DOWNLOAD_REQUESTS.inc(status="304")
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            DOWNLOAD_REQUESTS.inc(status="416")
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+
+        if byte_range:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                "Content-Length": str(end - start + 1),
+            })
+            DOWNLOAD_REQUESTS.inc(status="206")
+            if request.method == "HEAD":
+                return Response(status_code=206, headers=headers, media_type="video/mp4")
+            BYTES_SENT.inc(end - start + 1)
+            return StreamingResponse(
+                iter_file_range(video_path, start, end),
+                status_code=206,
+                headers=headers,
+                media_type="video/mp4",
+            )
+
+    DOWNLOAD_REQUESTS.inc(status="200")
+    if request.method != "HEAD":
+        BYTES_SENT.inc(stat.st_size)
     return FileResponse(
         video_path,
         media_type="video/mp4",
         filename=f"{job_id}.mp4",
+        headers=headers,
+        stat_result=stat,
     )
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 形式のメトリクス"""
+    body = await asyncio.to_thread(REGISTRY.render)
+    return Response(content=body, media_type=CONTENT_TYPE)
+
+
 @app.get("/jobs")
 async def list_jobs():
-    """ジョブ一覧"""
+    """ジョブ一覧（クラスタモードでは全ノード分、新しい順に100件）"""
+    items = await asyncio.to_thread(store.list) if store is not None else jobs.items()
     return {
         "jobs": [
             {"job_id": jid, "status": j["status"]}
-            for jid, j in jobs.items()
+            for jid, j in items
         ]
     }
 
@@ -0,0 +1,296 @@
+"""
+Two-stage pipeline split (generate.py)
+
+two-stage パイプラインを2つのワーカーに分ける。
+stage 1 のワーカーは低解像度の latent を受け渡しディレクトリ（Network Volume など）に書き、
+stage 2 のワーカーがそれを取って spatial upsampler + stage 2 を行う。
+バッチではそれぞれの GPU が自分の段だけを回し続けるので、2 GPU の合計スループットが上がる。
+
+受け渡しの手順（ディレクトリだけで完結、ロックサーバー不要）:
+- {job}.npz を書いてから {job}.json を置く（どちらも一時ファイル → rename）。json が「準備完了」の印
+- stage 2 は {job}.json を {job}.json.{worker} に rename して取る（rename は原子的なので1人だけ成功）
+  処理中は取った json の更新時刻を定期的に進める。claim_timeout 進んでいない（ワーカーが落ちた）
+  ものは他のワーカーが {job}.json に戻して取り直す
+- 終わったら npz と取った json を削除。失敗したら {job}.failed.json にエラーを残す
+  （stage 1 で失敗したジョブも同じく failed.json を残して次へ進む）
+- stage 1 は未処理が max_pending 件以上あれば待つ（ディスクを埋めない）
+- stage 1 が全部書き終えたら _done を置く。stage 2 は _done があって未処理・処理中がなければ終了
+
+CPU だけで動作確認:
+
+    python stage_pipeline.py --demo
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DONE_MARKER = "_done"
+
+
+class Handoff:
+    """stage 1 → stage 2 の受け渡しディレクトリ"""
+
+    def __init__(self, root: str, max_pending: int = 4, poll_seconds: float = 0.5, claim_timeout: float = 600):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_pending = max_pending
+        self.poll_seconds = poll_seconds
+        self.claim_timeout = claim_timeout
+
+    def _atomic_write(self, path: Path, write: Callable):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f".{path.name}-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    # --- stage 1 側 ---
+
+    def pending(self) -> List[str]:
+        """stage 2 待ちのジョブ（古い順）"""
+        ready = []
+        for path in self.root.glob("*.json"):
+            if path.name.endswith(".failed.json"):
+                continue
+            try:
+                ready.append((path.stat().st_mtime, path.stem))
+            except FileNotFoundError:
+                # 一覧を取った後に他のワーカーが claim() で持っていった
+                continue
+        return [stem for _, stem in sorted(ready)]
+
+    def put(self, job_id: str, arrays: Dict[str, np.ndarray], meta: Dict, timeout: Optional[float] = None):
+        """latent などを書いて stage 2 に渡す（未処理が多ければ減るまで待つ）"""
+        deadline = None if timeout is None else time.time() + timeout
+        while len(self.pending()) >= self.max_pending:
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Stage 2 did not drain {self.root} within {timeout}s")
+            time.sleep(self.poll_seconds)
+        self._atomic_write(self.root / f"{job_id}.npz", lambda f: np.savez(f, **arrays))
+        body = json.dumps({"job_id": job_id, "created_at": time.time(), **meta}, ensure_ascii=False)
+        self._atomic_write(self.root / f"{job_id}.json", lambda f: f.write(body.encode("utf-8")))
+
+    def reject(self, job_id: str, meta: Dict, error: str):
+        """stage 1 で失敗したジョブを failed.json に残す（stage 2 には渡さない）"""
+        body = json.dumps({"job_id": job_id, **meta, "error": error, "stage": 1}, ensure_ascii=False)
+        self._atomic_write(self.root / f"{job_id}.failed.json", lambda f: f.write(body.encode("utf-8")))
+
+    def begin(self):
+        """stage 1 の開始（前回の _done を消す）"""
+        (self.root / DONE_MARKER).unlink(missing_ok=True)
+
+    def finish(self):
+        """stage 1 の投入が終わった印"""
+        (self.root / DONE_MARKER).touch()
+
+    # --- stage 2 側 ---
+
+    def claim(self, worker: str) -> Optional[Tuple[str, Dict]]:
+        """未処理のジョブを1件取る（なければ None）"""
+        for job_id in self.pending():
+            claimed = self.root / f"{job_id}.json.{worker}"
+            try:
+                os.rename(self.root / f"{job_id}.json", claimed)
+            except FileNotFoundError:
+                continue  # 他のワーカーが先に取った
+            # rename では更新時刻が変わらないので、取った時刻から claim_timeout を数える
+            os.utime(claimed)
+            return job_id, json.loads(claimed.read_text())
+        return None
+
+    def claimed(self) -> List[Path]:
+        """stage 2 が処理中のジョブ（{job}.json.{worker}）"""
+        return list(self.root.glob("*.json.*"))
+
+    def reclaim(self) -> List[str]:
+        """claim_timeout の間更新されていない処理中のジョブを未処理に戻す（落ちたワーカーの分）"""
+        reclaimed = []
+        stale = time.time() - self.claim_timeout
+        for path in self.claimed():
+            try:
+                if path.stat().st_mtime > stale:
+                    continue
+                job_id = path.name.split(".json.", 1)[0]
+                os.rename(path, self.root / f"{job_id}.json")
+            except FileNotFoundError:
+                continue  # 完了した / 他のワーカーが先に戻した
+            print(f"[STAGE2] Reclaimed {job_id} from {path.name.split('.json.', 1)[1]}", flush=True)
+            reclaimed.append(job_id)
+        return reclaimed
+
+    @contextmanager
+    def _heartbeat(self, job_id: str, worker: str):
+        """処理中は取った json の更新時刻を進める（他のワーカーに取り直されないように）"""
+        claimed = self.root / f"{job_id}.json.{worker}"
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.claim_timeout / 3):
+                try:
+                    os.utime(claimed)
+                except FileNotFoundError:
+                    return
+
+        thread = threading.Thread(target=run, name=f"handoff-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def load(self, job_id: str) -> Dict[str, np.ndarray]:
+        with np.load(self.root / f"{job_id}.npz", allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    def complete(self, job_id: str, worker: str):
+        (self.root / f"{job_id}.npz").unlink(missing_ok=True)
+        (self.root / f"{job_id}.json.{worker}").unlink(missing_ok=True)
+
+    def fail(self, job_id: str, worker: str, error: str):
+        claimed = self.root / f"{job_id}.json.{worker}"
+        meta = json.loads(claimed.read_text())
+        body = json.dumps({**meta, "error": error, "worker": worker}, ensure_ascii=False)
+        self._atomic_write(self.root / f"{job_id}.failed.json", lambda f: f.write(body.encode("utf-8")))
+        self.complete(job_id, worker)
+
+    def done(self) -> bool:
+        """stage 1 が終わり、未処理も処理中もない（処理中のワーカーが落ちたら取り直すので待つ）"""
+        return (self.root / DONE_MARKER).exists() and not self.pending() and not self.claimed()
+
+    def consume(
+        self,
+        worker: str,
+        stage2: Callable[[str, Dict[str, np.ndarray], Dict], None],
+        stop: Optional[threading.Event] = None,
+    ) -> Dict:
+        """
+        stage 2 のループ（stage 1 が終わって未処理がなくなるか stop まで）
+
+        Returns:
+            {"completed": int, "failed": int, "idle_seconds": float}
+        """
+        summary = {"completed": 0, "failed": 0, "idle_seconds": 0.0}
+        while not (stop is not None and stop.is_set()):
+            self.reclaim()
+            claimed = self.claim(worker)
+            if claimed is None:
+                if self.done():
+                    break
+                time.sleep(self.poll_seconds)
+                summary["idle_seconds"] += self.poll_seconds
+                continue
+            job_id, meta = claimed
+            try:
+                with self._heartbeat(job_id, worker):
+                    stage2(job_id, self.load(job_id), meta)
+                self.complete(job_id, worker)
+                summary["completed"] += 1
+            except Exception as e:
+                print(f"[STAGE2] {job_id} failed: {e}", flush=True)
+                self.fail(job_id, worker, str(e))
+                summary["failed"] += 1
+        summary["idle_seconds"] = round(summary["idle_seconds"], 1)
+        return summary
+
+
+def produce(
+    handoff: Handoff,
+    jobs: Iterable[Tuple[str, Dict]],
+    stage1: Callable[[str, Dict], Dict[str, np.ndarray]],
+) -> Dict:
+    """
+    stage 1 のループ: 各ジョブの latent を書いて最後に _done を置く
+
+    stage1 が失敗したジョブは failed.json を残して次へ進む（1本の失敗でバッチ全体を止めない）
+
+    Returns:
+        {"handed_off": int, "failed": int, "wait_seconds": float}
+    """
+    summary = {"handed_off": 0, "failed": 0, "wait_seconds": 0.0}
+    handoff.begin()
+    try:
+        for job_id, meta in jobs:
+            try:
+                arrays = stage1(job_id, meta)
+            except Exception as e:
+                print(f"[STAGE1] {job_id} failed: {e}", flush=True)
+                handoff.reject(job_id, meta, str(e))
+                summary["failed"] += 1
+                continue
+            start = time.time()
+            handoff.put(job_id, arrays, meta)
+            summary["wait_seconds"] += time.time() - start
+            summary["handed_off"] += 1
+    finally:
+        handoff.finish()
+    summary["wait_seconds"] = round(summary["wait_seconds"], 1)
+    return summary
+
+
+def demo(jobs: int = 6, stage_seconds: float = 0.5):
+    """スタブの stage でシリアル実行と2ワーカー分割を比べる"""
+
+    def stage1(job_id, meta):
+        time.sleep(stage_seconds)
+        return {"latents": np.full((1, 8, 4, 4), meta["seed"], dtype=np.float32)}
+
+    def stage2(job_id, arrays, meta):
+        time.sleep(stage_seconds)
+        assert arrays["latents"][0, 0, 0, 0] == meta["seed"], "latents mixed up between jobs"
+
+    work = [(f"job{i:03d}", {"seed": i}) for i in range(jobs)]
+
+    start = time.time()
+    for job_id, meta in work:
+        stage2(job_id, stage1(job_id, meta), meta)
+    serial = time.time() - start
+
+    with tempfile.TemporaryDirectory() as root:
+        handoff = Handoff(root, max_pending=2, poll_seconds=0.05)
+        start = time.time()
+        results = {}
+        consumer = threading.Thread(target=lambda: results.update(handoff.consume("gpu1", stage2)))
+        consumer.start()
+        produced = produce(handoff, work, stage1)
+        consumer.join()
+        split = time.time() - start
+        leftovers = [p.name for p in Path(root).iterdir() if p.name != DONE_MARKER]
+
+    print(f"serial: {serial:.1f}s ({jobs / serial:.2f} jobs/s)")
+    print(f"split:  {split:.1f}s ({jobs / split:.2f} jobs/s), stage 1 {produced}, stage 2 {results}")
+    print(f"leftover files: {leftovers}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Two-stage pipeline handoff")
+    parser.add_argument("--demo", action="store_true", help="Run the stub-stage demo (CPU only)")
+    parser.add_argument("--status", metavar="DIR", help="Show pending / claimed / failed jobs in a handoff directory")
+    args = parser.parse_args()
+
+    if args.demo:
+        demo()
+    elif args.status:
+        root = Path(args.status)
+        print(f"pending: {Handoff(root).pending()}")
+        print(f"claimed: {sorted(p.name for p in root.glob('*.json.*'))}")
+        print(f"failed:  {sorted(p.name for p in root.glob('*.failed.json'))}")
+        print(f"stage 1 done: {(root / DONE_MARKER).exists()}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
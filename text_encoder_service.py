@@ -0,0 +1,345 @@
+"""
+Text encoder service (generate.py)
+
+Gemma のテキストエンコードを別プロセス（CPU or 2枚目の GPU）で先に済ませ、
+埋め込みを共有メモリで渡す。メインの GPU はデノイズだけを行い、
+次のジョブのプロンプトはデノイズ中にエンコードされる。
+
+    with TextEncoderService() as encoder:
+        encoder.prefetch([p1, p2, p3])     # これから使うプロンプトを先に投入
+        embeds = encoder.get(p1)           # 済んでいればすぐ返る
+
+- リクエストはキュー、結果は共有メモリのセグメント名と配列のレイアウトだけを返す
+  （埋め込み本体はパイプを通さない）
+- 受け取った側がコピーして unlink する。受け取られなかったものは close() で削除
+- TEXT_ENCODER_DEVICE=cpu / cuda:1 など、TEXT_ENCODER=stub で GPU・モデルなしの動作確認
+
+    python text_encoder_service.py --demo
+"""
+
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+GEMMA_PATH = os.environ.get("GEMMA_PATH", "/workspace/models/gemma")
+TEXT_ENCODER = os.environ.get("TEXT_ENCODER", "gemma")  # gemma / stub
+TEXT_ENCODER_DEVICE = os.environ.get("TEXT_ENCODER_DEVICE", "cpu")
+MAX_TOKENS = int(os.environ.get("TEXT_ENCODER_MAX_TOKENS", "256"))
+
+# bfloat16 は numpy にないので int16 のビット列として運ぶ
+BFLOAT16 = "bfloat16"
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+# --- エンコーダ（子プロセス側） ---
+
+def load_gemma_encoder(gemma_root: str, device: str) -> Callable[[str], Dict]:
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(gemma_root)
+    model = AutoModel.from_pretrained(gemma_root, torch_dtype=torch.bfloat16).to(device).eval()
+
+    @torch.inference_mode()
+    def encode(prompt: str) -> Dict:
+        tokens = tokenizer(
+            prompt, padding="max_length", max_length=MAX_TOKENS, truncation=True, return_tensors="pt",
+        ).to(device)
+        hidden = model(**tokens).last_hidden_state
+        return {"prompt_embeds": hidden.cpu(), "prompt_attention_mask": tokens.attention_mask.cpu()}
+
+    return encode
+
+
+def load_stub_encoder(gemma_root: str, device: str, seconds: float = 0.5, dim: int = 64) -> Callable[[str], Dict]:
+    """モデルなしの動作確認用: プロンプトから決まる乱数を少し待ってから返す"""
+
+    def encode(prompt: str) -> Dict:
+        time.sleep(seconds)
+        rng = np.random.default_rng(int(prompt_key(prompt), 16))
+        return {
+            "prompt_embeds": rng.standard_normal((1, MAX_TOKENS, dim), dtype=np.float32),
+            "prompt_attention_mask": np.ones((1, MAX_TOKENS), dtype=np.int64),
+        }
+
+    return encode
+
+
+ENCODERS = {
+    "gemma": load_gemma_encoder,
+    "stub": load_stub_encoder,
+}
+
+
+def _to_numpy(value):
+    """torch.Tensor / ndarray -> (ndarray, dtype 名)"""
+    if isinstance(value, np.ndarray):
+        return value, value.dtype.str
+    import torch
+    value = value.detach().cpu().contiguous()
+    if value.dtype == torch.bfloat16:
+        return value.view(torch.int16).numpy(), BFLOAT16
+    return value.numpy(), value.numpy().dtype.str
+
+
+def _pack(arrays: Dict) -> Dict:
+    """配列をひとつの共有メモリセグメントに詰める（呼び出し側が unlink する）"""
+    converted = {name: _to_numpy(value) for name, value in arrays.items()}
+    size = sum(array.nbytes for array, _ in converted.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = {}
+    offset = 0
+    for name, (array, dtype) in converted.items():
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)
+        target[...] = array
+        layout[name] = {"shape": array.shape, "dtype": dtype, "storage": array.dtype.str, "offset": offset}
+        offset += array.nbytes
+    name = shm.name
+    shm.close()
+    return {"shm": name, "layout": layout}
+
+
+def _serve(requests: mp.Queue, results: mp.Queue, encoder: str, gemma_root: str, device: str):
+    """子プロセス: キューのプロンプトを順にエンコード（None で終了）"""
+    try:
+        encode = ENCODERS[encoder](gemma_root, device)
+    except Exception as e:
+        results.put({"error": f"Failed to load text encoder: {e}"})
+        return
+    results.put({"ready": True})
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        key, prompt = item
+        start = time.time()
+        try:
+            packed = _pack(encode(prompt))
+            results.put({"key": key, "seconds": time.time() - start, **packed})
+        except Exception as e:
+            results.put({"key": key, "error": str(e)})
+
+
+# --- クライアント（生成プロセス側） ---
+
+class TextEncoderService:
+    """別プロセスのテキストエンコーダ"""
+
+    def __init__(
+        self,
+        encoder: str = TEXT_ENCODER,
+        gemma_root: str = GEMMA_PATH,
+        device: str = TEXT_ENCODER_DEVICE,
+        load_timeout: float = 600,
+    ):
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown text encoder '{encoder}'. Available: {list(ENCODERS)}")
+        self.encoder = encoder
+        self.gemma_root = gemma_root
+        self.device = device
+        self.load_timeout = load_timeout
+        self._ctx = mp.get_context("spawn")  # 親の CUDA 状態を引き継がない
+        self._requests = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._process = None
+        self._reader = None
+        self._pending = set()       # エンコード待ちのキー
+        self._ready: Dict[str, Dict] = {}  # キー -> 共有メモリの情報
+        self._cond = threading.Condition()
+        self.encoded = 0
+        self.encode_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.waits = 0  # get() の時点で済んでいなかった回数
+
+    def start(self) -> "TextEncoderService":
+        self._process = self._ctx.Process(
+            target=_serve,
+            args=(self._requests, self._results, self.encoder, self.gemma_root, self.device),
+            name="text-encoder",
+            daemon=True,
+        )
+        self._process.start()
+        message = self._results.get(timeout=self.load_timeout)
+        if "error" in message:
+            self._process.join()
+            raise RuntimeError(message["error"])
+        self._reader = threading.Thread(target=self._read_results, name="text-encoder-results", daemon=True)
+        self._reader.start()
+        print(f"[TEXT_ENCODER] {self.encoder} ready on {self.device}", flush=True)
+        return self
+
+    def _read_results(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            with self._cond:
+                self._pending.discard(message["key"])
+                self._ready[message["key"]] = message
+                if "error" not in message:
+                    self.encoded += 1
+                    self.encode_seconds += message["seconds"]
+                self._cond.notify_all()
+
+    def prefetch(self, prompts: Iterable[str]):
+        """これから使うプロンプトをエンコード待ちに入れる（投入済みなら何もしない）"""
+        with self._cond:
+            for prompt in prompts:
+                key = prompt_key(prompt)
+                if key in self._pending or key in self._ready:
+                    continue
+                self._pending.add(key)
+                self._requests.put((key, prompt))
+
+    def get(self, prompt: str, timeout: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        プロンプトの埋め込み（未投入なら投入して待つ）
+
+        Returns:
+            {"prompt_embeds": ndarray, "prompt_attention_mask": ndarray}
+            bfloat16 は int16 のビット列のまま（to_torch() で戻す）
+        """
+        self.prefetch([prompt])
+        key = prompt_key(prompt)
+        start = time.time()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            if key not in self._ready:
+                self.waits += 1
+            while key not in self._ready:
+                if not self._process.is_alive():
+                    raise RuntimeError("Text encoder process exited")
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Text encoding did not finish within {timeout}s")
+                self._cond.wait(min(remaining, 1.0) if remaining is not None else 1.0)
+            message = self._ready.pop(key)
+            self.wait_seconds += time.time() - start
+        if "error" in message:
+            raise RuntimeError(f"Text encoding failed: {message['error']}")
+        return self._unpack(message)
+
+    @staticmethod
+    def _unpack(message: Dict) -> Dict[str, np.ndarray]:
+        shm = shared_memory.SharedMemory(name=message["shm"])
+        try:
+            arrays = {}
+            for name, spec in message["layout"].items():
+                view = np.ndarray(spec["shape"], dtype=np.dtype(spec["storage"]), buffer=shm.buf, offset=spec["offset"])
+                arrays[name] = view.copy()
+                if spec["dtype"] == BFLOAT16:
+                    arrays[name] = _BFloat16(arrays[name])
+            return arrays
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def stats(self) -> Dict:
+        return {
+            "encoder": self.encoder,
+            "device": self.device,
+            "encoded": self.encoded,
+            "encode_seconds": round(self.encode_seconds, 2),
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 2),
+        }
+
+    def close(self):
+        if self._process is None:
+            return
+        self._requests.put(None)
+        self._process.join(timeout=30)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._results.put(None)
+        self._reader.join(timeout=5)
+        # 受け取られなかった埋め込みを削除
+        with self._cond:
+            for message in self._ready.values():
+                if "shm" in message:
+                    try:
+                        shm = shared_memory.SharedMemory(name=message["shm"])
+                        shm.close()
+                        shm.unlink()
+                    except FileNotFoundError:
+                        pass
+            self._ready.clear()
+        self._process = None
+
+    def __enter__(self) -> "TextEncoderService":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _BFloat16:
+    """bfloat16 のビット列（int16 の ndarray）。to_torch() で bfloat16 テンソルに戻す"""
+
+    def __init__(self, bits: np.ndarray):
+        self.bits = bits
+        self.shape = bits.shape
+
+
+def to_torch(arrays: Dict, device: str = "cuda") -> Dict:
+    """get() の結果をパイプラインに渡すテンソルへ"""
+    import torch
+
+    tensors = {}
+    for name, value in arrays.items():
+        if isinstance(value, _BFloat16):
+            tensors[name] = torch.from_numpy(value.bits).view(torch.bfloat16).to(device)
+        else:
+            tensors[name] = torch.from_numpy(value).to(device)
+    return tensors
+
+
+def demo(jobs: int = 5, encode_seconds: float = 0.5, denoise_seconds: float = 1.0):
+    """スタブで、デノイズ中に次のプロンプトがエンコードされることを確認"""
+    prompts = [f"demo prompt {i}" for i in range(jobs)]
+    start = time.time()
+    with TextEncoderService(encoder="stub") as encoder:
+        encoder.prefetch(prompts)
+        for i, prompt in enumerate(prompts):
+            waited = time.time()
+            embeds = encoder.get(prompt)
+            waited = time.time() - waited
+            print(f"job {i}: waited {waited:.2f}s for {embeds['prompt_embeds'].shape} embeds")
+            time.sleep(denoise_seconds)  # デノイズの代わり
+        stats = encoder.stats()
+    total = time.time() - start
+    serial = jobs * (encode_seconds + denoise_seconds)
+    print(f"total {total:.1f}s (serial would be ~{serial:.1f}s plus load), {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text encoder service")
+    parser.add_argument("--demo", action="store_true", help="Run the stub-encoder pipelining demo (CPU only)")
+    parser.add_argument("--prompt", action="append", help="Encode prompts with the configured encoder")
+    args = parser.parse_args()
+
+    if args.demo:
+        demo()
+    elif args.prompt:
+        with TextEncoderService() as encoder:
+            encoder.prefetch(args.prompt)
+            for prompt in args.prompt:
+                embeds = encoder.get(prompt)
+                print(prompt[:50], {name: value.shape for name, value in embeds.items()})
+            print(encoder.stats())
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
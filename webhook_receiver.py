@@ -0,0 +1,105 @@
+"""
+LTX-2 Webhook Receiver
+ジョブ完了通知を受けて async_client の Job ハンドルを即座に解決する
+
+- Runpod Serverless: /run の "webhook" に callback_url を渡すと、完了時に
+  /status と同じ形式 ({"id", "status", "output", ...}) が POST される
+- Pods (server.py): /generate の "callback_url" に JobStatus が POST される
+
+Webhook はリトライされない前提なので、クライアント側のポーリングは
+fallback_poll 間隔の取りこぼし確認として残している。
+
+外部から届くURLが必要（Serverless の場合）。ポート開放やトンネルの
+公開URLを public_url に渡す。token はクエリ文字列で照合する。
+"""
+
+import secrets
+from typing import List, Optional
+
+from aiohttp import web
+
+from async_client import AsyncLTXClient, run_sync
+
+DEFAULT_PATH = "/webhook"
+
+
+class WebhookReceiver:
+    """ジョブ完了 Webhook を受ける小さな HTTP サーバー"""
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8787,
+        public_url: Optional[str] = None,
+        token: Optional[str] = None,
+        path: str = DEFAULT_PATH,
+    ):
+        self.host = host
+        self.port = port
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.token = token or secrets.token_urlsafe(16)
+        self.path = path
+        self.clients: List[AsyncLTXClient] = []
+        self.received = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def callback_url(self) -> str:
+        """ジョブ投入時に渡す通知先URL"""
+        base = self.public_url or f"http://{'127.0.0.1' if self.host == '0.0.0.0' else self.host}:{self.port}"
+        return f"{base}{self.path}?token={self.token}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Webhook receiver listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.query.get("token", ""), self.token):
+            return web.json_response({"error": "invalid token"}, status=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.json_response({"error": "invalid json"}, status=400)
+
+        job_id = data.get("id") or data.get("job_id")
+        if not job_id:
+            return web.json_response({"error": "missing job id"}, status=400)
+
+        self.received += 1
+        matched = [client.deliver(str(job_id), data) for client in self.clients]
+        return web.json_response({"ok": True, "matched": any(matched)})
+
+
+_receivers = {}
+
+
+def enable_webhooks(
+    client: AsyncLTXClient,
+    port: int = 8787,
+    public_url: Optional[str] = None,
+    token: Optional[str] = None,
+    host: str = "0.0.0.0",
+) -> WebhookReceiver:
+    """
+    同期スクリプト用: 共有ループ上で受信器を起動してクライアントに接続
+
+    同じポートの受信器は使い回す。
+    """
+    receiver = _receivers.get(port)
+    if receiver is None:
+        receiver = WebhookReceiver(host=host, port=port, public_url=public_url, token=token)
+        run_sync(receiver.start())
+        _receivers[port] = receiver
+    if client not in receiver.clients:
+        client.attach_receiver(receiver)
+    return receiver